@@ -1,6 +1,5 @@
 import azure.functions as func
 import logging
-import json
 import os
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
@@ -8,6 +7,9 @@ import pandas as pd
 from azure.data.tables import TableServiceClient
 from dotenv import load_dotenv
 import io
+# Cópias de table_queries.py e payload_codec.py da raiz: esta pasta é publicada sozinha (azureFunctions.deploySubpath)
+from table_queries import query_period
+from payload_codec import PAYLOAD_PROPERTIES, decode_payload
 
 # Carregar variáveis do arquivo .env
 load_dotenv()
@@ -87,10 +89,26 @@ def gerar_relatorio_matricula(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     # Obter o intervalo de datas
-    date_range = get_date_range(start_date, end_date)
+    try:
+        date_range = get_date_range(str(start_date), str(end_date))
+    except ValueError:
+        return func.HttpResponse(
+             "Datas inválidas. Use start_date e end_date no formato DD/MM/AAAA.",
+             status_code=400
+        )
 
-    # Consultar registros no Azure Table
-    results = query_table(connection_string, table_name, matricula, date_range)
+    # Consultar registros no Azure Table (falhas da tabela viram 503, não "nenhum registro")
+    try:
+        results = query_table(connection_string, table_name, matricula, date_range)
+    except Exception:
+        return func.HttpResponse(
+            "Erro ao consultar a tabela. Tente novamente em instantes.",
+            status_code=503,
+            headers={
+                'Retry-After': '5',
+                'Access-Control-Allow-Origin': '*',
+            }
+        )
 
     if not results:
         return func.HttpResponse(
@@ -109,8 +127,8 @@ def gerar_relatorio_matricula(req: func.HttpRequest) -> func.HttpResponse:
     
     # Processar cada registro
     for record in results:
-        dict_record = dict(record)
-        record_data = json.loads(dict_record["dados_json"])
+        # Registro no formato antigo (dados_json) ou compacto (zlib, em partes)
+        record_data = decode_payload(record)
         if resumo["nome"] == "":
             resumo["nome"] = record_data["matricula"]["nome"]
         if resumo["data_admissao"] == "":
@@ -196,25 +214,23 @@ def get_date_range(start_date_str, end_date_str):
     date_list = []
 
     while current_date <= end_date:
-        month_year = current_date.strftime("%m_%Y")
+        month_year = current_date.strftime("%Y_%m")
         date_list.append(month_year)
         current_date += relativedelta(months=1)
 
     return date_list
 
 def query_table(connection_string, table_name, matricula, row_keys):
-    results = []
+    if not row_keys:
+        return []
 
     # Connect to the table service
     table_service = TableServiceClient.from_connection_string(connection_string)
     table_client = table_service.get_table_client(table_name)
 
-    for row_key in row_keys:
-        try:
-            # Query with PartitionKey and RowKey
-            entity = table_client.get_entity(partition_key=matricula, row_key=row_key)
-            results.append(entity)
-        except Exception as e:
-            logging.error(f"Error fetching record for matricula {matricula}, date {row_key}: {e}")
-
-    return results
\ No newline at end of file
+    # A single range query over the chronologically sortable RowKeys (YYYY_MM)
+    try:
+        return query_period(table_client, matricula, row_keys[0], row_keys[-1], select=["RowKey"] + PAYLOAD_PROPERTIES)
+    except Exception as e:
+        logging.error(f"Error fetching records for matricula {matricula}, period {row_keys[0]} to {row_keys[-1]}: {e}")
+        raise
\ No newline at end of file
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import zlib
+
+# Versão da codificação compacta do registro (entidades sem dados_versao usam o dados_json antigo)
+PAYLOAD_VERSION = 2
+
+# Codificações aceitas na ingestão: "json" (dados_json sem compressão) e "zlib" (compacta).
+# O padrão continua "json" até que todas as Functions publicadas leiam o formato compacto
+ENCODINGS = ("json", "zlib")
+DEFAULT_ENCODING = "json"
+
+# Tamanho máximo de cada parte (uma propriedade binária do Azure Table aceita até 64 KiB)
+CHUNK_BYTES = 64000
+
+# Com no máximo 1 MiB por entidade, 15 partes bastam para qualquer registro que caiba nela
+MAX_CHUNKS = 15
+
+# Propriedade com o hash do conteúdo do registro (para gravar apenas registros alterados)
+HASH_PROPERTY = "hash_conteudo"
+
+# Propriedades com o registro, nas duas codificações (para consultas com select)
+PAYLOAD_PROPERTIES = ["dados_json", "dados_versao", "dados_codec", "dados_partes"] + [
+    f"dados_{index}" for index in range(MAX_CHUNKS)
+]
+
+
+def encode_payload(registro, encoding=DEFAULT_ENCODING, level=6):
+    """
+    Codifica um registro nas propriedades da entidade.
+
+    Com encoding="json", gera o dados_json de antes (json.dumps sem compactar). Com
+    encoding="zlib", serializa com separadores compactos, comprime com zlib e divide o
+    resultado em partes binárias (dados_0, dados_1, ...) de até CHUNK_BYTES, com a
+    versão (dados_versao), o codec (dados_codec) e a quantidade de partes (dados_partes).
+
+    Parâmetros:
+        registro (dict): Registro de um servidor
+        encoding (str): "json" ou "zlib"
+        level (int): Nível de compressão do zlib
+
+    Retorna:
+        dict: Propriedades a acrescentar à entidade
+    """
+    if encoding == "json":
+        return {"dados_json": json.dumps(registro)}
+    if encoding != "zlib":
+        raise ValueError(f"Codificação não suportada: {encoding}")
+
+    compact = json.dumps(registro, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    compressed = zlib.compress(compact, level)
+    chunks = [compressed[start:start + CHUNK_BYTES] for start in range(0, len(compressed), CHUNK_BYTES)] or [b""]
+    if len(chunks) > MAX_CHUNKS:
+        raise ValueError(f"Registro grande demais para uma entidade ({len(compressed)} bytes comprimidos)")
+
+    properties = {
+        "dados_versao": PAYLOAD_VERSION,
+        "dados_codec": "zlib",
+        "dados_partes": len(chunks),
+    }
+    for index, chunk in enumerate(chunks):
+        properties[f"dados_{index}"] = chunk
+    return properties
+
+
+def decode_payload(entity):
+    """Decodifica o registro de uma entidade, tanto no formato antigo (dados_json) quanto no compacto."""
+    if entity.get("dados_versao") is None:
+        return json.loads(entity["dados_json"])
+    if entity.get("dados_codec") != "zlib":
+        raise ValueError(f"Codec de dados desconhecido: {entity.get('dados_codec')}")
+    compressed = b"".join(bytes(entity[f"dados_{index}"]) for index in range(entity["dados_partes"]))
+    return json.loads(zlib.decompress(compressed))
+
+
+def payload_size(entity):
+    """Tamanho aproximado, em bytes, do registro armazenado em uma entidade (para limitar transações)."""
+    if entity.get("dados_versao") is None:
+        return len(entity.get("dados_json", ""))
+    return sum(len(entity[f"dados_{index}"]) for index in range(entity["dados_partes"]))
+
+
+def content_hash(registro):
+    """
+    Hash SHA-256 do conteúdo de um registro, independente da codificação e da ordem das chaves.
+
+    Parâmetros:
+        registro (dict): Registro de um servidor
+
+    Retorna:
+        str: Hash em hexadecimal
+    """
+    canonical = json.dumps(registro, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
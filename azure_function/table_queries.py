@@ -0,0 +1,126 @@
+import logging
+import re
+
+# RowKeys no formato antigo (mm_aaaa), que não podem ser varridos em ordem cronológica
+ROW_KEY_ANTIGA = re.compile(r"^(\d{2})_(\d{4})$")
+
+# Quantidade de entidades por página nas consultas por intervalo
+RESULTS_PER_PAGE = 1000
+
+
+def row_key(referencia):
+    """Converte uma referência "mm/aaaa" (ou "mm_aaaa") na RowKey ordenável "aaaa_mm"."""
+    mes, ano = referencia.replace("/", "_").split("_")
+    return f"{ano}_{mes}"
+
+
+def query_period(table_client, matricula, row_key_start, row_key_end, select=None, results_per_page=RESULTS_PER_PAGE):
+    """
+    Lê todas as entidades de uma matrícula entre duas RowKeys (inclusive) em uma única
+    consulta por intervalo, seguindo os continuation tokens página a página.
+
+    Parâmetros:
+        table_client (TableClient): Cliente da tabela
+        matricula (str): Número da matrícula (PartitionKey)
+        row_key_start (str): RowKey inicial no formato "aaaa_mm"
+        row_key_end (str): RowKey final no formato "aaaa_mm"
+        select (list): Propriedades a serem retornadas (padrão: todas)
+        results_per_page (int): Tamanho das páginas da consulta
+
+    Retorna:
+        list: Entidades em ordem cronológica
+    """
+    pages = table_client.query_entities(
+        "PartitionKey eq @pk and RowKey ge @inicio and RowKey le @fim",
+        parameters={"pk": matricula, "inicio": row_key_start, "fim": row_key_end},
+        select=select,
+        results_per_page=results_per_page,
+    ).by_page()
+
+    results = []
+    for page_number, page in enumerate(pages, start=1):
+        entities = list(page)
+        results.extend(entities)
+        logging.debug(
+            f"Página {page_number} da matrícula {matricula}: {len(entities)} entidades "
+            f"(continuation token: {pages.continuation_token})"
+        )
+    return results
+
+
+def split_period(row_keys, months_per_query):
+    """
+    Divide RowKeys em ordem cronológica em grupos de até months_per_query meses, para
+    consultar os intervalos de um período longo em paralelo.
+
+    Parâmetros:
+        row_keys (list): RowKeys no formato "aaaa_mm", em ordem
+        months_per_query (int): Quantidade máxima de meses por consulta
+
+    Retorna:
+        list: Listas de RowKeys consecutivas (a primeira e a última delimitam cada intervalo)
+    """
+    size = max(1, months_per_query)
+    return [row_keys[start:start + size] for start in range(0, len(row_keys), size)]
+
+
+async def query_period_async(table_client, matricula, row_key_start, row_key_end, select=None, results_per_page=RESULTS_PER_PAGE):
+    """
+    Versão assíncrona de query_period, para o TableClient de azure.data.tables.aio.
+
+    Parâmetros:
+        table_client (azure.data.tables.aio.TableClient): Cliente assíncrono da tabela
+        matricula (str): Número da matrícula (PartitionKey)
+        row_key_start (str): RowKey inicial no formato "aaaa_mm"
+        row_key_end (str): RowKey final no formato "aaaa_mm"
+        select (list): Propriedades a serem retornadas (padrão: todas)
+        results_per_page (int): Tamanho das páginas da consulta
+
+    Retorna:
+        list: Entidades em ordem cronológica
+    """
+    pages = table_client.query_entities(
+        "PartitionKey eq @pk and RowKey ge @inicio and RowKey le @fim",
+        parameters={"pk": matricula, "inicio": row_key_start, "fim": row_key_end},
+        select=select,
+        results_per_page=results_per_page,
+    ).by_page()
+
+    results = []
+    page_number = 0
+    async for page in pages:
+        page_number += 1
+        entities = [entity async for entity in page]
+        results.extend(entities)
+        logging.debug(
+            f"Página {page_number} da matrícula {matricula}: {len(entities)} entidades "
+            f"(continuation token: {pages.continuation_token})"
+        )
+    return results
+
+
+def contiguous_runs(row_keys, selected):
+    """
+    Agrupa as RowKeys selecionadas em sequências sem nenhuma RowKey não selecionada entre
+    elas, para que cada sequência seja lida com uma consulta por intervalo sem baixar de
+    novo os meses que não foram selecionados (por exemplo, os que já estão em cache).
+
+    Parâmetros:
+        row_keys (list): Todas as RowKeys do período, em ordem
+        selected (iterable): RowKeys a serem lidas
+
+    Retorna:
+        list: Listas de RowKeys selecionadas, consecutivas em row_keys
+    """
+    selected = set(selected)
+    runs = []
+    run = []
+    for key in row_keys:
+        if key in selected:
+            run.append(key)
+        elif run:
+            runs.append(run)
+            run = []
+    if run:
+        runs.append(run)
+    return runs
@@ -0,0 +1,191 @@
+import io
+import json
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from report_formats import report_chunks
+
+# Limites padrão do modo em lote
+MAX_WORKERS = 8
+MAX_MATRICULAS = 500
+
+# Arquivo, dentro do ZIP, com a situação de cada matrícula do lote
+BATCH_SUMMARY_NAME = "resumo_lote.json"
+
+
+def parse_matriculas(value):
+    """
+    Normaliza a lista de matrículas de um lote, recebida como lista ou como texto separado
+    por vírgulas, espaços ou quebras de linha. Remove vazios e repetições, mantendo a ordem.
+    """
+    if isinstance(value, str):
+        value = re.split(r"[\s,;]+", value)
+    matriculas = []
+    for matricula in value or []:
+        matricula = str(matricula).strip()
+        if matricula and matricula not in matriculas:
+            matriculas.append(matricula)
+    return matriculas
+
+
+def read_matriculas_file(path):
+    """Lê as matrículas de um arquivo de texto (uma por linha ou separadas por vírgulas)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_matriculas(f.read())
+
+
+def batch_file_name(matricula, start_date, end_date, output_format):
+    """Nome do relatório de uma matrícula (o mesmo usado pela API para um único relatório)."""
+    return f"registros_matricula_{matricula}_{start_date.replace('/', '-')}_a_{end_date.replace('/', '-')}.{output_format}"
+
+
+def report_for_frame(frame, resumo, output_format):
+    """Gera o relatório de uma matrícula, em memória, no formato pedido."""
+    if output_format == "xlsx":
+        from report_writer import report_bytes
+
+        return report_bytes(frame, resumo)
+    return b"".join(report_chunks(output_format, frame.rows(), resumo, frame.summary()))
+
+
+def _resumo(matricula, frame, start_date, end_date):
+    return {
+        "matricula": matricula,
+        "data_inicio": start_date,
+        "data_fim": end_date,
+        "nome": frame.nome,
+        "data_admissao": frame.data_admissao,
+    }
+
+
+def _run_bounded(matriculas, build, max_workers):
+    """
+    Executa build(matricula) com no máximo max_workers matrículas em andamento e entrega
+    (matricula, resultado, erro) na ordem de conclusão, sem acumular os resultados.
+    """
+    pending = iter(matriculas)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        for matricula in pending:
+            running[executor.submit(build, matricula)] = matricula
+            if len(running) >= max_workers:
+                break
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                matricula = running.pop(future)
+                try:
+                    yield matricula, future.result(), None
+                except Exception as e:
+                    yield matricula, None, e
+                for next_matricula in pending:
+                    running[executor.submit(build, next_matricula)] = next_matricula
+                    break
+
+
+def _run_batch(matriculas, build, max_workers, on_progress):
+    """Percorre o lote registrando a situação de cada matrícula e chamando on_progress."""
+    results = []
+    for matricula, payload, error in _run_bounded(matriculas, build, max_workers):
+        if error is not None:
+            result = {"matricula": matricula, "situacao": "erro", "linhas": 0, "erro": str(error)}
+        elif payload is None:
+            result = {"matricula": matricula, "situacao": "sem_registros", "linhas": 0, "erro": None}
+        else:
+            result = {"matricula": matricula, "situacao": "ok", "linhas": payload[0], "erro": None}
+        results.append(result)
+        if on_progress is not None:
+            on_progress(result, len(results), len(matriculas))
+        yield result, payload
+
+
+def write_zip(output, matriculas, load_frame, start_date, end_date, output_format="xlsx",
+              max_workers=MAX_WORKERS, on_progress=None):
+    """
+    Gera um ZIP com um relatório por matrícula e o arquivo resumo_lote.json com a situação
+    de cada uma. Os relatórios são gerados em paralelo (no máximo max_workers por vez) e
+    gravados no ZIP à medida que ficam prontos.
+
+    Parâmetros:
+        output (str | file): Caminho ou arquivo binário de saída
+        matriculas (list): Matrículas do lote
+        load_frame (callable): Função matricula -> PayrollFrame (ou None sem registros)
+        start_date (str): Data inicial (DD/MM/AAAA)
+        end_date (str): Data final (DD/MM/AAAA)
+        output_format (str): Formato de cada relatório (xlsx, csv, ndjson ou parquet)
+        max_workers (int): Máximo de matrículas processadas ao mesmo tempo
+        on_progress (callable): Chamada com (resultado, concluídas, total) a cada matrícula
+
+    Retorna:
+        list: Situação de cada matrícula (matricula, situacao, linhas, erro)
+    """
+    def build(matricula):
+        frame = load_frame(matricula)
+        if frame is None or not len(frame):
+            return None
+        return len(frame), report_for_frame(frame, _resumo(matricula, frame, start_date, end_date), output_format)
+
+    results = []
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for result, payload in _run_batch(matriculas, build, max_workers, on_progress):
+            results.append(result)
+            if payload is not None:
+                archive.writestr(batch_file_name(result["matricula"], start_date, end_date, output_format), payload[1])
+        archive.writestr(BATCH_SUMMARY_NAME, json.dumps(
+            {"data_inicio": start_date, "data_fim": end_date, "matriculas": results}, ensure_ascii=False, indent=2
+        ))
+    return results
+
+
+def write_combined(output, matriculas, load_frame, start_date, end_date, max_workers=MAX_WORKERS, on_progress=None):
+    """
+    Gera um único arquivo Parquet com as linhas de todas as matrículas do lote (colunas
+    matricula, nome e dataAdmissao seguidas das colunas do PayrollFrame), um row group por
+    matrícula. A situação de cada matrícula vai nos metadados do arquivo (chave "lote").
+
+    Parâmetros e retorno iguais aos de write_zip, sem output_format.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from payroll_frame import FRAME_SCHEMA
+
+    schema = pa.schema([("matricula", pa.string()), ("nome", pa.string()), ("dataAdmissao", pa.string())] + list(FRAME_SCHEMA))
+
+    def build(matricula):
+        frame = load_frame(matricula)
+        if frame is None or not len(frame):
+            return None
+        count = len(frame)
+        table = frame.table
+        for position, (name, value) in enumerate(
+            [("matricula", matricula), ("nome", frame.nome), ("dataAdmissao", frame.data_admissao)]
+        ):
+            table = table.add_column(position, name, pa.array([value] * count, type=pa.string()))
+        return count, table
+
+    results = []
+    writer = pq.ParquetWriter(output, schema, compression="zstd")
+    try:
+        for result, payload in _run_batch(matriculas, build, max_workers, on_progress):
+            results.append(result)
+            if payload is not None:
+                writer.write_table(payload[1])
+        writer.add_key_value_metadata({"lote": json.dumps(
+            {"data_inicio": start_date, "data_fim": end_date, "matriculas": results}, ensure_ascii=False
+        )})
+    finally:
+        writer.close()
+    return results
+
+
+def batch_bytes(matriculas, load_frame, start_date, end_date, output_format="xlsx", combined=False,
+                max_workers=MAX_WORKERS, on_progress=None):
+    """Gera o lote em memória (ZIP ou Parquet combinado) e retorna (conteúdo, situações)."""
+    output = io.BytesIO()
+    if combined:
+        results = write_combined(output, matriculas, load_frame, start_date, end_date, max_workers, on_progress)
+    else:
+        results = write_zip(output, matriculas, load_frame, start_date, end_date, output_format, max_workers, on_progress)
+    return output.getvalue(), results
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Módulos pesados que não podem ser carregados no import nem nos caminhos OPTIONS/400
+MODULOS_PESADOS = ["pandas", "dateutil", "azure.data.tables", "openpyxl"]
+
+# Executado em um processo novo a cada rodada, para medir um cold start de verdade
+SCRIPT_MEDICAO = """
+import json, sys, time
+inicio = time.perf_counter()
+import function_app
+import azure.functions as func
+importacao = time.perf_counter() - inicio
+carregados_import = [m for m in {pesados!r} if m in sys.modules]
+
+inicio = time.perf_counter()
+function_app.main(func.HttpRequest("OPTIONS", "/api/function_app", body=b""))
+options = time.perf_counter() - inicio
+
+inicio = time.perf_counter()
+function_app.main(func.HttpRequest("GET", "/api/function_app", body=b"", params={{"matricula": "1"}}))
+erro_400 = time.perf_counter() - inicio
+carregados_requisicoes = [m for m in {pesados!r} if m in sys.modules]
+
+inicio = time.perf_counter()
+for modulo in {pesados!r}:
+    __import__(modulo)
+adiados = time.perf_counter() - inicio
+
+print(json.dumps({{
+    "importacao_ms": importacao * 1000,
+    "options_ms": options * 1000,
+    "erro_400_ms": erro_400 * 1000,
+    "modulos_adiados_ms": adiados * 1000,
+    "pesados_no_import": carregados_import,
+    "pesados_nas_requisicoes": carregados_requisicoes,
+}}))
+"""
+
+
+def medir_uma_vez():
+    saida = subprocess.run(
+        [sys.executable, "-c", SCRIPT_MEDICAO.format(pesados=MODULOS_PESADOS)],
+        cwd=RAIZ,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mede o cold start do function_app em processos novos")
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--saida", help="Arquivo JSON para gravar o relatório")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rodadas = [medir_uma_vez() for _ in range(args.rodadas)]
+
+    relatorio = {
+        chave: statistics.median(rodada[chave] for rodada in rodadas)
+        for chave in ("importacao_ms", "options_ms", "erro_400_ms", "modulos_adiados_ms")
+    }
+    relatorio["pesados_no_import"] = sorted({m for rodada in rodadas for m in rodada["pesados_no_import"]})
+    relatorio["pesados_nas_requisicoes"] = sorted({m for rodada in rodadas for m in rodada["pesados_nas_requisicoes"]})
+
+    print(f"Mediana de {args.rodadas} rodadas em processos novos:")
+    print(f"  import do function_app:        {relatorio['importacao_ms']:8.1f} ms")
+    print(f"  primeira requisição OPTIONS:   {relatorio['options_ms']:8.1f} ms")
+    print(f"  primeira resposta 400:         {relatorio['erro_400_ms']:8.1f} ms")
+    print(f"  custo adiado (pandas etc.):    {relatorio['modulos_adiados_ms']:8.1f} ms")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2)
+
+    # Regressão: algum módulo pesado voltou a ser carregado cedo demais
+    if relatorio["pesados_no_import"] or relatorio["pesados_nas_requisicoes"]:
+        print(f"ERRO: módulos pesados carregados antes do necessário: {relatorio['pesados_no_import'] + relatorio['pesados_nas_requisicoes']}")
+        sys.exit(1)
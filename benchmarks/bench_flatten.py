@@ -0,0 +1,80 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+from bench_report_xlsx import montar_folha, montar_registros
+
+
+def achatar_lacos(registros):
+    """Caminho anterior: dicionário evento -> linhas e um pd.DataFrame(...).sum() por evento."""
+    import pandas as pd
+
+    folha_de_pagamento = montar_folha(registros)
+    return [
+        (evento, len(linhas), pd.DataFrame(linhas)["valor"].sum())
+        for evento, linhas in folha_de_pagamento.items()
+    ]
+
+
+def achatar_frame(registros):
+    """Caminho novo: um único frame colunar e uma única agregação por evento."""
+    from payroll_frame import PayrollFrame
+
+    return PayrollFrame.from_records(registros).summary()
+
+
+CAMINHOS = {"lacos_pandas": achatar_lacos, "frame": achatar_frame}
+
+
+def medir(funcao, registros, repeticoes):
+    """Retorna o menor tempo de repeticoes execuções e o último resultado."""
+    melhor = math.inf
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(registros)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compara o achatamento da folha e o resumo por evento: laços + pandas vs PayrollFrame"
+    )
+    parser.add_argument("--meses", type=int, default=360, help="Meses da matrícula (padrão: 30 anos)")
+    parser.add_argument("--folhas", type=int, default=3)
+    parser.add_argument("--eventos", type=int, default=10)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--saida", help="Arquivo JSON para gravar os resultados")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    registros, _ = montar_registros(args.meses, args.folhas, args.eventos)
+    linhas = args.meses * args.folhas * args.eventos
+
+    # Importa as dependências antes de medir, para não contar o custo de import
+    import pandas  # noqa: F401
+    import payroll_frame  # noqa: F401
+
+    resultados = []
+    resumos = {}
+    for caminho, funcao in CAMINHOS.items():
+        segundos, resumos[caminho] = medir(funcao, registros, args.repeticoes)
+        resultados.append({"caminho": caminho, "linhas": linhas, "segundos": segundos})
+        print(f"{caminho:>13}: {linhas} linhas em {segundos * 1000:.1f} ms")
+
+    # Os dois caminhos devem produzir o mesmo resumo (a menos de arredondamento da soma)
+    for (evento_a, total_a, valor_a), (evento_b, total_b, valor_b) in zip(resumos["lacos_pandas"], resumos["frame"]):
+        if evento_a != evento_b or total_a != total_b or not math.isclose(valor_a, valor_b, rel_tol=1e-9, abs_tol=1e-6):
+            raise SystemExit(f"Resumos divergentes: {evento_a} {total_a} {valor_a} != {evento_b} {total_b} {valor_b}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_files import LeitorRegistros, abrir_arquivo_dados
+from dados_sinteticos import gerar_resposta, gravar_resposta
+
+
+def ingerir_json_load(arquivo_json):
+    """Caminho antigo: json.load do arquivo inteiro e depois serialização de cada registro."""
+    with abrir_arquivo_dados(arquivo_json) as f:
+        dados = json.load(f)
+    return sum(len(json.dumps(item["registro"])) for item in dados["registros"])
+
+
+def ingerir_incremental(arquivo_json):
+    """Caminho incremental: um registro decodificado por vez."""
+    with LeitorRegistros(arquivo_json) as leitor:
+        return sum(len(json.dumps(item["registro"])) for item in leitor)
+
+
+def medir(funcao, arquivo_json):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcao(arquivo_json)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, segundos, pico
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compara a memória de pico de json.load e do LeitorRegistros")
+    parser.add_argument("--servidores", type=int, default=20000)
+    parser.add_argument("--folhas", type=int, default=2)
+    parser.add_argument("--eventos", type=int, default=10)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as pasta:
+        dados = gerar_resposta("01/2020", args.servidores, args.folhas, args.eventos)
+        arquivo_json = gravar_resposta(dados, "01/2020", 0, pasta)
+        del dados
+        print(f"Arquivo sintético: {os.path.getsize(arquivo_json) / 2**20:.1f} MiB ({args.servidores} registros)")
+
+        for nome, funcao in (("json.load", ingerir_json_load), ("incremental", ingerir_incremental)):
+            resultado, segundos, pico = medir(funcao, arquivo_json)
+            print(f"{nome:>12}: {segundos:6.2f}s, pico de memória {pico / 2**20:8.1f} MiB ({resultado} bytes serializados)")
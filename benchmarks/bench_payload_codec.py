@@ -0,0 +1,116 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+from dados_sinteticos import gerar_registro
+from payload_codec import decode_payload, encode_payload, payload_size
+
+
+def montar_registros(quantidade, folhas, eventos):
+    """Registros sintéticos de um mês, com folhas e eventos suficientes para simular servidores antigos."""
+    rng = random.Random(0)
+    return [gerar_registro(rng, 100000 + i, "01/2024", folhas, eventos) for i in range(quantidade)]
+
+
+def medir_codificacao(registros, codificacao, repeticoes):
+    """Tamanho armazenado e tempos de codificação e decodificação (menor de repeticoes execuções)."""
+    entidades = [encode_payload(registro, codificacao) for registro in registros]
+    melhor_codificar = math.inf
+    melhor_decodificar = math.inf
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for registro in registros:
+            encode_payload(registro, codificacao)
+        melhor_codificar = min(melhor_codificar, time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        for entidade in entidades:
+            decode_payload(entidade)
+        melhor_decodificar = min(melhor_decodificar, time.perf_counter() - inicio)
+    tamanhos = [payload_size(entidade) for entidade in entidades]
+    return {
+        "codificacao": codificacao,
+        "registros": len(registros),
+        "bytes_total": sum(tamanhos),
+        "bytes_medio": sum(tamanhos) / len(tamanhos),
+        "bytes_maximo": max(tamanhos),
+        "partes_maximo": max(entidade.get("dados_partes", 1) for entidade in entidades),
+        "codificar_ms": melhor_codificar * 1000,
+        "decodificar_ms": melhor_decodificar * 1000,
+    }
+
+
+def medir_leitura(connection_string, registros, codificacao, repeticoes):
+    """
+    Grava os registros em uma tabela temporária (uma partição) e mede o tempo de ler e
+    decodificar a partição inteira, como faz a consulta de uma matrícula.
+    """
+    from azure.data.tables import TableServiceClient
+
+    service = TableServiceClient.from_connection_string(connection_string)
+    nome_tabela = "benchcodec" + uuid.uuid4().hex[:12]
+    tabela = service.create_table(nome_tabela)
+    try:
+        for inicio in range(0, len(registros), 100):
+            tabela.submit_transaction([
+                ("upsert", dict(PartitionKey="bench", RowKey=f"{inicio + i:06d}", **encode_payload(registro, codificacao)))
+                for i, registro in enumerate(registros[inicio:inicio + 100])
+            ])
+        melhor = math.inf
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            for entidade in tabela.query_entities("PartitionKey eq 'bench'"):
+                decode_payload(entidade)
+            melhor = min(melhor, time.perf_counter() - inicio)
+        return melhor * 1000
+    finally:
+        service.delete_table(nome_tabela)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compara tamanho e latência de leitura do registro: dados_json antigo vs codificação compacta (zlib)"
+    )
+    parser.add_argument("--registros", type=int, default=200)
+    parser.add_argument("--folhas", type=int, default=12, help="Itens em listFolha por registro")
+    parser.add_argument("--eventos", type=int, default=10, help="Eventos por folha (no máximo 10 distintos)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument(
+        "--connection_string",
+        help="Connection string (por exemplo do Azurite) para medir também a leitura na tabela",
+        default=os.getenv("BENCH_TABLE_CONNECTION_STRING"),
+    )
+    parser.add_argument("--saida", help="Arquivo JSON para gravar os resultados")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    registros = montar_registros(args.registros, args.folhas, args.eventos)
+
+    resultados = []
+    for codificacao in ("json", "zlib"):
+        resultado = medir_codificacao(registros, codificacao, args.repeticoes)
+        if args.connection_string:
+            resultado["leitura_tabela_ms"] = medir_leitura(args.connection_string, registros, codificacao, args.repeticoes)
+        resultados.append(resultado)
+        leitura = f", leitura na tabela {resultado['leitura_tabela_ms']:.1f} ms" if "leitura_tabela_ms" in resultado else ""
+        print(
+            f"{codificacao:>5}: {resultado['bytes_total'] / 1024:.1f} KiB no total "
+            f"(média {resultado['bytes_medio']:.0f} B, máximo {resultado['bytes_maximo']} B em {resultado['partes_maximo']} parte(s)), "
+            f"codificar {resultado['codificar_ms']:.1f} ms, decodificar {resultado['decodificar_ms']:.1f} ms{leitura}"
+        )
+
+    antes, depois = resultados
+    print(f"Redução de tamanho: {100 * (1 - depois['bytes_total'] / antes['bytes_total']):.1f}%")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
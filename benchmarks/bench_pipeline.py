@@ -0,0 +1,328 @@
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+from dados_sinteticos import gerar_resposta, referencias
+
+
+def resumir_tempos(tempos):
+    """Total, média, mediana, p95 e máximo (em milissegundos) de uma lista de durações em segundos."""
+    ordenados = sorted(tempos)
+    if not ordenados:
+        return {"quantidade": 0}
+    return {
+        "quantidade": len(ordenados),
+        "total_ms": sum(ordenados) * 1000,
+        "media_ms": sum(ordenados) / len(ordenados) * 1000,
+        "p50_ms": ordenados[len(ordenados) // 2] * 1000,
+        "p95_ms": ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))] * 1000,
+        "maximo_ms": ordenados[-1] * 1000,
+    }
+
+
+def commit_atual():
+    """Commit do repositório (para comparar execuções entre commits), ou None fora de um repositório git."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class PortalSimulado:
+    """
+    Servidor HTTP local que responde à API de pessoal com respostas sintéticas
+    pré-geradas (comprimidas com gzip quando o cliente aceita), em uma thread própria.
+
+    Parâmetros:
+        respostas (dict): Referência "mm/aaaa" -> resposta sintética (dict)
+    """
+
+    def __init__(self, respostas):
+        corpos = {}
+        for referencia, dados in respostas.items():
+            corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+            corpos[referencia] = (corpo, gzip.compress(corpo, 6))
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                referencia = parse_qs(urlparse(self.path).query).get("referencia", [""])[0]
+                if referencia not in corpos:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                corpo, compactado = corpos[referencia]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    corpo = compactado
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url_base = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        self._thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def medir_extracao(respostas, pasta):
+    """
+    Extração contra o portal simulado: GET com decodificação do JSON (obter_dados_pessoal),
+    download em streaming para .json.gz (salvar_dados_compactados) e leitura incremental
+    dos registros gravados (LeitorRegistros, usada pela ingestão).
+    """
+    from data_files import LeitorRegistros
+    from scrap_data import ClientePortal, salvar_dados_compactados
+
+    tempos_json, tempos_download, tempos_leitura = [], [], []
+    arquivos = []
+    registros = 0
+    with PortalSimulado(respostas) as portal, ClientePortal(portal.url_base) as cliente:
+        for referencia in respostas:
+            inicio = time.perf_counter()
+            cliente.obter_dados_pessoal(referencia, 0)
+            tempos_json.append(time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            arquivo = salvar_dados_compactados(referencia, 0, pasta, cliente=cliente)
+            tempos_download.append(time.perf_counter() - inicio)
+            arquivos.append(arquivo)
+
+            inicio = time.perf_counter()
+            with LeitorRegistros(arquivo) as leitor:
+                registros += sum(1 for _ in leitor)
+            tempos_leitura.append(time.perf_counter() - inicio)
+        estatisticas = dict(cliente.estatisticas)
+
+    segundos_leitura = sum(tempos_leitura)
+    return arquivos, {
+        "obter_json": resumir_tempos(tempos_json),
+        "baixar_compactado": resumir_tempos(tempos_download),
+        "ler_registros": resumir_tempos(tempos_leitura),
+        "registros": registros,
+        "registros_por_segundo_leitura": registros / segundos_leitura if segundos_leitura > 0 else 0.0,
+        "bytes_rede": estatisticas["bytes_rede"],
+        "bytes_decodificados": estatisticas["bytes_decodificados"],
+    }
+
+
+def medir_ingestao(connection_string, nome_tabela, arquivos, lote, escritores):
+    """
+    Ingestão dos arquivos extraídos em uma tabela temporária (por exemplo, no Azurite),
+    registro a registro (ingerir_arquivo) ou em lote (salvar_arquivos_azure_lote).
+    """
+    # O módulo de ingestão lê a conexão e a tabela das variáveis de ambiente ao ser importado
+    os.environ["AZURE_TABLE_CONNECTION_STRING"] = connection_string
+    os.environ["AZURE_TABLE_NAME"] = nome_tabela
+    import save_on_azure_data_table as ingestao
+    from data_files import unidade_do_arquivo
+
+    ingestao.table_service.create_table_if_not_exists(nome_tabela)
+    tempos = []
+    requisicoes = None
+    inicio_total = time.perf_counter()
+    if lote > 0:
+        requisicoes = 0
+        for i in range(0, len(arquivos), lote):
+            inicio = time.perf_counter()
+            estatisticas = ingestao.salvar_arquivos_azure_lote(arquivos[i:i + lote], escritores)
+            tempos.append(time.perf_counter() - inicio)
+            requisicoes += estatisticas["requisicoes"]
+    else:
+        for arquivo in arquivos:
+            inicio = time.perf_counter()
+            ingestao.ingerir_arquivo(arquivo, unidade_do_arquivo(arquivo))
+            tempos.append(time.perf_counter() - inicio)
+    segundos = time.perf_counter() - inicio_total
+
+    entidades = sum(1 for _ in ingestao.table_client.list_entities(select=["RowKey"]))
+    return {
+        "modo": f"lote de {lote} arquivos" if lote > 0 else "registro a registro",
+        "por_envio": resumir_tempos(tempos),
+        "entidades": entidades,
+        "entidades_por_segundo": entidades / segundos if segundos > 0 else 0.0,
+        "requisicoes": requisicoes,
+    }
+
+
+def medir_consulta(connection_string, nome_tabela, matriculas, meses):
+    """Consultas de período por matrícula com o query_table de load_registro (uma consulta por intervalo)."""
+    import load_registro
+    from payload_codec import decode_payload
+    from table_queries import row_key
+
+    row_keys = [row_key(referencia) for referencia in meses]
+    tempos, tempos_decodificacao = [], []
+    registros_por_matricula = {}
+    for matricula in matriculas:
+        inicio = time.perf_counter()
+        entidades = load_registro.query_table(connection_string, nome_tabela, matricula, row_keys)
+        tempos.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        registros_por_matricula[matricula] = [decode_payload(entidade) for entidade in entidades]
+        tempos_decodificacao.append(time.perf_counter() - inicio)
+    return registros_por_matricula, {
+        "query_table": resumir_tempos(tempos),
+        "decodificar": resumir_tempos(tempos_decodificacao),
+        "meses_por_matricula": sum(len(r) for r in registros_por_matricula.values()) / max(1, len(matriculas)),
+    }
+
+
+def medir_relatorio(registros_por_matricula, meses):
+    """Geração do relatório XLSX de cada matrícula (PayrollFrame e report_bytes, como em load_registro)."""
+    from payroll_frame import PayrollFrame
+    from report_writer import report_bytes
+
+    tempos_frame, tempos_xlsx, tamanhos = [], [], []
+    # Aquecimento (não medido): a primeira chamada inicializa os kernels do pyarrow
+    for registros in list(registros_por_matricula.values())[:1]:
+        report_bytes(PayrollFrame.from_records(registros), {"matricula": "", "data_inicio": "", "data_fim": "", "nome": "", "data_admissao": ""})
+    for matricula, registros in registros_por_matricula.items():
+        resumo = {
+            "matricula": matricula,
+            "data_inicio": f"01/{meses[0]}",
+            "data_fim": f"28/{meses[-1]}",
+            "nome": "",
+            "data_admissao": "",
+        }
+        inicio = time.perf_counter()
+        frame = PayrollFrame.from_records(registros)
+        tempos_frame.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        tamanhos.append(len(report_bytes(frame, resumo)))
+        tempos_xlsx.append(time.perf_counter() - inicio)
+    return {
+        "montar_frame": resumir_tempos(tempos_frame),
+        "gerar_xlsx": resumir_tempos(tempos_xlsx),
+        "bytes_medio": sum(tamanhos) / len(tamanhos) if tamanhos else 0,
+    }
+
+
+def registros_sinteticos(respostas, matriculas):
+    """Registros de cada matrícula em todos os meses, direto das respostas sintéticas (sem a tabela)."""
+    por_matricula = {matricula: [] for matricula in matriculas}
+    for dados in respostas.values():
+        for item in dados["registros"]:
+            numero = item["registro"]["matricula"]["numero"]
+            if numero in por_matricula:
+                por_matricula[numero].append(item["registro"])
+    return por_matricula
+
+
+def comparar(resultado, anterior):
+    """Imprime, para cada tempo medido nas duas execuções, a variação em relação à anterior."""
+    print(f"Comparação com {anterior.get('commit')} ({anterior.get('data')}):")
+    for etapa, medidas in resultado["etapas"].items():
+        for nome, valor in medidas.items():
+            valor_anterior = anterior.get("etapas", {}).get(etapa, {}).get(nome)
+            if not isinstance(valor, dict) or not isinstance(valor_anterior, dict):
+                continue
+            atual, antes = valor.get("media_ms"), valor_anterior.get("media_ms")
+            if atual is None or not antes:
+                continue
+            print(f"  {etapa}.{nome}: {antes:.1f} ms -> {atual:.1f} ms ({100 * (atual / antes - 1):+.1f}%)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Mede o pipeline de ponta a ponta com dados sintéticos: extração (portal simulado), "
+        "ingestão (Azurite), consultas e relatório XLSX"
+    )
+    parser.add_argument("--servidores", type=int, default=500)
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--ano", type=int, default=2020)
+    parser.add_argument("--folhas", type=int, default=1, help="Itens em listFolha por registro")
+    parser.add_argument("--eventos", type=int, default=8, help="Eventos por folha (no máximo 10 distintos)")
+    parser.add_argument("--consultas", type=int, default=50, help="Matrículas consultadas e relatórios gerados")
+    parser.add_argument("--lote", type=int, default=0, help="Arquivos por envio em lote na ingestão (0 para registro a registro)")
+    parser.add_argument("--escritores", type=int, default=8)
+    parser.add_argument(
+        "--connection_string",
+        help="Connection string do Azurite (ou de outra conta) para medir ingestão e consultas; sem ela essas etapas são ignoradas",
+        default=os.getenv("BENCH_TABLE_CONNECTION_STRING"),
+    )
+    parser.add_argument("--saida", help="Arquivo JSON para gravar os resultados")
+    parser.add_argument("--comparar", help="Arquivo JSON de uma execução anterior para comparar os tempos")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    meses = referencias(args.meses, args.ano)
+    respostas = {
+        referencia: gerar_resposta(referencia, args.servidores, args.folhas, args.eventos, codigo_unidade=1)
+        for referencia in meses
+    }
+    matriculas = [str(100000 + i) for i in random.Random(0).sample(range(args.servidores), min(args.consultas, args.servidores))]
+
+    resultado = {
+        "commit": commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parametros": {chave: valor for chave, valor in vars(args).items() if chave not in ("connection_string", "saida", "comparar")},
+        "etapas": {},
+    }
+
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivos, resultado["etapas"]["extracao"] = medir_extracao(respostas, pasta)
+
+        if args.connection_string:
+            from azure.data.tables import TableServiceClient
+
+            nome_tabela = "benchpipeline" + uuid.uuid4().hex[:12]
+            # Índice de nomes local, para não criar outra tabela
+            os.environ["NAME_INDEX_PATH"] = os.path.join(pasta, "nomes.sqlite")
+            try:
+                resultado["etapas"]["ingestao"] = medir_ingestao(
+                    args.connection_string, nome_tabela, arquivos, args.lote, args.escritores
+                )
+                registros_por_matricula, resultado["etapas"]["consulta"] = medir_consulta(
+                    args.connection_string, nome_tabela, matriculas, meses
+                )
+            finally:
+                servico = TableServiceClient.from_connection_string(args.connection_string)
+                for tabela in (nome_tabela, nome_tabela + "Agregados"):
+                    servico.delete_table(tabela)
+        else:
+            print("Sem --connection_string: ingestão e consultas ignoradas; o relatório usa os registros sintéticos.")
+            registros_por_matricula = registros_sinteticos(respostas, matriculas)
+
+        resultado["etapas"]["relatorio"] = medir_relatorio(registros_por_matricula, meses)
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(resultado, json.load(f))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
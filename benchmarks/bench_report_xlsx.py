@@ -0,0 +1,142 @@
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+from dados_sinteticos import gerar_registro
+
+
+def montar_registros(meses, folhas, eventos):
+    """Monta os registros decodificados de uma matrícula ao longo de vários meses."""
+    rng = random.Random(0)
+    registros = []
+    for i in range(meses):
+        referencia = f"{i % 12 + 1:02d}/{2000 + i // 12}"
+        registros.append(gerar_registro(rng, 123456, referencia, folhas, eventos))
+    resumo = {"matricula": "123456", "data_inicio": "01/01/2000", "data_fim": "31/12/2030", "nome": "X", "data_admissao": "01/01/2000"}
+    return registros, resumo
+
+
+def montar_folha(registros):
+    """Monta o dicionário evento -> linhas (laços aninhados usados antes do PayrollFrame)."""
+    folha_de_pagamento = {}
+    for registro in registros:
+        for dados in registro["listFolha"]:
+            for evento in dados["listEventos"]:
+                folha_de_pagamento.setdefault(evento["denominacao"], []).append({
+                    "data": dados["data"],
+                    "referência": evento["valorReferencia"],
+                    "valor": evento["valorEvento"] if evento["tipoEventoDenominacao"] == "Provento" else -evento["valorEvento"],
+                    "divisor": dados["historico"]["nrHorasMensais"],
+                    "tipo_calculo": dados["tipoCalculo"]["tipoDenominacao"],
+                })
+    return folha_de_pagamento
+
+
+def relatorio_pandas(registros, resumo):
+    """Caminho anterior: dicionário de linhas, DataFrames por evento e pd.ExcelWriter(engine='openpyxl') em BytesIO."""
+    import pandas as pd
+
+    from report_writer import sanitize_sheet_name
+
+    folha_de_pagamento = montar_folha(registros)
+    summary_data = []
+    for key, value in folha_de_pagamento.items():
+        df_temp = pd.DataFrame(value)
+        summary_data.append({
+            'Evento': key,
+            'Total de Registros': len(df_temp),
+            'Valor Total': df_temp['valor'].sum(),
+            'Período': f"{resumo['data_inicio']} até {resumo['data_fim']}",
+            'Matrícula': resumo["matricula"],
+            'Nome': resumo["nome"],
+            'Data de Admissão': resumo["data_admissao"],
+        })
+    summary_df = pd.DataFrame(summary_data)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        summary_df.to_excel(writer, sheet_name='Resumo', index=False)
+        for key, value in folha_de_pagamento.items():
+            pd.DataFrame(value).to_excel(writer, sheet_name=sanitize_sheet_name(key), index=False)
+    return output.getvalue()
+
+
+def relatorio_streaming(registros, resumo):
+    """Caminho novo: PayrollFrame e report_writer com planilha write-only."""
+    from payroll_frame import PayrollFrame
+    from report_writer import report_bytes
+
+    return report_bytes(PayrollFrame.from_records(registros), resumo)
+
+
+CAMINHOS = {"pandas": relatorio_pandas, "streaming": relatorio_streaming}
+
+
+def medir_no_processo(caminho, meses, folhas, eventos):
+    """Mede um caminho no processo atual (chamado em um subprocesso novo)."""
+    registros, resumo = montar_registros(meses, folhas, eventos)
+    funcao = CAMINHOS[caminho]
+    # Importa as dependências antes de medir, para não contar o custo de import
+    if caminho == "pandas":
+        import pandas  # noqa: F401
+    else:
+        import payroll_frame  # noqa: F401
+    import openpyxl  # noqa: F401
+    rss_base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    conteudo = funcao(registros, resumo)
+    segundos = time.perf_counter() - inicio
+    rss_pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    linhas = sum(len(dados["listEventos"]) for registro in registros for dados in registro["listFolha"])
+    return {
+        "caminho": caminho,
+        "linhas": linhas,
+        "segundos": segundos,
+        "rss_pico_mib": rss_pico / 1024,
+        "rss_acrescimo_mib": (rss_pico - rss_base) / 1024,
+        "bytes_xlsx": len(conteudo),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compara tempo e pico de RSS da geração do XLSX: pandas vs streaming")
+    parser.add_argument("--meses", type=int, default=240)
+    parser.add_argument("--folhas", type=int, default=3)
+    parser.add_argument("--eventos", type=int, default=10)
+    parser.add_argument("--caminho", choices=sorted(CAMINHOS), help=argparse.SUPPRESS)
+    parser.add_argument("--saida", help="Arquivo JSON para gravar os resultados")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.caminho:
+        print(json.dumps(medir_no_processo(args.caminho, args.meses, args.folhas, args.eventos)))
+        sys.exit(0)
+
+    resultados = []
+    for caminho in ("pandas", "streaming"):
+        saida = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--caminho", caminho,
+             "--meses", str(args.meses), "--folhas", str(args.folhas), "--eventos", str(args.eventos)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        resultado = json.loads(saida.strip().splitlines()[-1])
+        resultados.append(resultado)
+        print(
+            f"{caminho:>10}: {resultado['linhas']} linhas em {resultado['segundos']:.2f}s, "
+            f"pico de RSS {resultado['rss_pico_mib']:.1f} MiB (+{resultado['rss_acrescimo_mib']:.1f} MiB), "
+            f"{resultado['bytes_xlsx']} bytes"
+        )
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
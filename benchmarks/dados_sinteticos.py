@@ -0,0 +1,129 @@
+import argparse
+import gzip
+import json
+import os
+import random
+
+# Denominações de eventos usadas nos dados sintéticos (com "/" para exercitar a sanitização de nomes de planilha)
+EVENTOS = [
+    ("VENCIMENTO BASE", "Provento"),
+    ("ADICIONAL POR TEMPO DE SERVIÇO", "Provento"),
+    ("GRATIFICAÇÃO DE FUNÇÃO", "Provento"),
+    ("HORAS EXTRAS 50%", "Provento"),
+    ("VALE ALIMENTAÇÃO", "Provento"),
+    ("INSS/RPPS", "Desconto"),
+    ("IMPOSTO DE RENDA RETIDO", "Desconto"),
+    ("PLANO DE SAÚDE", "Desconto"),
+    ("CONTRIBUIÇÃO SINDICAL", "Desconto"),
+    ("EMPRÉSTIMO CONSIGNADO", "Desconto"),
+]
+
+NOMES = ["ANA", "JOÃO", "MARIA", "JOSÉ", "ANTÔNIO", "FRANCISCA", "CARLOS", "PAULO", "LÚCIA", "MÁRCIA"]
+SOBRENOMES = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "PEREIRA", "COSTA", "RODRIGUES", "ALMEIDA", "NASCIMENTO", "LIMA"]
+
+
+def gerar_registro(rng, numero, referencia, folhas=1, eventos=8, codigo_unidade=1):
+    """
+    Gera um registro sintético de servidor com a mesma forma dos registros do portal.
+
+    Parâmetros:
+        rng (random.Random): Gerador de números aleatórios
+        numero (int): Número da matrícula
+        referencia (str): Referência no formato "mm/aaaa"
+        folhas (int): Quantidade de itens em listFolha
+        eventos (int): Quantidade de itens em listEventos por folha
+        codigo_unidade (int): Código da unidade gestora
+
+    Retorna:
+        dict: Registro sintético
+    """
+    nome = f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+    tipos = ["Mensal", "Férias", "13º Salário", "Rescisão"]
+    return {
+        "matricula": {
+            "numero": str(numero),
+            "nome": nome,
+            "dataAdmissao": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1990, 2020)}",
+        },
+        "unidadeGestora": {"codigo": codigo_unidade, "denominacao": f"UNIDADE GESTORA {codigo_unidade}"},
+        "listFolha": [
+            {
+                "data": referencia,
+                "historico": {"nrHorasMensais": rng.choice([100, 150, 200, 220])},
+                "tipoCalculo": {"tipoDenominacao": tipos[i % len(tipos)]},
+                "listEventos": [
+                    {
+                        "denominacao": denominacao,
+                        "valorReferencia": round(rng.uniform(0, 40), 2),
+                        "valorEvento": round(rng.uniform(10, 8000), 2),
+                        "tipoEventoDenominacao": tipo,
+                    }
+                    for denominacao, tipo in (EVENTOS[j % len(EVENTOS)] for j in range(eventos))
+                ],
+            }
+            for i in range(folhas)
+        ],
+    }
+
+
+def gerar_resposta(referencia, servidores=1000, folhas=1, eventos=8, codigo_unidade=1, semente=0):
+    """
+    Gera uma resposta sintética da API de pessoal para uma referência.
+
+    Parâmetros:
+        referencia (str): Referência no formato "mm/aaaa"
+        servidores (int): Quantidade de registros
+        folhas (int): Quantidade de itens em listFolha por registro
+        eventos (int): Quantidade de itens em listEventos por folha
+        codigo_unidade (int): Código da unidade gestora
+        semente (int): Semente do gerador aleatório
+
+    Retorna:
+        dict: Resposta com informacao, ultimaAtualizacao e registros
+    """
+    rng = random.Random(f"{semente}-{referencia}-{codigo_unidade}")
+    return {
+        "informacao": "Dados sintéticos para benchmark",
+        "ultimaAtualizacao": f"01/{referencia}",
+        "registros": [
+            {"registro": gerar_registro(rng, 100000 + i, referencia, folhas, eventos, codigo_unidade)}
+            for i in range(servidores)
+        ],
+    }
+
+
+def referencias(meses, ano=2020):
+    """Referências "mm/aaaa" de meses consecutivos a partir de janeiro de ano."""
+    return [f"{i % 12 + 1:02d}/{ano + i // 12}" for i in range(meses)]
+
+
+def gravar_resposta(dados, referencia, codigo_unidade, pasta_saida, compactado=False, indent=2):
+    """Grava uma resposta sintética com o mesmo nome de arquivo usado pelo scrap_data."""
+    os.makedirs(pasta_saida, exist_ok=True)
+    extensao = ".json.gz" if compactado else ".json"
+    unidade_str = f"_unidade_{codigo_unidade}" if codigo_unidade > 0 else ""
+    caminho = os.path.join(pasta_saida, f"pessoal_itajai_{referencia.replace('/', '_')}{unidade_str}{extensao}")
+    abrir = gzip.open if compactado else open
+    with abrir(caminho, "wt", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=indent)
+    return caminho
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gera arquivos sintéticos no formato da API de pessoal")
+    parser.add_argument("--pasta_saida", default=".json_sintetico")
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--ano", type=int, default=2020)
+    parser.add_argument("--servidores", type=int, default=1000)
+    parser.add_argument("--folhas", type=int, default=1)
+    parser.add_argument("--eventos", type=int, default=8)
+    parser.add_argument("--codigo_unidade", type=int, default=0)
+    parser.add_argument("--compactado", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for referencia in referencias(args.meses, args.ano):
+        dados = gerar_resposta(referencia, args.servidores, args.folhas, args.eventos, args.codigo_unidade)
+        print(gravar_resposta(dados, referencia, args.codigo_unidade, args.pasta_saida, args.compactado))
@@ -0,0 +1,149 @@
+import gzip
+import json
+import os
+
+# Extensões de arquivos de dados brutos aceitas (JSON puro ou compactado com gzip pelo scrap_data)
+EXTENSOES_DADOS = ('.json', '.json.gz')
+
+def abrir_arquivo_dados(arquivo_json):
+    """Abre um arquivo de dados brutos para leitura como texto, descompactando-o se for .gz."""
+    if arquivo_json.endswith('.gz'):
+        return gzip.open(arquivo_json, 'rt', encoding='utf-8')
+    return open(arquivo_json, 'r', encoding='utf-8')
+
+def listar_arquivos_dados(pasta_json):
+    """Lista, em ordem, os caminhos dos arquivos de dados brutos de uma pasta."""
+    return [os.path.join(pasta_json, f) for f in sorted(os.listdir(pasta_json)) if f.endswith(EXTENSOES_DADOS)]
+
+def referencia_do_arquivo(arquivo_json):
+    """Extrai a referência "mm/aaaa" do nome do arquivo (ex.: pessoal_itajai_01_2019_unidade_1.json)."""
+    ref_split = os.path.basename(arquivo_json).split('.')[0].split('_')
+    return ref_split[2] + '/' + ref_split[3]
+
+def unidade_do_arquivo(arquivo_json):
+    """Extrai o código da unidade do nome do arquivo (0 quando o arquivo é de todas as unidades)."""
+    arquivo = os.path.basename(arquivo_json)
+    return int(arquivo.split('_unidade_')[1].split('.')[0]) if '_unidade_' in arquivo else 0
+
+def registro_do_item(item):
+    """Registro de um item do array registros, ou None quando o item ou o registro é nulo ou não é um objeto."""
+    registro = item.get("registro") if isinstance(item, dict) else None
+    return registro if isinstance(registro, dict) else None
+
+# Chaves do objeto raiz que acompanham os registros
+CHAVES_CABECALHO = ('informacao', 'ultimaAtualizacao')
+
+
+class LeitorRegistros:
+    """
+    Lê um arquivo de dados brutos de forma incremental, sem carregar o JSON inteiro.
+    
+    As chaves do objeto raiz (informacao, ultimaAtualizacao, ...) ficam disponíveis em
+    cabecalho logo na abertura; os itens do array registros são decodificados um de cada
+    vez ao iterar o leitor, de modo que a memória usada não depende do tamanho do arquivo.
+    
+    Parâmetros:
+        arquivo_json (str): Caminho do arquivo (.json ou .json.gz)
+        tamanho_bloco (int): Quantidade de caracteres lidos do arquivo por vez
+        cabecalho_completo (bool): Faz uma leitura prévia quando o cabeçalho vem depois do array
+    """
+    def __init__(self, arquivo_json, tamanho_bloco=1 << 16, cabecalho_completo=True):
+        self.arquivo_json = arquivo_json
+        self.tamanho_bloco = tamanho_bloco
+        self.decodificador = json.JSONDecoder()
+        self.cabecalho = {}
+        self._arquivo = abrir_arquivo_dados(arquivo_json)
+        self._buffer = ''
+        self._pos = 0
+        self._fim_arquivo = False
+        self._tem_registros = self._ler_ate_registros(self.cabecalho)
+        
+        # Se o cabeçalho vier depois do array, faz uma leitura prévia para obtê-lo
+        if cabecalho_completo and self._tem_registros and any(chave not in self.cabecalho for chave in CHAVES_CABECALHO):
+            with LeitorRegistros(arquivo_json, tamanho_bloco, cabecalho_completo=False) as leitor_previo:
+                for _ in leitor_previo:
+                    pass
+                self.cabecalho.update(leitor_previo.cabecalho)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        self._arquivo.close()
+
+    def __iter__(self):
+        if not self._tem_registros:
+            return
+        while True:
+            caractere = self._proximo_caractere()
+            if caractere == ']':
+                self._pos += 1
+                break
+            if caractere == ',':
+                self._pos += 1
+                continue
+            yield self._decodificar_valor()
+        # Lê o restante do objeto raiz para capturar chaves posteriores ao array
+        self._ler_ate_registros(self.cabecalho)
+
+    def _carregar(self):
+        """Lê mais um bloco do arquivo, descartando a parte já consumida do buffer."""
+        bloco = self._arquivo.read(self.tamanho_bloco)
+        if not bloco:
+            self._fim_arquivo = True
+            return False
+        self._buffer = self._buffer[self._pos:] + bloco
+        self._pos = 0
+        return True
+
+    def _proximo_caractere(self):
+        """Retorna o próximo caractere que não é espaço em branco, sem consumi-lo."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._carregar():
+                raise ValueError(f"Fim inesperado do arquivo {self.arquivo_json}")
+
+    def _decodificar_valor(self):
+        """Decodifica o próximo valor JSON completo, lendo mais blocos enquanto estiver incompleto."""
+        self._proximo_caractere()
+        while True:
+            try:
+                valor, fim = self.decodificador.raw_decode(self._buffer, self._pos)
+                # Um número no fim do buffer pode continuar no próximo bloco
+                if fim < len(self._buffer) or self._fim_arquivo:
+                    self._pos = fim
+                    return valor
+            except json.JSONDecodeError:
+                if self._fim_arquivo:
+                    raise
+            self._carregar()
+
+    def _ler_ate_registros(self, cabecalho):
+        """
+        Percorre as chaves do objeto raiz guardando-as em cabecalho até encontrar o array
+        registros (retorna True, posicionado no primeiro item) ou o fim do objeto (retorna False).
+        """
+        while True:
+            caractere = self._proximo_caractere()
+            self._pos += 1
+            if caractere == '}':
+                return False
+            if caractere in '{,':
+                continue
+            if caractere != '"':
+                raise ValueError(f"JSON inválido em {self.arquivo_json}: esperado um objeto")
+            self._pos -= 1
+            chave = self._decodificar_valor()
+            if self._proximo_caractere() != ':':
+                raise ValueError(f"JSON inválido em {self.arquivo_json}: esperado ':' após {chave!r}")
+            self._pos += 1
+            if chave == 'registros' and self._proximo_caractere() == '[':
+                self._pos += 1
+                return True
+            cabecalho[chave] = self._decodificar_valor()
@@ -1,20 +1,79 @@
+import time
+
+_MODULE_LOAD_START = time.perf_counter()
+
 import logging
 import azure.functions as func
 import json
 import os
 import tempfile
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
-import pandas as pd
-from azure.data.tables import TableServiceClient, TableClient
 from dotenv import load_dotenv
-import io
-import base64
+from month_cache import MonthCache
+from month_summary import SUMMARY_SELECT, merge_summaries, summarize_month
+from payload_codec import PAYLOAD_PROPERTIES, decode_payload
+from pipeline_metrics import metrics
+from report_cache import VERSION_PROPERTIES, ReportCache, data_version, entity_version, etag_matches, report_etag
+from report_formats import MEDIA_TYPES, TEXT_FORMATS, accepts_gzip, gzip_chunks, negotiate_format, report_chunks
+from table_queries import contiguous_runs, query_period
+
+# openpyxl, dateutil e azure.data.tables são importados apenas quando necessários,
+# para que o cold start e as respostas de OPTIONS/400 não paguem esse custo
 
 # Carregar variáveis do arquivo .env
 load_dotenv()
 
+_MODULE_LOAD_SECONDS = time.perf_counter() - _MODULE_LOAD_START
+_first_invocation = True
+
+# Métricas do processo, acumuladas entre invocações (gravadas a cada requisição se
+# METRICS_PROMETHEUS_DIR ou METRICS_JSONL_FILE estiverem definidos)
+metrics.configure("function")
+
+# Clientes de tabela reutilizados entre invocações do mesmo processo
+_table_clients = {}
+
+# Meses de folha já decodificados, por (matrícula, RowKey), reutilizados entre invocações
+_month_cache = MonthCache(
+    max_entries=int(os.getenv("MONTH_CACHE_MAX_ENTRIES", "5000")),
+    ttl_seconds=float(os.getenv("MONTH_CACHE_TTL_SECONDS", "3600")),
+)
+
+# Relatórios já gerados, por ETag (parâmetros + versão dos dados), persistidos em disco
+_report_cache = ReportCache(
+    os.getenv("REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "relatorios_folha")),
+    max_bytes=int(os.getenv("REPORT_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+
+# Limites do modo em lote (várias matrículas na mesma requisição)
+_batch_max_matriculas = int(os.getenv("BATCH_MAX_MATRICULAS", "500"))
+_batch_max_workers = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+
+def get_table_client(connection_string, table_name):
+    table_client = _table_clients.get((connection_string, table_name))
+    if table_client is None:
+        from azure.data.tables import TableServiceClient
+
+        table_service = TableServiceClient.from_connection_string(connection_string)
+        table_client = table_service.get_table_client(table_name)
+        _table_clients[(connection_string, table_name)] = table_client
+    return table_client
+
+# Índice nome -> matrícula (NAME_INDEX_PATH aponta para um índice SQLite local)
+_name_index = None
+
+def get_name_index(connection_string, table_name):
+    global _name_index
+    if _name_index is None:
+        from name_index import open_name_index
+
+        # The index table is created if missing, so searches before the first ingest find nothing instead of failing
+        _name_index = open_name_index(connection_string, table_name)
+    return _name_index
+
 def get_date_range(start_date_str, end_date_str):
+    from dateutil.relativedelta import relativedelta
+
     start_date = datetime.strptime(start_date_str, "%d/%m/%Y")
     end_date = datetime.strptime(end_date_str, "%d/%m/%Y")
 
@@ -23,176 +82,535 @@ def get_date_range(start_date_str, end_date_str):
     date_list = []
 
     while current_date <= end_date:
-        month_year = current_date.strftime("%m_%Y")
+        month_year = current_date.strftime("%Y_%m")
         date_list.append(month_year)
         current_date += relativedelta(months=1)
 
     return date_list
 
-def query_table(connection_string, table_name, matricula, row_keys):
-    results = []
+class TableQueryError(Exception):
+    # Falha ao consultar a tabela: respondida com 503, não como "nenhum registro encontrado"
+    pass
 
-    # Connect to the table service
-    table_service = TableServiceClient.from_connection_string(connection_string)
-    table_client = table_service.get_table_client(table_name)
+def query_table(connection_string, table_name, matricula, row_keys, select=None):
+    # Reuse the table client of this worker process
+    table_client = get_table_client(connection_string, table_name)
 
-    for row_key in row_keys:
-        try:
-            # Query with PartitionKey and RowKey
-            entity = table_client.get_entity(partition_key=matricula, row_key=row_key)
-            results.append(entity)
-        except Exception as e:
-            logging.error(f"Error fetching record for matricula {matricula}, date {row_key}: {e}")
+    if not row_keys:
+        return []
 
-    return results
+    # A single range query over the chronologically sortable RowKeys (YYYY_MM)
+    try:
+        with metrics.timer("table_request", operation="query" if select is None else "query_select"):
+            results = query_period(table_client, matricula, row_keys[0], row_keys[-1], select=select)
+        metrics.increment("entities_read", len(results))
+        return results
+    except Exception as e:
+        metrics.increment("table_errors", operation="query")
+        logging.error(f"Error fetching records for matricula {matricula}, period {row_keys[0]} to {row_keys[-1]}: {e}")
+        raise TableQueryError(str(e)) from e
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Processando requisição HTTP.')
+def query_months(connection_string, table_name, matricula, row_keys, selected, select=None):
+    # One range query per run of selected months, so the months between runs are not downloaded again
+    return [
+        entity
+        for run in contiguous_runs(row_keys, selected)
+        for entity in query_table(connection_string, table_name, matricula, run, select=select)
+    ]
 
-    # Verificar se é uma requisição OPTIONS (preflight)
-    if req.method.lower() == 'options':
+# Properties of the light version query: enough to version the period and validate cached months
+VERSION_SELECT = ["RowKey"] + VERSION_PROPERTIES
+
+def fetch_versions(connection_string, table_name, matricula, row_keys):
+    return query_table(connection_string, table_name, matricula, row_keys, select=VERSION_SELECT)
+
+def cached_months(matricula, versions):
+    # Months still valid in the cache, and the RowKeys that must be downloaded
+    records = {}
+    missing = []
+    for version in versions:
+        cached = _month_cache.get((matricula, version["RowKey"]), entity_version(version))
+        if cached is None:
+            missing.append(version["RowKey"])
+        else:
+            records[version["RowKey"]] = cached
+    return records, missing
+
+def decode_months(matricula, entities, missing, records):
+    # Decode the downloaded months (ignoring cached ones returned by the range query) into records and the cache
+    missing_keys = set(missing)
+    for entity in entities:
+        if entity["RowKey"] not in missing_keys:
+            continue
+        with metrics.timer("payload_decode"):
+            record_data = decode_payload(entity)
+        month = {"matricula": record_data["matricula"], "listFolha": record_data["listFolha"]}
+        _month_cache.put((matricula, entity["RowKey"]), entity_version(entity), month)
+        records[entity["RowKey"]] = month
+
+def sorted_months(records, missing):
+    # Months in chronological order, with the number of cache hits and of downloaded months
+    logging.info(
+        f"Cache de meses: {len(records) - len(missing)} em cache, {len(missing)} buscados; "
+        f"totais {_month_cache.snapshot()}"
+    )
+    hits = len(records) - sum(1 for row_key in missing if row_key in records)
+    return [records[row_key] for row_key in sorted(records)], hits, len(missing)
+
+def fetch_records(connection_string, table_name, matricula, versions):
+    records, missing = cached_months(matricula, versions)
+
+    # Only the uncached or stale months are downloaded and decoded
+    if missing:
+        row_keys = [version["RowKey"] for version in versions]
+        entities = query_months(connection_string, table_name, matricula, row_keys, missing)
+        decode_months(matricula, entities, missing, records)
+    return sorted_months(records, missing)
+
+def fetch_summaries(connection_string, table_name, matricula, row_keys):
+    # Projected query over the small summary properties written at ingest time (never the stored record)
+    return query_table(connection_string, table_name, matricula, row_keys, select=SUMMARY_SELECT)
+
+def complete_summaries(connection_string, table_name, matricula, months):
+    # Entities written before the summaries existed are summarised from their stored record
+    missing = [month["RowKey"] for month in months if month.get("resumo_versao") is None]
+    if not missing:
+        return months
+    row_keys = [month["RowKey"] for month in months]
+    entities = query_months(connection_string, table_name, matricula, row_keys, missing, select=["RowKey"] + PAYLOAD_PROPERTIES)
+    return fill_summaries(months, missing, entities)
+
+def fill_summaries(months, missing, entities):
+    # Replace the months without a stored summary by the summary of their decoded record
+    missing_keys = set(missing)
+    decoded = {
+        entity["RowKey"]: summarize_month(decode_payload(entity))
+        for entity in entities
+        if entity["RowKey"] in missing_keys
+    }
+    logging.info(f"Resumo mensal calculado a partir do registro completo para {len(decoded)} meses sem resumo gravado")
+    return [decoded.get(month["RowKey"], month) for month in months]
+
+def search_response(query, limit):
+    from name_index import MIN_PREFIX, tokens
+
+    if not any(len(token) >= MIN_PREFIX for token in tokens(query)):
         return func.HttpResponse(
-            status_code=200,
-            headers={
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-                'Access-Control-Max-Age': '86400'  # 24 horas em segundos
-            }
+            f"Informe ao menos uma palavra do nome com {MIN_PREFIX} ou mais letras.",
+            status_code=400
         )
+    try:
+        limit = min(max(int(limit or 20), 1), 200)
+    except ValueError:
+        limit = 20
+
+    connection_string = os.getenv("AZURE_TABLE_CONNECTION_STRING")
+    table_name = os.getenv("AZURE_TABLE_NAME", "RegistrosTabela")
+    if not connection_string and not os.getenv("NAME_INDEX_PATH"):
+        return func.HttpResponse(
+             "Erro: Azure Storage connection string não configurada.",
+             status_code=500
+        )
+
+    try:
+        results = get_name_index(connection_string, table_name).search(query, limit)
+    except Exception as e:
+        logging.error(f"Erro na busca por nome '{query}': {e}")
+        return func.HttpResponse("Erro ao consultar o índice de nomes.", status_code=500)
+
+    return func.HttpResponse(
+        json.dumps({"consulta": query, "resultados": results}, ensure_ascii=False),
+        status_code=200,
+        mimetype="application/json",
+        headers={
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        }
+    )
+
+def rollup_response(kind, start_date, end_date, codigo_unidade, denominacao, output_format):
+    from unit_rollups import EVENT_COLUMNS, UNIT_COLUMNS, query_rollups, rollup_table_name
+
+    if kind not in ("eventos", "unidades"):
+        return func.HttpResponse("O parâmetro rollup deve ser eventos ou unidades.", status_code=400)
+    if not all([start_date, end_date]):
+        return func.HttpResponse("Por favor, forneça os parâmetros: start_date e end_date.", status_code=400)
+
+    connection_string = os.getenv("AZURE_TABLE_CONNECTION_STRING")
+    table_name = os.getenv("AZURE_TABLE_NAME", "RegistrosTabela")
+    if not connection_string:
+        return func.HttpResponse(
+             "Erro: Azure Storage connection string não configurada.",
+             status_code=500
+        )
+
+    # Uma consulta por mês na tabela de agregados, sem ler as entidades das matrículas
+    try:
+        rows = query_rollups(
+            get_table_client(connection_string, rollup_table_name(table_name)),
+            start_date[-7:], end_date[-7:], kind, codigo_unidade, denominacao,
+        )
+    except ValueError:
+        return func.HttpResponse("Datas inválidas. Use DD/MM/AAAA ou MM/AAAA.", status_code=400)
+    except Exception as e:
+        logging.error(f"Erro ao consultar os agregados: {e}")
+        return func.HttpResponse("Erro ao consultar os agregados.", status_code=500)
+
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    }
+    if output_format == "csv":
+        import csv
+        import io
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=UNIT_COLUMNS if kind == "unidades" else EVENT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return func.HttpResponse(buffer.getvalue(), status_code=200, mimetype="text/csv", headers=headers)
+    return func.HttpResponse(
+        json.dumps(rows, ensure_ascii=False),
+        status_code=200,
+        mimetype="application/json",
+        headers=headers,
+    )
+
+def batch_response(connection_string, table_name, matriculas, start_date, end_date, output_format, combined):
+    import batch_reports
+    from payroll_frame import PayrollFrame
+
+    if len(matriculas) > _batch_max_matriculas:
+        return func.HttpResponse(
+            f"O lote aceita no máximo {_batch_max_matriculas} matrículas por requisição.",
+            status_code=400
+        )
+
+    date_range = get_date_range(start_date, end_date)
+
+    def load_frame(matricula):
+        versions = fetch_versions(connection_string, table_name, matricula, date_range)
+        if not versions:
+            return None
+        results, _, _ = fetch_records(connection_string, table_name, matricula, versions)
+        return PayrollFrame.from_records(results)
+
+    def on_progress(result, done, total):
+        logging.info(f"Lote: {done}/{total} matrículas ({result['matricula']}: {result['situacao']})")
+
+    output, results = batch_reports.batch_bytes(
+        matriculas, load_frame, start_date, end_date, output_format, combined,
+        max_workers=_batch_max_workers, on_progress=on_progress,
+    )
+    counts = {situacao: sum(1 for r in results if r["situacao"] == situacao) for situacao in ("ok", "sem_registros", "erro")}
+
+    if not counts["ok"]:
+        # Sem nenhum relatório: 503 se alguma matrícula falhou (por exemplo, erro da tabela), senão 404
+        return func.HttpResponse(
+            json.dumps({"data_inicio": start_date, "data_fim": end_date, "matriculas": results}, ensure_ascii=False),
+            status_code=503 if counts["erro"] else 404,
+            mimetype="application/json",
+        )
+
+    extension = "parquet" if combined else "zip"
+    file_name = f"registros_lote_{start_date.replace('/', '-')}_a_{end_date.replace('/', '-')}.{extension}"
+    return func.HttpResponse(
+        body=output,
+        status_code=200,
+        headers={
+            'Content-Type': MEDIA_TYPES["parquet"] if combined else 'application/zip',
+            'Content-Disposition': f'attachment; filename="{file_name}"',
+            'X-Batch-Total': str(len(results)),
+            'X-Batch-Ok': str(counts["ok"]),
+            'X-Batch-Empty': str(counts["sem_registros"]),
+            'X-Batch-Errors': str(counts["erro"]),
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+            'Access-Control-Expose-Headers': 'X-Batch-Total, X-Batch-Ok, X-Batch-Empty, X-Batch-Errors',
+        }
+    )
+
+def log_invocation():
+    global _first_invocation
+    logging.info('Processando requisição HTTP.')
+    if _first_invocation:
+        _first_invocation = False
+        logging.info(f"Cold start: módulo carregado em {_MODULE_LOAD_SECONDS * 1000:.1f} ms")
+        metrics.observe("cold_start_import", _MODULE_LOAD_SECONDS)
+
+def record_request(response, start):
+    metrics.observe("function_request", time.perf_counter() - start, status=response.status_code)
+    metrics.increment("function_requests", status=response.status_code)
+    if response.headers.get('X-Report-Cache'):
+        metrics.increment("report_cache", result=response.headers['X-Report-Cache'])
+    if response.headers.get('X-Cache-Months-Hit'):
+        metrics.increment("month_cache", int(response.headers['X-Cache-Months-Hit']), result="hit")
+        metrics.increment("month_cache", int(response.headers['X-Cache-Months-Fetched']), result="miss")
+    try:
+        metrics.flush()
+    except OSError as e:
+        logging.error(f"Erro ao gravar as métricas: {e}")
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    log_invocation()
+    start = time.perf_counter()
+    response = handle_request(req)
+    record_request(response, start)
+    return response
+
+def options_response():
+    return func.HttpResponse(
+        status_code=200,
+        headers={
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+            'Access-Control-Max-Age': '86400'  # 24 horas em segundos
+        }
+    )
+
+def table_error_response():
+    return func.HttpResponse(
+        "Erro ao consultar a tabela. Tente novamente em instantes.",
+        status_code=503,
+        headers={'Retry-After': '5'}
+    )
+
+def not_found_response(matricula):
+    return func.HttpResponse(
+        f"Nenhum registro encontrado para a matrícula {matricula} no período especificado.",
+        status_code=404
+    )
 
-    # Obter parâmetros da requisição
+def parse_report_request(req):
+    # Parâmetros do relatório (uma matrícula ou lote): retorna (params, None) ou (None, resposta de erro)
     try:
         matricula = req.params.get('matricula')
+        matriculas = req.params.get('matriculas')
         start_date = req.params.get('start_date')
         end_date = req.params.get('end_date')
-        
+        format_param = req.params.get('format')
+        combined = req.params.get('combined')
+        summary_only = req.params.get('summary_only')
+
         # Verificar se todos os parâmetros foram fornecidos
-        if not all([matricula, start_date, end_date]):
+        if not all([matricula or matriculas, start_date, end_date]):
             req_body = req.get_json()
             matricula = req_body.get('matricula')
+            matriculas = req_body.get('matriculas')
             start_date = req_body.get('start_date')
             end_date = req_body.get('end_date')
+            format_param = format_param or req_body.get('format')
+            combined = combined or req_body.get('combined')
+            summary_only = summary_only or req_body.get('summary_only')
     except ValueError:
-        return func.HttpResponse(
+        return None, func.HttpResponse(
              "Erro ao ler parâmetros da requisição.",
              status_code=400
         )
 
     # Validar parâmetros obrigatórios
-    if not all([matricula, start_date, end_date]):
-        return func.HttpResponse(
-             "Por favor, forneça os parâmetros: matricula, start_date e end_date.",
+    if not all([matricula or matriculas, start_date, end_date]):
+        return None, func.HttpResponse(
+             "Por favor, forneça os parâmetros: matricula (ou matriculas), start_date e end_date.",
+             status_code=400
+        )
+
+    # Validar o formato das datas antes de montar o período
+    try:
+        get_date_range(str(start_date), str(end_date))
+    except ValueError:
+        return None, func.HttpResponse(
+             "Datas inválidas. Use start_date e end_date no formato DD/MM/AAAA.",
+             status_code=400
+        )
+
+    # Escolher o formato de saída pelo parâmetro format ou pelo cabeçalho Accept
+    output_format = negotiate_format(format_param, req.headers.get('Accept'))
+    if output_format is None:
+        return None, func.HttpResponse(
+             f"Formato não suportado. Use um de: {', '.join(sorted(MEDIA_TYPES))}.",
              status_code=400
         )
-    
+
     # Obter a connection string e nome da tabela
     connection_string = os.getenv("AZURE_TABLE_CONNECTION_STRING")
     table_name = os.getenv("AZURE_TABLE_NAME", "RegistrosTabela")
-    
+
     if not connection_string:
-        return func.HttpResponse(
+        return None, func.HttpResponse(
              "Erro: Azure Storage connection string não configurada.",
              status_code=500
         )
 
-    # Obter o intervalo de datas
-    date_range = get_date_range(start_date, end_date)
+    return {
+        "matricula": matricula,
+        "matriculas": matriculas,
+        "start_date": start_date,
+        "end_date": end_date,
+        "output_format": output_format,
+        "combined": str(combined).lower() in ('1', 'true', 'sim'),
+        "summary_only": str(summary_only).lower() in ('1', 'true', 'sim'),
+        "connection_string": connection_string,
+        "table_name": table_name,
+    }, None
 
-    # Consultar registros no Azure Table
-    results = query_table(connection_string, table_name, matricula, date_range)
+def report_headers(req, params, versions):
+    # O ETag identifica o relatório pelos parâmetros e pela versão dos dados
+    matricula, start_date, end_date, output_format = params["matricula"], params["start_date"], params["end_date"], params["output_format"]
+    gzip_body = output_format in TEXT_FORMATS and accepts_gzip(req.headers.get('Accept-Encoding'))
+    etag = report_etag(
+        {"matricula": matricula, "start_date": start_date, "end_date": end_date, "format": output_format, "gzip": gzip_body, "summary_only": params["summary_only"]},
+        data_version(versions),
+    )
+    headers = {
+        'Content-Type': MEDIA_TYPES[output_format],
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Vary': 'Accept, Accept-Encoding',
+    }
+    if gzip_body:
+        headers['Content-Encoding'] = 'gzip'
 
-    if not results:
-        return func.HttpResponse(
-            f"Nenhum registro encontrado para a matrícula {matricula} no período especificado.",
-            status_code=404
-        )
+    # Nome do arquivo de saída
+    suffix = "_resumo" if params["summary_only"] else ""
+    file_name = f"registros_matricula_{matricula}_{start_date.replace('/', '-')}_a_{end_date.replace('/', '-')}{suffix}.{output_format}"
+    headers['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return etag, headers, gzip_body
+
+def cached_response(req, etag, headers):
+    # O cliente já tem esta versão do relatório
+    if etag_matches(req.headers.get('If-None-Match'), etag):
+        not_modified_headers = {key: value for key, value in headers.items() if key not in ('Content-Type', 'Content-Encoding', 'Content-Disposition')}
+        return func.HttpResponse(status_code=304, headers=not_modified_headers)
+
+    # Relatório já gerado para esta versão dos dados
+    output = _report_cache.get(etag)
+    if output is not None:
+        logging.info(f"Relatório servido do cache: {_report_cache.snapshot()}")
+        headers['X-Report-Cache'] = 'hit'
+        return func.HttpResponse(body=output, status_code=200, headers=headers)
+
+    headers['X-Report-Cache'] = 'miss'
+    return None
+
+def build_report(params, gzip_body, results=None, summaries=None):
+    # Parte limitada por CPU: achata os meses (ou soma os resumos mensais) e gera o relatório
+    output_format = params["output_format"]
+    if results is None:
+        # Apenas a planilha/linhas de resumo, somadas a partir dos resumos mensais
+        summary, nome, data_admissao = merge_summaries(summaries)
+        frame = None
+    else:
+        from payroll_frame import PayrollFrame
+
+        # Achatar todos os meses em um único frame colunar
+        frame = PayrollFrame.from_records(results)
+        summary, nome, data_admissao = frame.summary(), frame.nome, frame.data_admissao
 
-    folha_de_pagamento = {}
     resumo = {
-        "matricula": matricula,
-        "data_inicio": start_date,
-        "data_fim": end_date,
-        "nome": "",
-        "data_admissao": "",
+        "matricula": params["matricula"],
+        "data_inicio": params["start_date"],
+        "data_fim": params["end_date"],
+        "nome": nome,
+        "data_admissao": data_admissao,
     }
-    
-    # Processar cada registro
-    for record in results:
-        dict_record = dict(record)
-        record_data = json.loads(dict_record["dados_json"])
-        if resumo["nome"] == "":
-            resumo["nome"] = record_data["matricula"]["nome"]
-        if resumo["data_admissao"] == "":
-            resumo["data_admissao"] = record_data["matricula"]["dataAdmissao"]
-        for dados in record_data["listFolha"]:
-            data = dados["data"]
-            divisor = dados["historico"]["nrHorasMensais"]
-            tipo_calculo = dados["tipoCalculo"]["tipoDenominacao"]
-            for evento in dados["listEventos"]:
-                if evento["denominacao"] not in folha_de_pagamento:
-                    folha_de_pagamento[evento["denominacao"]] = []
-                folha_de_pagamento[evento["denominacao"]].append(
-                    {
-                        "data": data,
-                        "referência": evento["valorReferencia"],
-                        "valor": (
-                            evento["valorEvento"]
-                            if evento["tipoEventoDenominacao"] == "Provento"
-                            else -evento["valorEvento"]
-                        ),
-                        "divisor": divisor,
-                        "tipo_calculo": tipo_calculo,
-                    }
-                )
-    
-    # Criar DataFrame resumo
-    summary_data = []
-    for key, value in folha_de_pagamento.items():
-        df_temp = pd.DataFrame(value)
-        summary_data.append({
-            'Evento': key,
-            'Total de Registros': len(df_temp),
-            'Valor Total': df_temp['valor'].sum(),
-            'Período': f"{start_date} até {end_date}",
-            'Matrícula': matricula,
-            'Nome': resumo["nome"],
-            'Data de Admissão': resumo["data_admissao"],
-        })
-    
-    summary_df = pd.DataFrame(summary_data)
-    
-    # Criar arquivo Excel em memória
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Escrever a planilha de resumo primeiro
-        summary_df.to_excel(writer, sheet_name='Resumo', index=False)
-        
-        # Escrever cada evento em sua própria planilha
-        for key, value in folha_de_pagamento.items():
-            df = pd.DataFrame(value)
-            # Substituir caracteres inválidos nos nomes das planilhas
-            valid_sheet_name = key.replace('/', '_').replace('\\', '_').replace('?', '_').replace('*', '_').replace('[', '_').replace(']', '_').replace(':', '_')
-            # Truncar nome da planilha se muito longo (limite do Excel é 31 caracteres)
-            valid_sheet_name = valid_sheet_name[:31]
-            # Salvar cada DataFrame em uma planilha diferente
-            df.to_excel(writer, sheet_name=valid_sheet_name, index=False)
-    
-    # Configurar a resposta HTTP com o arquivo Excel
-    output.seek(0)
-    
-    # Nome do arquivo de saída
-    file_name = f"registros_matricula_{matricula}_{start_date.replace('/', '-')}_a_{end_date.replace('/', '-')}.xlsx"
-    
+
+    with metrics.timer("report_build", format=output_format):
+        if output_format == "xlsx":
+            from report_writer import report_bytes, summary_bytes
+
+            # Criar arquivo Excel em memória, escrevendo as linhas direto na planilha (sem DataFrames)
+            return report_bytes(frame, resumo) if frame is not None else summary_bytes(summary, resumo)
+        # Linhas achatadas e resumo em CSV, NDJSON ou Parquet; formatos de texto são compactados com gzip
+        chunks = report_chunks(output_format, frame.rows() if frame is not None else (), resumo, summary)
+        if gzip_body:
+            chunks = gzip_chunks(chunks)
+        return b"".join(chunks)
+
+def handle_request(req: func.HttpRequest) -> func.HttpResponse:
+
+    # Verificar se é uma requisição OPTIONS (preflight)
+    if req.method.lower() == 'options':
+        return options_response()
+
+    # Busca de matrículas pelo nome do servidor
+    if req.params.get('nome'):
+        return search_response(req.params.get('nome'), req.params.get('limit'))
+
+    # Agregados por unidade gestora, evento e mês
+    if req.params.get('rollup'):
+        return rollup_response(
+            req.params.get('rollup'), req.params.get('start_date'), req.params.get('end_date'),
+            req.params.get('unidade'), req.params.get('evento'), req.params.get('format'),
+        )
+
+    params, error = parse_report_request(req)
+    if error is not None:
+        return error
+    connection_string, table_name = params["connection_string"], params["table_name"]
+
+    # Modo em lote: um ZIP com um relatório por matrícula ou um Parquet combinado
+    if params["matriculas"]:
+        from batch_reports import parse_matriculas
+
+        return batch_response(
+            connection_string, table_name, parse_matriculas(params["matriculas"]),
+            params["start_date"], params["end_date"], params["output_format"], params["combined"],
+        )
+
+    # Falhas da tabela viram 503 (e não 404, como se não houvesse registros)
+    try:
+        return report_response(req, params)
+    except TableQueryError:
+        return table_error_response()
+
+def report_response(req, params):
+    connection_string, table_name, matricula = params["connection_string"], params["table_name"], params["matricula"]
+
+    # Obter o intervalo de datas
+    date_range = get_date_range(params["start_date"], params["end_date"])
+
+    # Versões dos meses do período (consulta leve, sem o registro completo); no modo só resumo,
+    # a mesma consulta já traz os resumos mensais gravados na ingestão
+    if params["summary_only"]:
+        versions = fetch_summaries(connection_string, table_name, matricula, date_range)
+    else:
+        versions = fetch_versions(connection_string, table_name, matricula, date_range)
+
+    if not versions:
+        return not_found_response(matricula)
+
+    etag, headers, gzip_body = report_headers(req, params, versions)
+    response = cached_response(req, etag, headers)
+    if response is not None:
+        return response
+
+    if params["summary_only"]:
+        output = build_report(params, gzip_body, summaries=complete_summaries(connection_string, table_name, matricula, versions))
+    else:
+        # Consultar registros no Azure Table (meses em cache não são baixados de novo)
+        results, cached_months_count, fetched_months = fetch_records(connection_string, table_name, matricula, versions)
+
+        if not results:
+            return not_found_response(matricula)
+
+        headers['X-Cache-Months-Hit'] = str(cached_months_count)
+        headers['X-Cache-Months-Fetched'] = str(fetched_months)
+        output = build_report(params, gzip_body, results=results)
+
+    _report_cache.put(etag, output)
+
     # Retornar o arquivo como resposta HTTP com cabeçalhos CORS
     return func.HttpResponse(
-        body=output.getvalue(),
+        body=output,
         status_code=200,
-        headers={
-            'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'Content-Disposition': f'attachment; filename="{file_name}"',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-        }
+        headers=headers
     )
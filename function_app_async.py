@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import time
+
+import azure.functions as func
+
+import function_app
+from function_app import (
+    VERSION_SELECT, TableQueryError, _report_cache, build_report, cached_months, cached_response, decode_months,
+    fill_summaries, get_date_range, log_invocation, not_found_response, options_response,
+    parse_report_request, record_request, report_headers, sorted_months, table_error_response,
+)
+from month_summary import SUMMARY_SELECT
+from payload_codec import PAYLOAD_PROPERTIES
+from pipeline_metrics import metrics
+from table_queries import contiguous_runs, query_period_async, split_period
+
+# Variante assíncrona da Azure Function (function.json com "scriptFile": "function_app_async.py").
+# As consultas à tabela usam o cliente de azure.data.tables.aio, com os intervalos de um período
+# longo consultados em paralelo, e a geração do relatório roda em uma thread, para que o mesmo
+# worker atenda várias requisições ao mesmo tempo. Caches e demais rotas são os de function_app;
+# a leitura e a gravação dos caches e das métricas em disco também rodam em threads.
+
+# Consultas por intervalo simultâneas por requisição e meses por consulta
+_max_concurrent_queries = int(os.getenv("ASYNC_MAX_CONCURRENT_QUERIES", "8"))
+_months_per_query = int(os.getenv("ASYNC_MONTHS_PER_QUERY", "12"))
+
+# Clientes assíncronos reutilizados entre invocações, por event loop (a sessão HTTP pertence ao loop)
+_async_table_clients = {}
+
+def get_async_table_client(connection_string, table_name):
+    key = (connection_string, table_name, asyncio.get_running_loop())
+    table_client = _async_table_clients.get(key)
+    if table_client is None:
+        from azure.data.tables.aio import TableClient
+
+        table_client = TableClient.from_connection_string(connection_string, table_name)
+        _async_table_clients[key] = table_client
+    return table_client
+
+async def query_table_async(connection_string, table_name, matricula, row_keys, selected=None, select=None):
+    # Ranges never span an unselected month (e.g. a cached one), and long runs are split to be queried concurrently
+    ranges = [
+        keys
+        for run in contiguous_runs(row_keys, row_keys if selected is None else selected)
+        for keys in split_period(run, _months_per_query)
+    ]
+    if not ranges:
+        return []
+    table_client = get_async_table_client(connection_string, table_name)
+    semaphore = asyncio.Semaphore(max(1, _max_concurrent_queries))
+    operation = "query" if select is None else "query_select"
+
+    async def query_range(keys):
+        async with semaphore:
+            with metrics.timer("table_request", operation=operation):
+                return await query_period_async(table_client, matricula, keys[0], keys[-1], select=select)
+
+    try:
+        entities_by_range = await asyncio.gather(*(query_range(keys) for keys in ranges))
+    except Exception as e:
+        metrics.increment("table_errors", operation="query")
+        logging.error(f"Error fetching records for matricula {matricula}, period {ranges[0][0]} to {ranges[-1][-1]}: {e}")
+        raise TableQueryError(str(e)) from e
+    results = [entity for entities in entities_by_range for entity in entities]
+    metrics.increment("entities_read", len(results))
+    return results
+
+async def fetch_records_async(connection_string, table_name, matricula, versions):
+    records, missing = cached_months(matricula, versions)
+
+    # Only the uncached or stale months are downloaded; decoding runs off the event loop
+    if missing:
+        row_keys = [version["RowKey"] for version in versions]
+        entities = await query_table_async(connection_string, table_name, matricula, row_keys, missing)
+        await asyncio.to_thread(decode_months, matricula, entities, missing, records)
+    return sorted_months(records, missing)
+
+async def complete_summaries_async(connection_string, table_name, matricula, months):
+    missing = [month["RowKey"] for month in months if month.get("resumo_versao") is None]
+    if not missing:
+        return months
+    row_keys = [month["RowKey"] for month in months]
+    entities = await query_table_async(connection_string, table_name, matricula, row_keys, missing, select=["RowKey"] + PAYLOAD_PROPERTIES)
+    return await asyncio.to_thread(fill_summaries, months, missing, entities)
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    log_invocation()
+    start = time.perf_counter()
+    response = await handle_request_async(req)
+    await asyncio.to_thread(record_request, response, start)
+    return response
+
+async def handle_request_async(req: func.HttpRequest) -> func.HttpResponse:
+
+    # Verificar se é uma requisição OPTIONS (preflight)
+    if req.method.lower() == 'options':
+        return options_response()
+
+    # Busca por nome e agregados usam os clientes síncronos, em uma thread
+    if req.params.get('nome') or req.params.get('rollup'):
+        return await asyncio.to_thread(function_app.handle_request, req)
+
+    params, error = parse_report_request(req)
+    if error is not None:
+        return error
+    connection_string, table_name, matricula = params["connection_string"], params["table_name"], params["matricula"]
+
+    # O modo em lote já distribui as matrículas entre threads
+    if params["matriculas"]:
+        from batch_reports import parse_matriculas
+
+        return await asyncio.to_thread(
+            function_app.batch_response, connection_string, table_name, parse_matriculas(params["matriculas"]),
+            params["start_date"], params["end_date"], params["output_format"], params["combined"],
+        )
+
+    try:
+        return await report_response_async(req, params)
+    except TableQueryError:
+        return table_error_response()
+
+async def report_response_async(req, params):
+    connection_string, table_name, matricula = params["connection_string"], params["table_name"], params["matricula"]
+    date_range = get_date_range(params["start_date"], params["end_date"])
+
+    # Versões (ou resumos) dos meses do período, em consultas por intervalo paralelas
+    select = SUMMARY_SELECT if params["summary_only"] else VERSION_SELECT
+    versions = await query_table_async(connection_string, table_name, matricula, date_range, select=select)
+
+    if not versions:
+        return not_found_response(matricula)
+
+    etag, headers, gzip_body = report_headers(req, params, versions)
+    response = await asyncio.to_thread(cached_response, req, etag, headers)
+    if response is not None:
+        return response
+
+    if params["summary_only"]:
+        summaries = await complete_summaries_async(connection_string, table_name, matricula, versions)
+        output = await asyncio.to_thread(build_report, params, gzip_body, summaries=summaries)
+    else:
+        results, cached_months_count, fetched_months = await fetch_records_async(connection_string, table_name, matricula, versions)
+
+        if not results:
+            return not_found_response(matricula)
+
+        headers['X-Cache-Months-Hit'] = str(cached_months_count)
+        headers['X-Cache-Months-Fetched'] = str(fetched_months)
+
+        # Achatar os meses e gerar o relatório (limitado por CPU) fora do event loop
+        output = await asyncio.to_thread(build_report, params, gzip_body, results=results)
+
+    await asyncio.to_thread(_report_cache.put, etag, output)
+
+    return func.HttpResponse(
+        body=output,
+        status_code=200,
+        headers=headers
+    )
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+
+class ManifestoIngestao:
+    """
+    Manifesto local da ingestão no Azure Table Storage.
+
+    Guarda, para cada arquivo de dados, o hash do conteúdo, o deslocamento do último
+    registro confirmado e se o arquivo foi concluído, e o hash de conteúdo de cada
+    entidade gravada (para que as gravações com upsert ignorem registros inalterados).
+    Usa SQLite para que vários processos possam atualizar o mesmo manifesto.
+
+    Parâmetros:
+        caminho (str): Caminho do arquivo SQLite do manifesto
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self.conexao.execute(
+            """
+            CREATE TABLE IF NOT EXISTS arquivos (
+                arquivo TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                deslocamento INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                concluido INTEGER NOT NULL,
+                atualizado_em TEXT NOT NULL
+            )
+            """
+        )
+        self.conexao.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entidades (
+                particao TEXT NOT NULL,
+                linha TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (particao, linha)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def fechar(self):
+        self.conexao.close()
+
+    @staticmethod
+    def hash_arquivo(caminho_arquivo, tamanho_bloco=1 << 20):
+        """Calcula o hash SHA-256 do conteúdo de um arquivo."""
+        sha = hashlib.sha256()
+        with open(caminho_arquivo, "rb") as f:
+            for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+                sha.update(bloco)
+        return sha.hexdigest()
+
+    def situacao(self, caminho_arquivo, hash_conteudo):
+        """
+        Consulta o progresso de um arquivo.
+
+        Parâmetros:
+            caminho_arquivo (str): Caminho do arquivo de dados
+            hash_conteudo (str): Hash atual do conteúdo do arquivo
+
+        Retorna:
+            tuple: Deslocamento do próximo registro a processar e se o arquivo já foi concluído.
+                   Um arquivo cujo conteúdo mudou recomeça do início.
+        """
+        linha = self.conexao.execute(
+            "SELECT hash, deslocamento, concluido FROM arquivos WHERE arquivo = ?",
+            (os.path.basename(caminho_arquivo),),
+        ).fetchone()
+        if linha is None or linha[0] != hash_conteudo:
+            return 0, False
+        return linha[1], bool(linha[2])
+
+    def registrar_progresso(self, caminho_arquivo, hash_conteudo, deslocamento, total, concluido=False):
+        """Registra o deslocamento do último registro confirmado de um arquivo."""
+        self.conexao.execute(
+            """
+            INSERT INTO arquivos (arquivo, hash, deslocamento, total, concluido, atualizado_em)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(arquivo) DO UPDATE SET
+                hash = excluded.hash,
+                deslocamento = excluded.deslocamento,
+                total = excluded.total,
+                concluido = excluded.concluido,
+                atualizado_em = excluded.atualizado_em
+            """,
+            (
+                os.path.basename(caminho_arquivo),
+                hash_conteudo,
+                deslocamento,
+                total,
+                int(concluido),
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+
+    def concluir(self, caminho_arquivo, hash_conteudo, total):
+        """Marca um arquivo como totalmente ingerido."""
+        self.registrar_progresso(caminho_arquivo, hash_conteudo, total, total, concluido=True)
+
+    def hashes_entidades(self, chaves):
+        """
+        Consulta os hashes de conteúdo das entidades gravadas.
+
+        Parâmetros:
+            chaves (iterable): Pares (PartitionKey, RowKey)
+
+        Retorna:
+            dict: (PartitionKey, RowKey) -> hash, apenas para as entidades conhecidas
+        """
+        hashes = {}
+        for chave in chaves:
+            linha = self.conexao.execute(
+                "SELECT hash FROM entidades WHERE particao = ? AND linha = ?", chave
+            ).fetchone()
+            if linha is not None:
+                hashes[chave] = linha[0]
+        return hashes
+
+    def registrar_hashes(self, entidades, propriedade="hash_conteudo"):
+        """Registra o hash de conteúdo de entidades confirmadas na tabela."""
+        linhas = [
+            (entity["PartitionKey"], entity["RowKey"], entity[propriedade])
+            for entity in entidades
+            if entity.get(propriedade)
+        ]
+        if not linhas:
+            return
+        self.conexao.execute("BEGIN")
+        try:
+            self.conexao.executemany(
+                "INSERT OR REPLACE INTO entidades (particao, linha, hash) VALUES (?, ?, ?)", linhas
+            )
+        except Exception:
+            self.conexao.execute("ROLLBACK")
+            raise
+        self.conexao.execute("COMMIT")
@@ -2,11 +2,18 @@ import os
 import argparse
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-import pandas as pd
 from azure.data.tables import TableServiceClient, TableClient
 from dotenv import load_dotenv
-import openpyxl
 import json
+import batch_reports
+from month_summary import SUMMARY_SELECT, merge_summaries, summarize_month
+from payload_codec import PAYLOAD_PROPERTIES, decode_payload
+from pipeline_metrics import metrics
+import report_formats
+import report_writer
+from payroll_frame import PayrollFrame
+from payroll_store import consultar_matricula
+from table_queries import contiguous_runs, query_period
 
 # Carregar variáveis do arquivo .env
 load_dotenv()
@@ -28,11 +35,48 @@ def parse_args():
     )
     parser.add_argument("--start_date", help="Start date (DD/MM/YYYY)", required=True)
     parser.add_argument("--end_date", help="End date (DD/MM/YYYY)", required=True)
+    parser.add_argument("--matricula", help="Registration number (PartitionKey)")
     parser.add_argument(
-        "--matricula", help="Registration number (PartitionKey)", required=True
+        "--matriculas",
+        help="Batch mode: comma-separated registration numbers",
     )
-    parser.add_argument("--output", help="Output file path", default="registros.xlsx")
-    return parser.parse_args()
+    parser.add_argument(
+        "--matriculas_file",
+        help="Batch mode: text file with one registration number per line",
+    )
+    parser.add_argument(
+        "--summary_only",
+        action="store_true",
+        help="Write only the per-event summary, read from the monthly summaries stored at ingest",
+    )
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="Batch mode: write one combined Parquet file instead of a ZIP of reports",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=batch_reports.MAX_WORKERS,
+        help="Batch mode: registration numbers fetched concurrently",
+    )
+    parser.add_argument(
+        "--output",
+        help="Output file path (default: registros.xlsx, or registros_lote.zip/.parquet in batch mode)",
+    )
+    parser.add_argument(
+        "--format",
+        help="Output format (default: inferred from --output; .gz outputs are gzip-compressed)",
+        choices=sorted(report_formats.MEDIA_TYPES),
+    )
+    parser.add_argument(
+        "--dataset",
+        help="Local Parquet dataset folder (built by payroll_store.py) to read instead of Azure Table Storage",
+    )
+    args = parser.parse_args()
+    if not (args.matricula or args.matriculas or args.matriculas_file):
+        parser.error("one of --matricula, --matriculas or --matriculas_file is required")
+    return args
 
 
 def get_date_range(start_date_str, end_date_str):
@@ -44,36 +88,48 @@ def get_date_range(start_date_str, end_date_str):
     date_list = []
 
     while current_date <= end_date:
-        month_year = current_date.strftime("%m_%Y")
+        month_year = current_date.strftime("%Y_%m")
         date_list.append(month_year)
         current_date += relativedelta(months=1)
 
     return date_list
 
 
-def query_table(connection_string, table_name, matricula, row_keys):
-    results = []
+def get_table_client(connection_string, table_name):
+    table_service = TableServiceClient.from_connection_string(connection_string)
+    return table_service.get_table_client(table_name)
+
 
+def query_table(connection_string, table_name, matricula, row_keys):
     # Connect to the table service
-    table_service = TableServiceClient.from_connection_string(connection_string)
-    table_client = table_service.get_table_client(table_name)
-
-    for row_key in row_keys:
-        try:
-            # Query with PartitionKey and RowKey
-            entity = table_client.get_entity(partition_key=matricula, row_key=row_key)
-            results.append(entity)
-        except Exception as e:
-            print(
-                f"Error fetching record for matricula {matricula}, date {row_key}: {e}"
-            )
+    table_client = get_table_client(connection_string, table_name)
+
+    if not row_keys:
+        return []
+
+    # A single range query over the chronologically sortable RowKeys (YYYY_MM)
+    try:
+        with metrics.timer("table_request", operation="query"):
+            results = query_period(table_client, matricula, row_keys[0], row_keys[-1])
+        metrics.increment("entities_read", len(results))
+        return results
+    except Exception as e:
+        metrics.increment("table_errors", operation="query")
+        print(
+            f"Error fetching records for matricula {matricula}, period {row_keys[0]} to {row_keys[-1]}: {e}"
+        )
+        return []
 
-    return results
 
+def query_dataset(dataset_path, matricula, start_date_str, end_date_str):
+    # Scan the local dataset; partitions outside the period are never opened
+    table = consultar_matricula(
+        dataset_path, matricula, start_date_str[3:], end_date_str[3:]
+    )
+    return PayrollFrame.from_dataset_table(table)
 
-def main():
-    args = parse_args()
 
+def load_from_table(args, resumo):
     # Validate connection string
     if not args.connection_string:
         print("Error: Azure Storage connection string not provided.")
@@ -96,84 +152,139 @@ def main():
         )
         return
 
-    folha_de_pagamento = {}
+    with metrics.timer("payload_decode"):
+        records = [decode_payload(record) for record in results]
 
-    resumo = {
-        "matricula": args.matricula,
-        "data_inicio": args.start_date,
-        "data_fim": args.end_date,
-        "nome": "",
-        "data_admissao": "",
-    }
-    
-    # Process each record
-    for record in results:
-        dict_record = dict(record)
-        # print(json.loads(dict_record["dados_json"])["unidadeGestora"])
-        # continue
-        record_data = json.loads(dict_record["dados_json"])
-        if resumo["nome"] == "":
-            resumo["nome"] = record_data["matricula"]["nome"]
-        if resumo["data_admissao"] == "":
-            resumo["data_admissao"] = record_data["matricula"]["dataAdmissao"]
-        for dados in record_data["listFolha"]:
-            # print(dados)
-            # continue
-            data = dados["data"]
-            divisor = dados["historico"]["nrHorasMensais"]
-            tipo_calculo = dados["tipoCalculo"]["tipoDenominacao"]
-            for evento in dados["listEventos"]:
-                # print(evento)
-                # continue
-                if evento["denominacao"] not in folha_de_pagamento:
-                    folha_de_pagamento[evento["denominacao"]] = []
-                folha_de_pagamento[evento["denominacao"]].append(
-                    {
-                        "data": data,
-                        "referência": evento["valorReferencia"],
-                        "valor": (
-                            evento["valorEvento"]
-                            if evento["tipoEventoDenominacao"] == "Provento"
-                            else -evento["valorEvento"]
-                        ),
-                        "divisor": divisor,
-                        "tipo_calculo": tipo_calculo,
-                    }
-                )
-    
-    print(folha_de_pagamento)
-    
-    # Create a summary DataFrame first
-    summary_data = []
-    for key, value in folha_de_pagamento.items():
-        df_temp = pd.DataFrame(value)
-        summary_data.append({
-            'Evento': key,
-            'Total de Registros': len(df_temp),
-            'Valor Total': df_temp['valor'].sum(),
-            'Período': f"{args.start_date} até {args.end_date}",
-            'Matrícula': args.matricula,
-            'Nome': resumo["nome"],
-            'Data de Admissão': resumo["data_admissao"],
-        })
-    
-    summary_df = pd.DataFrame(summary_data)
-    
-    # Create Excel file with summary as first sheet
-    with pd.ExcelWriter(args.output, engine='openpyxl') as writer:
-        # Write the summary sheet first
-        summary_df.to_excel(writer, sheet_name='Resumo', index=False)
+    # Flatten every fetched month into one columnar frame
+    with metrics.timer("frame_build"):
+        frame = PayrollFrame.from_records(records)
+    resumo["nome"] = frame.nome
+    resumo["data_admissao"] = frame.data_admissao
+
+    return frame
+
+
+def load_summary_from_table(args, resumo):
+    if not args.connection_string:
+        print("Error: Azure Storage connection string not provided.")
+        return
+
+    date_range = get_date_range(args.start_date, args.end_date)
+    table_client = get_table_client(args.connection_string, args.table_name)
+
+    # Projected query: only the small summary properties, never the stored record
+    with metrics.timer("table_request", operation="query_summary"):
+        months = query_period(
+            table_client, args.matricula, date_range[0], date_range[-1], select=SUMMARY_SELECT
+        )
+    if not months:
+        print(
+            f"No records found for matricula {args.matricula} in the specified date range."
+        )
+        return
+
+    # Entities written before the summaries existed are summarised from their stored record
+    missing = [month["RowKey"] for month in months if month.get("resumo_versao") is None]
+    if missing:
+        # Uma consulta por sequência de meses sem resumo, sem baixar o registro dos demais
+        decoded = {
+            entity["RowKey"]: summarize_month(decode_payload(entity))
+            for run in contiguous_runs([month["RowKey"] for month in months], missing)
+            for entity in query_period(
+                table_client, args.matricula, run[0], run[-1], select=["RowKey"] + PAYLOAD_PROPERTIES
+            )
+        }
+        months = [decoded.get(month["RowKey"], month) if month.get("resumo_versao") is None else month for month in months]
+
+    summary, resumo["nome"], resumo["data_admissao"] = merge_summaries(months)
+    return summary
+
+
+def run_batch(args):
+    matriculas = batch_reports.parse_matriculas(args.matriculas or "")
+    if args.matriculas_file:
+        matriculas += [
+            matricula
+            for matricula in batch_reports.read_matriculas_file(args.matriculas_file)
+            if matricula not in matriculas
+        ]
+
+    if args.dataset:
+        def load_frame(matricula):
+            return query_dataset(args.dataset, matricula, args.start_date, args.end_date)
+    else:
+        if not args.connection_string:
+            print("Error: Azure Storage connection string not provided.")
+            return
+        # One client (and connection pool) shared by every worker
+        table_client = get_table_client(args.connection_string, args.table_name)
+        date_range = get_date_range(args.start_date, args.end_date)
+
+        def load_frame(matricula):
+            with metrics.timer("table_request", operation="query"):
+                results = query_period(table_client, matricula, date_range[0], date_range[-1])
+            metrics.increment("entities_read", len(results))
+            with metrics.timer("payload_decode"):
+                records = [decode_payload(record) for record in results]
+            return PayrollFrame.from_records(records)
+
+    def on_progress(result, done, total):
+        error = f" - {result['erro']}" if result["erro"] else ""
+        print(f"[{done}/{total}] {result['matricula']}: {result['situacao']} ({result['linhas']} rows){error}")
+
+    if args.combined:
+        output = args.output or "registros_lote.parquet"
+        results = batch_reports.write_combined(
+            output, matriculas, load_frame, args.start_date, args.end_date,
+            max_workers=args.workers, on_progress=on_progress,
+        )
+    else:
+        output = args.output or "registros_lote.zip"
+        results = batch_reports.write_zip(
+            output, matriculas, load_frame, args.start_date, args.end_date,
+            args.format or "xlsx", max_workers=args.workers, on_progress=on_progress,
+        )
+
+    ok = sum(1 for result in results if result["situacao"] == "ok")
+    errors = sum(1 for result in results if result["situacao"] == "erro")
+    print(f"Batch saved to {output}: {ok} reports, {len(results) - ok - errors} without records, {errors} errors")
+
+
+def output_format(args):
+    if args.format:
+        return args.format
+    name = args.output[:-3] if args.output.endswith(".gz") else args.output
+    extension = name.rsplit(".", 1)[-1].lower()
+    return extension if extension in report_formats.MEDIA_TYPES else "xlsx"
+
+
+def write_report(args, frame, resumo, summary=None):
+    # Without a frame only the summary is written
+    file_format = output_format(args)
+    with metrics.timer("report_build", format=file_format):
+        if summary is None:
+            summary = frame.summary()
+        if file_format != "xlsx":
+            # Stream the flattened rows plus the summary; text formats are gzip-compressed on the fly for .gz outputs
+            rows = frame.rows() if frame is not None else ()
+            chunks = report_formats.report_chunks(file_format, rows, resumo, summary)
+            if file_format in report_formats.TEXT_FORMATS and args.output.endswith(".gz"):
+                chunks = report_formats.gzip_chunks(chunks)
+            with open(args.output, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            print(f"Records and summary saved to {args.output} ({file_format})")
+            return
+
+        if frame is None:
+            report_writer.write_summary(args.output, summary, resumo)
+            print(f"Summary saved to {args.output} in sheet Resumo")
+            return
+
+        # Stream the summary and one sheet per event into a write-only workbook
+        sheet_names = report_writer.write_report(args.output, frame, resumo)
         print(f"Summary saved to {args.output} in sheet Resumo")
-        
-        # Then write each event to its own sheet
-        for key, value in folha_de_pagamento.items():
-            df = pd.DataFrame(value)
-            # Replace invalid characters in sheet names
-            valid_sheet_name = key.replace('/', '_').replace('\\', '_').replace('?', '_').replace('*', '_').replace('[', '_').replace(']', '_').replace(':', '_')
-            # Truncate sheet name if too long (Excel limit is 31 characters)
-            valid_sheet_name = valid_sheet_name[:31]
-            # Save each DataFrame to a different sheet
-            df.to_excel(writer, sheet_name=valid_sheet_name, index=False)
+        for valid_sheet_name in sheet_names:
             print(f"Records saved to {args.output} in sheet {valid_sheet_name}")
             
     # # Convert results to DataFrame
@@ -198,5 +309,53 @@ def main():
     # print(f"Records saved to {args.output}")
 
 
+def main():
+    args = parse_args()
+
+    if args.matriculas or args.matriculas_file:
+        run_batch(args)
+        return
+    args.output = args.output or "registros.xlsx"
+
+    resumo = {
+        "matricula": args.matricula,
+        "data_inicio": args.start_date,
+        "data_fim": args.end_date,
+        "nome": "",
+        "data_admissao": "",
+    }
+
+    if args.dataset:
+        frame = query_dataset(
+            args.dataset, args.matricula, args.start_date, args.end_date
+        )
+        resumo["nome"] = frame.nome
+        resumo["data_admissao"] = frame.data_admissao
+        if not len(frame):
+            print(
+                f"No records found for matricula {args.matricula} in the specified date range."
+            )
+            return
+        if args.summary_only:
+            write_report(args, None, resumo, frame.summary())
+            return
+    elif args.summary_only:
+        summary = load_summary_from_table(args, resumo)
+        if summary is None:
+            return
+        write_report(args, None, resumo, summary)
+        return
+    else:
+        frame = load_from_table(args, resumo)
+        if frame is None:
+            return
+
+    write_report(args, frame, resumo)
+
+
 if __name__ == "__main__":
-    main()
+    metrics.configure("consulta")
+    try:
+        main()
+    finally:
+        metrics.report()
@@ -0,0 +1,106 @@
+import argparse
+import os
+from collections import defaultdict
+
+from azure.data.tables import TableServiceClient
+from dotenv import load_dotenv
+
+from table_batches import MAX_OPERACOES_LOTE, agrupar_em_lotes
+from table_queries import ROW_KEY_ANTIGA, row_key
+
+# Carregar variáveis do arquivo .env
+load_dotenv()
+
+# Cada entidade migrada gera duas operações (upsert da nova e delete da antiga) na mesma transação
+ENTIDADES_POR_TRANSACAO = MAX_OPERACOES_LOTE // 2
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Migrate RowKeys from MM_YYYY to the chronologically sortable YYYY_MM format "
+            "(deploy the current azure_function/ first: the old RowKeys are deleted)"
+        )
+    )
+    parser.add_argument(
+        "--connection_string",
+        help="Azure storage connection string",
+        default=os.getenv("AZURE_TABLE_CONNECTION_STRING"),
+    )
+    parser.add_argument(
+        "--table_name",
+        help="Azure table name",
+        default=os.getenv("AZURE_TABLE_NAME", "RegistrosTabela"),
+    )
+    parser.add_argument(
+        "--dry_run", action="store_true", help="Only count the entities that would be migrated"
+    )
+    parser.add_argument(
+        "--results_per_page", type=int, default=1000, help="Entities read per page"
+    )
+    return parser.parse_args()
+
+
+def migrar_particao(table_client, entidades):
+    """
+    Migra as entidades antigas de uma partição em transações que gravam a entidade com a
+    nova RowKey e removem a antiga atomicamente. Os lotes são limitados em quantidade e em
+    bytes (as entidades com o registro completo podem ter perto de 1 MiB cada).
+
+    Retorna:
+        int: Quantidade de entidades migradas
+    """
+    migradas = 0
+    lotes, avulsas = agrupar_em_lotes(entidades, ENTIDADES_POR_TRANSACAO)
+    for lote in lotes + [[entidade] for entidade in avulsas]:
+        operacoes = []
+        for entidade in lote:
+            nova = dict(entidade)
+            nova["RowKey"] = row_key(entidade["RowKey"])
+            operacoes.append(("upsert", nova))
+            operacoes.append(("delete", {"PartitionKey": entidade["PartitionKey"], "RowKey": entidade["RowKey"]}))
+        table_client.submit_transaction(operacoes)
+        migradas += len(operacoes) // 2
+    return migradas
+
+
+def main():
+    args = parse_args()
+
+    if not args.connection_string:
+        print("Error: Azure Storage connection string not provided.")
+        return
+
+    table_service = TableServiceClient.from_connection_string(args.connection_string)
+    table_client = table_service.get_table_client(args.table_name)
+
+    # Lê a tabela página a página e migra as entidades antigas de cada página por partição.
+    # As novas RowKeys (aaaa_mm) não casam com o formato antigo, então não são migradas de novo
+    lidas = 0
+    encontradas = 0
+    migradas = 0
+    falhas = 0
+    for page in table_client.list_entities(results_per_page=args.results_per_page).by_page():
+        antigas = defaultdict(list)
+        for entidade in page:
+            lidas += 1
+            if ROW_KEY_ANTIGA.match(entidade["RowKey"]):
+                antigas[entidade["PartitionKey"]].append(entidade)
+                encontradas += 1
+
+        if not args.dry_run:
+            for partition_key, entidades in antigas.items():
+                try:
+                    migradas += migrar_particao(table_client, entidades)
+                except Exception as e:
+                    falhas += len(entidades)
+                    print(f"Erro ao migrar a partição {partition_key}: {e}")
+        print(f"{lidas} entidades lidas, {encontradas} com RowKey antiga, {migradas} migradas, {falhas} com falha")
+
+    if args.dry_run:
+        print(f"Dry run: {encontradas} entidades seriam migradas.")
+    else:
+        print(f"Migração concluída: {migradas} entidades migradas, {falhas} com falha.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class MonthCache:
+    """
+    Cache LRU com TTL, limitado em número de entradas, para meses de folha já decodificados.
+
+    Cada entrada guarda a versão (ultimaAtualizacao, hash do conteúdo e ETag) da entidade de origem; uma leitura
+    com versão diferente invalida a entrada. Seguro para uso entre threads.
+
+    Parâmetros:
+        max_entries (int): Número máximo de meses em cache
+        ttl_seconds (float): Tempo de vida de cada entrada, em segundos
+    """
+
+    def __init__(self, max_entries=5000, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, version):
+        """Retorna o valor em cache para key se ainda válido e na mesma versão, senão None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            cached_version, expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            if cached_version != version:
+                del self._entries[key]
+                self.stats["invalidations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, version, value):
+        """Guarda um valor, descartando as entradas usadas há mais tempo se o limite for atingido."""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def snapshot(self):
+        """Retorna uma cópia dos contadores e o tamanho atual do cache."""
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
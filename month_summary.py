@@ -0,0 +1,93 @@
+import json
+
+# Versão do resumo mensal gravado junto de cada entidade (entidades sem ela não têm resumo).
+# Na versão 2, nrHorasMensais traz todos os divisores distintos do mês, como tipoCalculo
+SUMMARY_VERSION = 2
+
+# Propriedades lidas pelas consultas que só precisam do resumo (nunca incluem o registro completo)
+SUMMARY_SELECT = [
+    "RowKey",
+    "ultimaAtualizacao",
+    "hash_conteudo",
+    "resumo_versao",
+    "nome",
+    "dataAdmissao",
+    "resumo_eventos",
+    "total_proventos",
+    "total_descontos",
+    "nrHorasMensais",
+    "tipoCalculo",
+]
+
+
+def summarize_month(registro):
+    """
+    Resume o registro de um servidor em uma referência nas propriedades pequenas gravadas
+    junto da entidade: totais por evento (quantidade e valor com sinal, na ordem de primeira
+    aparição), total de proventos e de descontos e os valores distintos de nrHorasMensais e
+    tipoCalculo das folhas do mês (separados por vírgula, na ordem de primeira aparição).
+
+    Parâmetros:
+        registro (dict): Registro de um servidor (com "matricula" e "listFolha")
+
+    Retorna:
+        dict: Propriedades do resumo mensal
+    """
+    eventos = {}
+    proventos = 0.0
+    descontos = 0.0
+    divisores = []
+    tipos_calculo = []
+    for folha in registro.get("listFolha", []):
+        divisor = folha["historico"]["nrHorasMensais"]
+        tipo_calculo = folha["tipoCalculo"]["tipoDenominacao"]
+        if divisor not in divisores:
+            divisores.append(divisor)
+        if tipo_calculo not in tipos_calculo:
+            tipos_calculo.append(tipo_calculo)
+        for evento in folha["listEventos"]:
+            if evento["tipoEventoDenominacao"] == "Provento":
+                valor = evento["valorEvento"]
+                proventos += valor
+            else:
+                valor = -evento["valorEvento"]
+                descontos += evento["valorEvento"]
+            totais = eventos.setdefault(evento["denominacao"], [0, 0.0])
+            totais[0] += 1
+            totais[1] += valor
+
+    matricula = registro.get("matricula", {})
+    return {
+        "resumo_versao": SUMMARY_VERSION,
+        "nome": matricula.get("nome") or "",
+        "dataAdmissao": matricula.get("dataAdmissao") or "",
+        "resumo_eventos": json.dumps(eventos, ensure_ascii=False, separators=(",", ":")),
+        "total_proventos": float(proventos),
+        "total_descontos": float(descontos),
+        "nrHorasMensais": ", ".join(f"{float(divisor):g}" for divisor in divisores),
+        "tipoCalculo": ", ".join(tipos_calculo),
+    }
+
+
+def merge_summaries(months):
+    """
+    Soma os resumos mensais de um período no resumo por evento do relatório.
+
+    Parâmetros:
+        months (list): Resumos mensais (dicts com as propriedades de summarize_month), em ordem cronológica
+
+    Retorna:
+        tuple: Lista de (evento, total de registros, valor total) na ordem de primeira aparição,
+               nome e data de admissão
+    """
+    totals = {}
+    nome = ""
+    data_admissao = ""
+    for month in months:
+        nome = nome or month.get("nome") or ""
+        data_admissao = data_admissao or month.get("dataAdmissao") or ""
+        for evento, (count, total) in json.loads(month["resumo_eventos"]).items():
+            current = totals.setdefault(evento, [0, 0.0])
+            current[0] += count
+            current[1] += total
+    return [(evento, count, total) for evento, (count, total) in totals.items()], nome, data_admissao
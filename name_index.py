@@ -0,0 +1,264 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+# Tamanho mínimo dos prefixos indexados e aceitos na busca
+MIN_PREFIX = 3
+
+# Palavras dos nomes que não são indexadas
+STOPWORDS = {"DA", "DAS", "DE", "DI", "DO", "DOS", "DU", "E"}
+
+# Limite de operações por transação do Azure Table Storage
+MAX_BATCH_OPERATIONS = 100
+
+# Entradas lidas por página nas buscas (as demais palavras da consulta são conferidas no nome)
+LOOKUP_PAGE_SIZE = 200
+
+# Máximo de matrículas candidatas ordenadas por busca (limita a leitura de prefixos muito comuns)
+MAX_SEARCH_CANDIDATES = 1000
+
+
+def normalize(text):
+    """Remove acentos, converte para maiúsculas e troca o que não for letra ou número por espaço."""
+    folded = unicodedata.normalize("NFKD", text or "")
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return re.sub(r"[^A-Z0-9]+", " ", folded.upper()).strip()
+
+
+def tokens(text):
+    """Palavras normalizadas de um nome ou consulta, sem as STOPWORDS."""
+    return [token for token in normalize(text).split() if token not in STOPWORDS]
+
+
+def index_keys(nome):
+    """Chaves do índice de um nome: todos os prefixos (a partir de MIN_PREFIX letras) de cada palavra."""
+    keys = set()
+    for token in tokens(nome):
+        if len(token) < MIN_PREFIX:
+            keys.add(token)
+            continue
+        for size in range(MIN_PREFIX, len(token) + 1):
+            keys.add(token[:size])
+    return keys
+
+
+def rank_matches(query_tokens, candidates, limit):
+    """
+    Ordena os candidatos (dicts com matricula, nome e dataAdmissao): primeiro os nomes que
+    contêm todas as palavras da consulta por inteiro, depois os demais, em ordem alfabética.
+    """
+    def key(candidate):
+        name_tokens = set(tokens(candidate["nome"]))
+        partial = sum(1 for token in query_tokens if token not in name_tokens)
+        return partial, normalize(candidate["nome"]), candidate["matricula"]
+
+    return sorted(candidates, key=key)[:limit]
+
+
+def matches_query(query_tokens, nome):
+    """Indica se todas as palavras da consulta são palavras (ou prefixos de palavras) indexadas do nome."""
+    keys = index_keys(nome)
+    return all(token in keys for token in query_tokens)
+
+
+class NameIndex(ABC):
+    """
+    Índice nome -> matrícula. As entradas são acumuladas com add() e gravadas com flush();
+    search() busca por palavras ou prefixos de palavras (todas precisam casar).
+
+    As subclasses implementam _write(entradas por chave) e _lookup(chave, tamanho da página).
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._indexed = set()
+        self._lock = threading.Lock()
+
+    def add(self, matricula, nome, data_admissao=""):
+        """Agenda a indexação do nome de uma matrícula (ignorada se já indexada neste processo)."""
+        matricula = str(matricula)
+        if not nome:
+            return
+        with self._lock:
+            if (matricula, nome) in self._indexed:
+                return
+            self._indexed.add((matricula, nome))
+            self._pending[matricula] = (nome, data_admissao or "")
+
+    def flush(self):
+        """Grava as entradas pendentes. Retorna a quantidade de matrículas indexadas."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        by_key = defaultdict(list)
+        for matricula, (nome, data_admissao) in pending.items():
+            for key in index_keys(nome):
+                by_key[key].append({"matricula": matricula, "nome": nome, "dataAdmissao": data_admissao})
+        try:
+            self._write(by_key)
+        except Exception:
+            # Permite uma nova tentativa no próximo flush
+            with self._lock:
+                for matricula, entry in pending.items():
+                    self._pending.setdefault(matricula, entry)
+                    self._indexed.discard((matricula, entry[0]))
+            raise
+        return len(pending)
+
+    def search(self, query, limit=20):
+        """
+        Busca matrículas pelo nome. Cada palavra da consulta (com pelo menos MIN_PREFIX
+        letras, ou a palavra inteira se for mais curta) deve ser uma palavra ou prefixo de
+        palavra do nome; acentos e maiúsculas/minúsculas são ignorados.
+
+        Só a partição da palavra mais longa (a mais seletiva) é lida, página a página, e as
+        demais palavras são conferidas no nome de cada entrada; a leitura para em
+        MAX_SEARCH_CANDIDATES matrículas, de modo que um prefixo comum não carrega a partição
+        inteira. Todas as candidatas são ordenadas por rank_matches antes de aplicar limit.
+
+        Retorna:
+            list: Dicts com matricula, nome e dataAdmissao, no máximo limit
+        """
+        query_tokens = tokens(query)
+        if not query_tokens or all(len(token) < MIN_PREFIX for token in query_tokens) or limit < 1:
+            return []
+        longest = max(query_tokens, key=len)
+        max_candidates = max(limit, MAX_SEARCH_CANDIDATES)
+        found = {}
+        for entry in self._lookup(longest, LOOKUP_PAGE_SIZE):
+            if entry["matricula"] not in found and matches_query(query_tokens, entry["nome"]):
+                found[entry["matricula"]] = entry
+                if len(found) >= max_candidates:
+                    break
+        return rank_matches(query_tokens, list(found.values()), limit)
+
+    @abstractmethod
+    def _write(self, by_key):
+        """Grava as entradas ({chave: [entradas]}) no armazenamento do índice."""
+
+    @abstractmethod
+    def _lookup(self, key, page_size):
+        """Itera as entradas de uma chave, lendo page_size por vez (a iteração pode parar a qualquer momento)."""
+
+
+class LocalNameIndex(NameIndex):
+    """
+    Índice de nomes em um arquivo SQLite local, para uso e testes sem o Azure.
+
+    Parâmetros:
+        path (str): Caminho do arquivo SQLite
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS nomes (
+                chave TEXT NOT NULL,
+                matricula TEXT NOT NULL,
+                nome TEXT NOT NULL,
+                data_admissao TEXT NOT NULL,
+                PRIMARY KEY (chave, matricula)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, by_key):
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO nomes (chave, matricula, nome, data_admissao) VALUES (?, ?, ?, ?)",
+                [
+                    (key, entry["matricula"], entry["nome"], entry["dataAdmissao"])
+                    for key, entries in by_key.items()
+                    for entry in entries
+                ],
+            )
+
+    def _lookup(self, key, page_size):
+        cursor = self._connection().execute(
+            "SELECT matricula, nome, data_admissao FROM nomes WHERE chave = ?", (key,)
+        )
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                return
+            for matricula, nome, data_admissao in rows:
+                yield {"matricula": matricula, "nome": nome, "dataAdmissao": data_admissao}
+
+
+class TableNameIndex(NameIndex):
+    """
+    Índice de nomes em uma tabela do Azure Table Storage: PartitionKey é a palavra ou
+    prefixo normalizado e RowKey a matrícula, de modo que cada busca por palavra é uma
+    consulta a uma única partição. As gravações são upserts em transações por partição.
+
+    Parâmetros:
+        table_client (TableClient): Cliente da tabela do índice
+    """
+
+    def __init__(self, table_client):
+        super().__init__()
+        self.table_client = table_client
+
+    def _write(self, by_key):
+        for key, entries in by_key.items():
+            for start in range(0, len(entries), MAX_BATCH_OPERATIONS):
+                operations = [
+                    ("upsert", {
+                        "PartitionKey": key,
+                        "RowKey": entry["matricula"],
+                        "nome": entry["nome"],
+                        "dataAdmissao": entry["dataAdmissao"],
+                    })
+                    for entry in entries[start:start + MAX_BATCH_OPERATIONS]
+                ]
+                self.table_client.submit_transaction(operations)
+
+    def _lookup(self, key, page_size):
+        # As páginas são pedidas sob demanda: parar a iteração encerra a consulta
+        entities = self.table_client.query_entities(
+            "PartitionKey eq @chave",
+            parameters={"chave": key},
+            select=["RowKey", "nome", "dataAdmissao"],
+            results_per_page=page_size,
+        )
+        for entity in entities:
+            yield {"matricula": entity["RowKey"], "nome": entity.get("nome", ""), "dataAdmissao": entity.get("dataAdmissao", "")}
+
+
+def index_table_name(table_name):
+    """Nome da tabela do índice de nomes (AZURE_NAME_INDEX_TABLE ou o nome da tabela principal + "Nomes")."""
+    return os.getenv("AZURE_NAME_INDEX_TABLE") or f"{table_name}Nomes"
+
+
+def open_name_index(connection_string=None, table_name=None):
+    """
+    Abre o índice de nomes: o arquivo SQLite de NAME_INDEX_PATH, se definido, senão a tabela
+    do índice no Azure Table Storage (criada se não existir).
+    """
+    local_path = os.getenv("NAME_INDEX_PATH")
+    if local_path:
+        return LocalNameIndex(local_path)
+
+    from azure.data.tables import TableServiceClient
+
+    table_service = TableServiceClient.from_connection_string(connection_string)
+    table_client = table_service.create_table_if_not_exists(index_table_name(table_name))
+    return TableNameIndex(table_client)
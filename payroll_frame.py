@@ -0,0 +1,114 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Colunas do frame achatado da folha de pagamento (mesmos nomes do dataset de payroll_store)
+FRAME_SCHEMA = pa.schema([
+    ("denominacao", pa.string()),
+    ("data", pa.string()),
+    ("valorReferencia", pa.float64()),
+    ("valorEvento", pa.float64()),
+    ("nrHorasMensais", pa.float64()),
+    ("tipoCalculo", pa.string()),
+])
+
+# Linhas convertidas em objetos Python por vez ao percorrer o frame (rows)
+ROWS_BATCH_SIZE = 10_000
+
+
+class PayrollFrame:
+    """
+    Folha de pagamento de uma matrícula em formato colunar: uma linha por evento de cada
+    folha, com valorEvento já com sinal (negativo para eventos que não são "Provento").
+
+    Parâmetros:
+        table (pyarrow.Table): Tabela com as colunas de FRAME_SCHEMA
+        nome (str): Nome do servidor
+        data_admissao (str): Data de admissão do servidor
+    """
+
+    def __init__(self, table, nome="", data_admissao=""):
+        self.table = table.select(FRAME_SCHEMA.names)
+        self.nome = nome
+        self.data_admissao = data_admissao
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Achata, em uma única passada, os registros decodificados (dicts com "matricula" e
+        "listFolha") em um frame colunar.
+        """
+        denominacao, data, referencia, valor, divisor, tipo_calculo, tipo_evento = [], [], [], [], [], [], []
+        nome = ""
+        data_admissao = ""
+        for record_data in records:
+            nome = nome or record_data["matricula"].get("nome") or ""
+            data_admissao = data_admissao or record_data["matricula"].get("dataAdmissao") or ""
+            for dados in record_data["listFolha"]:
+                eventos = dados["listEventos"]
+                count = len(eventos)
+                data.extend([dados["data"]] * count)
+                divisor.extend([dados["historico"]["nrHorasMensais"]] * count)
+                tipo_calculo.extend([dados["tipoCalculo"]["tipoDenominacao"]] * count)
+                for evento in eventos:
+                    denominacao.append(evento["denominacao"])
+                    referencia.append(evento["valorReferencia"])
+                    valor.append(evento["valorEvento"])
+                    tipo_evento.append(evento["tipoEventoDenominacao"])
+
+        valor = pa.array(valor, type=pa.float64())
+        signed = pc.if_else(pc.equal(pa.array(tipo_evento, type=pa.string()), "Provento"), valor, pc.negate(valor))
+        table = pa.Table.from_arrays(
+            [
+                pa.array(denominacao, type=pa.string()),
+                pa.array(data, type=pa.string()),
+                pa.array(referencia, type=pa.float64()),
+                signed,
+                pa.array(divisor, type=pa.float64()),
+                pa.array(tipo_calculo, type=pa.string()),
+            ],
+            schema=FRAME_SCHEMA,
+        )
+        return cls(table, nome, data_admissao)
+
+    @classmethod
+    def from_dataset_table(cls, table):
+        """Monta o frame a partir das linhas lidas do dataset local (payroll_store.consultar_matricula)."""
+        nome = ""
+        data_admissao = ""
+        if table.num_rows:
+            nome = table.column("nome")[0].as_py() or ""
+            data_admissao = table.column("dataAdmissao")[0].as_py() or ""
+        return cls(table, nome, data_admissao)
+
+    def rows(self):
+        """
+        Percorre as linhas como tuplas (evento, data, referência, valor, divisor, tipo_calculo),
+        agrupadas por evento na ordem em que cada evento aparece e, dentro do evento, na ordem original.
+        """
+        eventos = self.table.column("denominacao")
+        # Ordenação estável pela posição de primeira aparição de cada evento
+        order = pc.sort_indices(pc.index_in(eventos, value_set=pc.unique(eventos)))
+        # Só um lote de ROWS_BATCH_SIZE linhas é convertido em objetos Python por vez
+        for start in range(0, len(order), ROWS_BATCH_SIZE):
+            batch = self.table.take(order.slice(start, ROWS_BATCH_SIZE))
+            yield from zip(*(batch.column(name).to_pylist() for name in FRAME_SCHEMA.names))
+
+    def summary(self):
+        """
+        Agrega o frame por evento em uma única operação.
+
+        Retorna:
+            list: Tuplas (evento, total de registros, valor total) na ordem de primeira aparição
+        """
+        grouped = self.table.group_by("denominacao", use_threads=False).aggregate([
+            ("valorEvento", "count", pc.CountOptions(mode="all")),
+            ("valorEvento", "sum"),
+        ])
+        return list(zip(
+            grouped.column("denominacao").to_pylist(),
+            grouped.column("valorEvento_count").to_pylist(),
+            grouped.column("valorEvento_sum").to_pylist(),
+        ))
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from data_files import abrir_arquivo_dados, listar_arquivos_dados, referencia_do_arquivo, registro_do_item, unidade_do_arquivo
+
+# Esquema do dataset colunar local da folha de pagamento (uma linha por evento de cada folha)
+ESQUEMA_FOLHA = pa.schema([
+    ("matricula", pa.string()),
+    ("nome", pa.string()),
+    ("dataAdmissao", pa.string()),
+    ("data", pa.string()),
+    ("tipoCalculo", pa.string()),
+    ("nrHorasMensais", pa.float64()),
+    ("denominacao", pa.string()),
+    ("valorReferencia", pa.float64()),
+    ("valorEvento", pa.float64()),
+    ("tipoEventoDenominacao", pa.string()),
+    ("referencia", pa.string()),
+    ("codigo_unidade", pa.int32()),
+])
+
+# Partições do dataset: referência no formato ordenável aaaa_mm e código da unidade
+PARTICIONAMENTO = ds.partitioning(
+    pa.schema([("referencia", pa.string()), ("codigo_unidade", pa.int32())]), flavor="hive"
+)
+
+
+def referencia_ordenavel(referencia):
+    """Converte uma referência "mm/aaaa" (ou "mm_aaaa") para o formato ordenável "aaaa_mm"."""
+    mes, ano = referencia.replace("/", "_").split("_")
+    return f"{ano}_{mes}"
+
+
+def achatar_registro(registro):
+    """
+    Achata um registro do portal (registro -> listFolha -> listEventos) em linhas,
+    uma por evento, com o valorEvento negativo para eventos que não são "Provento".
+
+    Parâmetros:
+        registro (dict): Registro de um servidor em uma referência
+
+    Retorna:
+        generator: Dicionários com as colunas de ESQUEMA_FOLHA (exceto as de partição)
+    """
+    matricula = registro["matricula"]
+    for folha in registro.get("listFolha", []):
+        data = folha["data"]
+        divisor = folha["historico"]["nrHorasMensais"]
+        tipo_calculo = folha["tipoCalculo"]["tipoDenominacao"]
+        for evento in folha["listEventos"]:
+            yield {
+                "matricula": str(matricula["numero"]),
+                "nome": matricula.get("nome"),
+                "dataAdmissao": matricula.get("dataAdmissao"),
+                "data": data,
+                "tipoCalculo": tipo_calculo,
+                "nrHorasMensais": divisor,
+                "denominacao": evento["denominacao"],
+                "valorReferencia": evento["valorReferencia"],
+                "valorEvento": (
+                    evento["valorEvento"]
+                    if evento["tipoEventoDenominacao"] == "Provento"
+                    else -evento["valorEvento"]
+                ),
+                "tipoEventoDenominacao": evento["tipoEventoDenominacao"],
+            }
+
+
+def tabela_do_arquivo(arquivo_json):
+    """
+    Lê um arquivo de dados brutos (.json ou .json.gz) e o converte em uma tabela Arrow.
+
+    Parâmetros:
+        arquivo_json (str): Caminho do arquivo de dados brutos
+
+    Retorna:
+        pyarrow.Table: Linhas achatadas do arquivo, com as colunas de partição preenchidas
+    """
+    with abrir_arquivo_dados(arquivo_json) as file:
+        dados = json.load(file)
+
+    referencia = referencia_ordenavel(referencia_do_arquivo(arquivo_json))
+    codigo_unidade = unidade_do_arquivo(arquivo_json)
+    linhas = []
+    for item in dados.get("registros", []):
+        registro = registro_do_item(item)
+        if "numero" not in ((registro or {}).get("matricula") or {}):
+            continue
+        for linha in achatar_registro(registro):
+            linha["referencia"] = referencia
+            linha["codigo_unidade"] = codigo_unidade
+            linhas.append(linha)
+    return pa.Table.from_pylist(linhas, schema=ESQUEMA_FOLHA)
+
+
+def ingerir_arquivos(arquivos_json, pasta_dataset):
+    """
+    Ingere arquivos de dados brutos no dataset Parquet particionado por referência e unidade.
+
+    Reingerir um arquivo substitui a partição correspondente.
+
+    Parâmetros:
+        arquivos_json (list): Caminhos dos arquivos de dados brutos
+        pasta_dataset (str): Pasta raiz do dataset Parquet
+    """
+    for arquivo_json in arquivos_json:
+        try:
+            tabela = tabela_do_arquivo(arquivo_json)
+        except Exception as e:
+            print(f"Erro ao ler o arquivo {arquivo_json}: {e}")
+            continue
+        ds.write_dataset(
+            tabela,
+            pasta_dataset,
+            format="parquet",
+            partitioning=PARTICIONAMENTO,
+            existing_data_behavior="delete_matching",
+            basename_template="folha-{i}.parquet",
+        )
+        print(f"Arquivo {arquivo_json} ingerido no dataset ({tabela.num_rows} linhas).")
+
+
+def abrir_dataset(pasta_dataset):
+    """Abre o dataset Parquet local da folha de pagamento."""
+    return ds.dataset(pasta_dataset, format="parquet", partitioning=PARTICIONAMENTO, schema=ESQUEMA_FOLHA)
+
+
+def consultar_matricula(pasta_dataset, matricula, referencia_inicio, referencia_fim, colunas=None):
+    """
+    Lê as linhas de uma matrícula em um período, com filtros aplicados na leitura
+    (partições fora do período nem são abertas e os row groups são filtrados pela matrícula).
+
+    Parâmetros:
+        pasta_dataset (str): Pasta raiz do dataset Parquet
+        matricula (str): Número da matrícula
+        referencia_inicio (str): Referência inicial no formato "mm/aaaa"
+        referencia_fim (str): Referência final no formato "mm/aaaa"
+        colunas (list): Colunas a serem lidas (padrão: todas)
+
+    Retorna:
+        pyarrow.Table: Linhas encontradas, ordenadas por referência
+    """
+    filtro = (
+        (ds.field("matricula") == str(matricula))
+        & (ds.field("referencia") >= referencia_ordenavel(referencia_inicio))
+        & (ds.field("referencia") <= referencia_ordenavel(referencia_fim))
+    )
+    tabela = abrir_dataset(pasta_dataset).to_table(columns=colunas, filter=filtro)
+    return tabela.sort_by("referencia") if "referencia" in tabela.column_names else tabela
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Ingest scraped JSON files into a local Parquet payroll dataset"
+    )
+    parser.add_argument("--pasta_json", help="Folder with scraped JSON files", default=".json")
+    parser.add_argument("--dataset", help="Output dataset folder", default=".dataset")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    ingerir_arquivos(listar_arquivos_dados(args.pasta_json), args.dataset)
+    print(f"Dataset atualizado em {os.path.abspath(args.dataset)}")
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Prefixo dos nomes das métricas no formato Prometheus
+PREFIX = "dados_itajai_"
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _add_counter(counters, key, value):
+    counters[key] = counters.get(key, 0) + value
+
+
+def _add_timer(timers, key, count, total, maximum):
+    current = timers.get(key, (0, 0.0, 0.0))
+    timers[key] = (current[0] + count, current[1] + total, max(current[2], maximum))
+
+
+class Metrics:
+    """
+    Contadores e temporizadores, com rótulos, de uma execução de um componente do pipeline
+    (extração, ingestão, consulta ou Azure Function). Seguro para uso entre threads.
+
+    Os temporizadores guardam quantidade, soma e máximo das durações (em segundos). Os
+    resultados podem ser gravados em um arquivo texto do Prometheus (para o textfile
+    collector do node_exporter), com os valores acumulados, em um arquivo JSON lines, com
+    os valores de cada intervalo entre gravações, ou impressos como tabela.
+
+    Parâmetros:
+        component (str): Nome do componente, gravado como rótulo "component"
+    """
+
+    def __init__(self, component="pipeline"):
+        self._counters = {}
+        self._timers = {}
+        # Valores desde a última gravação em JSON lines
+        self._interval_counters = {}
+        self._interval_timers = {}
+        self._lock = threading.Lock()
+        self.configure(component)
+
+    def configure(self, component):
+        """Define o componente (e o identificador da execução) antes de registrar as métricas."""
+        self.component = component
+        self.run_id = os.getenv("METRICS_RUN_ID") or f"{component}-{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+
+    def increment(self, name, value=1, **labels):
+        """Soma value ao contador name com os rótulos informados."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            _add_counter(self._counters, key, value)
+            _add_counter(self._interval_counters, key, value)
+
+    def observe(self, name, seconds, **labels):
+        """Registra uma duração, em segundos, no temporizador name."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            _add_timer(self._timers, key, 1, seconds, seconds)
+            _add_timer(self._interval_timers, key, 1, seconds, seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Mede a duração do bloco no temporizador name (também quando o bloco lança exceção)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Cópia serializável (em pickle ou JSON) das métricas, para juntar as de outros processos com merge()."""
+        with self._lock:
+            return {
+                "counters": [[name, list(map(list, labels)), value] for (name, labels), value in self._counters.items()],
+                "timers": [[name, list(map(list, labels)), list(values)] for (name, labels), values in self._timers.items()],
+            }
+
+    def merge(self, snapshot):
+        """Acrescenta as métricas de um snapshot (por exemplo, de um processo de trabalho)."""
+        with self._lock:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                _add_counter(self._counters, key, value)
+                _add_counter(self._interval_counters, key, value)
+            for name, labels, values in snapshot["timers"]:
+                key = (name, tuple(map(tuple, labels)))
+                _add_timer(self._timers, key, *values)
+                _add_timer(self._interval_timers, key, *values)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+            self._interval_counters.clear()
+            self._interval_timers.clear()
+
+    def _series(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timers = sorted(self._timers.items())
+        return counters, timers
+
+    def prometheus_text(self):
+        """Métricas no formato texto de exposição do Prometheus."""
+        counters, timers = self._series()
+        lines = []
+        declared = set()
+
+        def labels_text(labels):
+            pairs = [("component", self.component)] + list(labels)
+            return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{labels_text(labels)} {value}")
+        # Cada temporizador vira um summary (quantidade e soma) e um gauge com o máximo, em famílias separadas
+        for (name, labels), (count, total, _) in timers:
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_count{labels_text(labels)} {count}")
+            lines.append(f"{metric}_sum{labels_text(labels)} {total:.6f}")
+        for (name, labels), (_, _, maximum) in timers:
+            metric = f"{PREFIX}{name}_seconds_max"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{labels_text(labels)} {maximum:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, directory):
+        """Grava (de forma atômica) as métricas em directory/<componente>.prom."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.component}.prom")
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(temporary, path)
+        return path
+
+    def write_jsonl(self, path):
+        """
+        Acrescenta ao arquivo uma linha JSON por série (contador ou temporizador) alterada desde
+        a gravação anterior, com os valores desse intervalo: na Azure Function, cada requisição
+        grava só o que ela registrou, e somar as linhas dá o total da execução.
+        """
+        with self._lock:
+            counters = sorted(self._interval_counters.items())
+            timers = sorted(self._interval_timers.items())
+            self._interval_counters = {}
+            self._interval_timers = {}
+        if not counters and not timers:
+            return path
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        base = {"timestamp": timestamp, "run": self.run_id, "component": self.component}
+        lines = [
+            dict(base, name=name, type="counter", labels=dict(labels), value=value)
+            for (name, labels), value in counters
+        ] + [
+            dict(base, name=name, type="timer", labels=dict(labels), count=count, sum_seconds=total, max_seconds=maximum)
+            for (name, labels), (count, total, maximum) in timers
+        ]
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+        except OSError:
+            # O intervalo volta para a próxima gravação
+            with self._lock:
+                for key, value in counters:
+                    _add_counter(self._interval_counters, key, value)
+                for key, values in timers:
+                    _add_timer(self._interval_timers, key, *values)
+            raise
+        return path
+
+    def flush(self):
+        """
+        Grava as métricas nos destinos configurados: METRICS_PROMETHEUS_DIR (arquivo .prom
+        por componente) e METRICS_JSONL_FILE (JSON lines). Sem nenhum dos dois, não faz nada.
+        """
+        prometheus_dir = os.getenv("METRICS_PROMETHEUS_DIR")
+        jsonl_path = os.getenv("METRICS_JSONL_FILE")
+        if prometheus_dir:
+            self.write_prometheus(prometheus_dir)
+        if jsonl_path:
+            self.write_jsonl(jsonl_path)
+
+    def summary_table(self):
+        """Tabela de texto com os contadores e os temporizadores (quantidade, total, média e máximo)."""
+        counters, timers = self._series()
+
+        def labels_text(labels):
+            return ",".join(f"{name}={value}" for name, value in labels)
+
+        rows = [(name, labels_text(labels), f"{value:g}", "", "", "") for (name, labels), value in counters]
+        rows += [
+            (name, labels_text(labels), str(count), f"{total:.3f}s", f"{total / count * 1000:.1f}ms", f"{maximum * 1000:.1f}ms")
+            for (name, labels), (count, total, maximum) in timers
+        ]
+        header = ("métrica", "rótulos", "quantidade", "total", "média", "máximo")
+        widths = [max(len(row[column]) for row in rows + [header]) for column in range(len(header))]
+        lines = [f"Métricas de {self.run_id}:"]
+        for row in [header] + rows:
+            lines.append("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+        return "\n".join(lines)
+
+    def report(self):
+        """Imprime a tabela de resumo da execução e grava as métricas nos destinos configurados."""
+        print(self.summary_table())
+        self.flush()
+
+
+# Métricas do processo atual, compartilhadas pelos módulos do pipeline
+metrics = Metrics()
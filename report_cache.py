@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+# Propriedades que identificam a versão de um mês: a data de publicação e o hash do conteúdo
+# gravado (uma regravação no modo upsert pode mudar o registro sem mudar ultimaAtualizacao)
+VERSION_PROPERTIES = ["ultimaAtualizacao", "hash_conteudo"]
+
+
+def entity_version(entity):
+    """
+    Versão de uma entidade: ultimaAtualizacao, hash do conteúdo e, quando disponível, o ETag.
+
+    Parâmetros:
+        entity (dict): Entidade lida da tabela (consulta de versões ou registro completo)
+
+    Retorna:
+        tuple: Valores que mudam sempre que o mês é regravado com outro conteúdo
+    """
+    metadata = getattr(entity, "metadata", None) or {}
+    return tuple(entity.get(name) for name in VERSION_PROPERTIES) + (metadata.get("etag"),)
+
+
+def data_version(entities):
+    """
+    Calcula a versão dos dados de um período a partir das entidades lidas com a consulta
+    leve (RowKey e a versão de cada mês, ver entity_version).
+
+    Parâmetros:
+        entities (list): Entidades da consulta de versões
+
+    Retorna:
+        str: Hash que muda sempre que um mês é incluído, removido ou regravado
+    """
+    sha = hashlib.sha256()
+    for entity in sorted(entities, key=lambda e: e["RowKey"]):
+        sha.update(f"{entity['RowKey']}|{'|'.join(map(str, entity_version(entity)))}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def report_etag(params, version):
+    """Monta o ETag (forte) de um relatório a partir dos parâmetros da requisição e da versão dos dados."""
+    key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha256(f"{key}|{version}".encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Indica se o cabeçalho If-None-Match corresponde ao ETag (comparação fraca, aceita "*")."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ReportCache:
+    """
+    Cache persistente em disco de relatórios já gerados, indexado pelo ETag.
+
+    Cada relatório é um arquivo na pasta do cache, gravado de forma atômica; quando o
+    total passa de max_bytes, os relatórios usados há mais tempo são removidos.
+    Como o ETag inclui a versão dos dados, relatórios desatualizados nunca são servidos.
+
+    Parâmetros:
+        directory (str): Pasta do cache (criada se não existir)
+        max_bytes (int): Tamanho máximo total dos relatórios em cache
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, etag):
+        return os.path.join(self.directory, etag.strip('"') + ".bin")
+
+    def get(self, etag):
+        """Retorna o conteúdo do relatório com esse ETag, ou None."""
+        path = self._path(etag)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return body
+
+    def put(self, etag, body):
+        """Grava o relatório com esse ETag e remove os mais antigos se o cache passar do limite."""
+        path = self._path(etag)
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".parcial")
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar o relatório no cache {self.directory}: {e}")
+            return
+        with self._lock:
+            self.stats["stores"] += 1
+        self._prune()
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+
+    def snapshot(self):
+        """Retorna uma cópia dos contadores do cache."""
+        with self._lock:
+            return dict(self.stats)
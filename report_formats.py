@@ -0,0 +1,233 @@
+import csv
+import io
+import json
+import zlib
+
+# Formatos de saída suportados e seus tipos de mídia
+MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+TEXT_FORMATS = {"csv", "ndjson"}
+
+# Colunas das linhas achatadas; as linhas de resumo usam também total_registros e valor_total
+ROW_COLUMNS = ["tipo", "evento", "data", "referencia", "valor", "divisor", "tipo_calculo"]
+SUMMARY_COLUMNS = ["total_registros", "valor_total"]
+
+# Apelidos aceitos no cabeçalho Accept além dos tipos de MEDIA_TYPES
+_ACCEPT_ALIASES = {
+    "application/json": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-parquet": "parquet",
+    "application/parquet": "parquet",
+    "application/csv": "csv",
+}
+
+
+def negotiate_format(format_param=None, accept_header=None, default="xlsx"):
+    """
+    Escolhe o formato de saída: o parâmetro format tem prioridade; senão o tipo de
+    mídia suportado com maior qualidade (q) no cabeçalho Accept; senão o padrão.
+
+    Retorna:
+        str: Formato escolhido, ou None se format_param não for suportado
+    """
+    if format_param:
+        format_param = format_param.lower()
+        return format_param if format_param in MEDIA_TYPES else None
+
+    by_media_type = {media_type: name for name, media_type in MEDIA_TYPES.items()}
+    by_media_type.update(_ACCEPT_ALIASES)
+    candidates = []
+    for position, part in enumerate((accept_header or "").split(",")):
+        media_type, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        name = by_media_type.get(media_type.strip().lower())
+        if name and quality > 0:
+            candidates.append((-quality, position, name))
+    return min(candidates)[2] if candidates else default
+
+
+def accepts_gzip(accept_encoding_header):
+    """Indica se o cliente aceita respostas com Content-Encoding gzip."""
+    for part in (accept_encoding_header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*") and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            return True
+    return False
+
+
+class _SummaryAccumulator:
+    """
+    Acumula total de linhas e valor total por evento enquanto as linhas passam, ou usa
+    o resumo já agregado (tuplas evento, total de registros, valor total) quando fornecido.
+    """
+
+    def __init__(self, resumo, summary=None):
+        self.resumo = resumo
+        self.summary = summary
+        self.totals = {}
+
+    def add(self, evento, valor):
+        if self.summary is not None:
+            return
+        totals = self.totals.setdefault(evento, [0, 0])
+        totals[0] += 1
+        totals[1] += valor
+
+    def records(self):
+        periodo = f"{self.resumo['data_inicio']} até {self.resumo['data_fim']}"
+        summary = self.summary
+        if summary is None:
+            summary = [(evento, count, total) for evento, (count, total) in self.totals.items()]
+        for evento, count, total in summary:
+            yield {
+                "evento": evento,
+                "total_registros": count,
+                "valor_total": total,
+                "periodo": periodo,
+                "matricula": self.resumo["matricula"],
+                "nome": self.resumo["nome"],
+                "data_admissao": self.resumo["data_admissao"],
+            }
+
+
+def csv_chunks(rows, resumo, summary=None, rows_per_chunk=1000):
+    """
+    Gera o CSV em blocos de bytes: primeiro as linhas (tipo "linha"), depois uma linha
+    de resumo por evento (tipo "resumo"), de modo que o envio pode começar antes do fim.
+    """
+    totals = _SummaryAccumulator(resumo, summary)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ROW_COLUMNS + SUMMARY_COLUMNS)
+    for count, (evento, data, referencia, valor, divisor, tipo_calculo) in enumerate(rows, start=1):
+        totals.add(evento, valor)
+        writer.writerow(["linha", evento, data, referencia, valor, divisor, tipo_calculo, "", ""])
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    for record in totals.records():
+        writer.writerow(["resumo", record["evento"], "", "", "", "", "", record["total_registros"], record["valor_total"]])
+    yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(rows, resumo, summary=None, rows_per_chunk=1000):
+    """
+    Gera NDJSON em blocos de bytes: um objeto por linha ({"tipo": "linha", ...}) seguido
+    de um objeto {"tipo": "resumo", ...} por evento.
+    """
+    totals = _SummaryAccumulator(resumo, summary)
+    lines = []
+    for evento, data, referencia, valor, divisor, tipo_calculo in rows:
+        totals.add(evento, valor)
+        lines.append(json.dumps({
+            "tipo": "linha",
+            "evento": evento,
+            "data": data,
+            "referencia": referencia,
+            "valor": valor,
+            "divisor": divisor,
+            "tipo_calculo": tipo_calculo,
+        }, ensure_ascii=False))
+        if len(lines) == rows_per_chunk:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    for record in totals.records():
+        lines.append(json.dumps(dict(tipo="resumo", **record), ensure_ascii=False))
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _DrainableSink:
+    """Arquivo somente-escrita cujo conteúdo acumulado pode ser retirado aos poucos."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(rows, resumo, summary=None, rows_per_group=50000):
+    """
+    Gera um arquivo Parquet em blocos de bytes, um row group por vez. O resumo por
+    evento vai nos metadados do arquivo (chave "resumo", em JSON).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("evento", pa.string()),
+        ("data", pa.string()),
+        ("referencia", pa.float64()),
+        ("valor", pa.float64()),
+        ("divisor", pa.float64()),
+        ("tipo_calculo", pa.string()),
+    ])
+    totals = _SummaryAccumulator(resumo, summary)
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    columns = [[] for _ in schema.names]
+
+    def write_group():
+        writer.write_table(pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema))
+        for column in columns:
+            column.clear()
+
+    for row in rows:
+        totals.add(row[0], row[3])
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) == rows_per_group:
+            write_group()
+            yield sink.drain()
+    if columns[0]:
+        write_group()
+    writer.add_key_value_metadata({"resumo": json.dumps(list(totals.records()), ensure_ascii=False)})
+    writer.close()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compacta com gzip, bloco a bloco, uma sequência de blocos de bytes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def report_chunks(output_format, rows, resumo, summary=None):
+    """Gera o relatório em blocos de bytes no formato csv, ndjson ou parquet (sem compressão HTTP)."""
+    if output_format == "csv":
+        return csv_chunks(rows, resumo, summary)
+    if output_format == "ndjson":
+        return ndjson_chunks(rows, resumo, summary)
+    if output_format == "parquet":
+        return parquet_chunks(rows, resumo, summary)
+    raise ValueError(f"Formato não suportado: {output_format}")
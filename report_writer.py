@@ -0,0 +1,111 @@
+import io
+
+from openpyxl import Workbook
+
+# Colunas das planilhas de resumo e de cada evento (as mesmas geradas antes via pandas)
+SUMMARY_COLUMNS = ["Evento", "Total de Registros", "Valor Total", "Período", "Matrícula", "Nome", "Data de Admissão"]
+EVENT_COLUMNS = ["data", "referência", "valor", "divisor", "tipo_calculo"]
+
+
+def sanitize_sheet_name(name):
+    # Replace invalid characters in sheet names
+    valid_sheet_name = name.replace('/', '_').replace('\\', '_').replace('?', '_').replace('*', '_').replace('[', '_').replace(']', '_').replace(':', '_')
+    # Truncate sheet name if too long (Excel limit is 31 characters)
+    return valid_sheet_name[:31]
+
+
+class StreamingReportWriter:
+    """
+    Escreve o relatório XLSX em uma planilha write-only do openpyxl, com memória constante.
+
+    As linhas de cada evento vão direto para a planilha do evento à medida que chegam;
+    só os totais do resumo ficam em memória. A planilha "Resumo" é criada primeiro e
+    preenchida ao final, em close().
+
+    Parâmetros:
+        output (str | file): Caminho ou arquivo binário de saída
+        resumo (dict): matricula, data_inicio, data_fim, nome e data_admissao
+    """
+
+    def __init__(self, output, resumo):
+        self.output = output
+        self.resumo = resumo
+        self.workbook = Workbook(write_only=True)
+        self.summary_sheet = self.workbook.create_sheet("Resumo")
+        self.summary_sheet.append(SUMMARY_COLUMNS)
+        self.sheets = {}
+        self.totals = {}
+
+    def add_row(self, evento, data, referencia, valor, divisor, tipo_calculo):
+        """Acrescenta uma linha à planilha do evento, criando-a no primeiro uso."""
+        sheet = self.sheets.get(evento)
+        if sheet is None:
+            sheet = self.workbook.create_sheet(sanitize_sheet_name(evento))
+            sheet.append(EVENT_COLUMNS)
+            self.sheets[evento] = sheet
+            self.totals[evento] = [0, 0]
+        sheet.append([data, referencia, valor, divisor, tipo_calculo])
+        totals = self.totals[evento]
+        totals[0] += 1
+        totals[1] += valor
+
+    def close(self, summary=None):
+        """
+        Escreve o resumo e salva o arquivo. Retorna os nomes das planilhas de eventos.
+
+        summary (list de tuplas evento, total de registros, valor total) substitui os
+        totais acumulados em add_row quando já vier agregado.
+        """
+        periodo = f"{self.resumo['data_inicio']} até {self.resumo['data_fim']}"
+        if summary is None:
+            summary = [(evento, count, total) for evento, (count, total) in self.totals.items()]
+        for evento, count, total in summary:
+            self.summary_sheet.append([
+                evento,
+                count,
+                total,
+                periodo,
+                self.resumo["matricula"],
+                self.resumo["nome"],
+                self.resumo["data_admissao"],
+            ])
+        self.workbook.save(self.output)
+        return [sheet.title for sheet in self.sheets.values()]
+
+
+def write_report(output, frame, resumo):
+    """
+    Escreve o relatório XLSX (planilha "Resumo" e uma planilha por evento) a partir do
+    frame da folha de pagamento montado por load_registro e function_app.
+
+    Parâmetros:
+        output (str | file): Caminho ou arquivo binário de saída
+        frame (PayrollFrame): Linhas da folha de pagamento já achatadas
+        resumo (dict): matricula, data_inicio, data_fim, nome e data_admissao
+
+    Retorna:
+        list: Nomes das planilhas de eventos
+    """
+    writer = StreamingReportWriter(output, resumo)
+    for row in frame.rows():
+        writer.add_row(*row)
+    return writer.close(frame.summary())
+
+
+def report_bytes(frame, resumo):
+    """Gera o relatório XLSX em memória e retorna seu conteúdo."""
+    output = io.BytesIO()
+    write_report(output, frame, resumo)
+    return output.getvalue()
+
+
+def write_summary(output, summary, resumo):
+    """Escreve um XLSX só com a planilha "Resumo", a partir do resumo já agregado por evento."""
+    StreamingReportWriter(output, resumo).close(summary)
+
+
+def summary_bytes(summary, resumo):
+    """Gera em memória o XLSX só com o resumo e retorna seu conteúdo."""
+    output = io.BytesIO()
+    write_summary(output, summary, resumo)
+    return output.getvalue()
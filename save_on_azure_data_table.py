@@ -1,12 +1,29 @@
+import argparse
 import azure.data.tables as adt
 import json
 import os
+import time
+
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from functools import partial
+from itertools import islice
 
 from datetime import datetime, timedelta
 
+from azure.core.exceptions import ResourceNotFoundError
 from dotenv import load_dotenv
 
-from time import sleep
+from data_files import EXTENSOES_DADOS, LeitorRegistros, referencia_do_arquivo, registro_do_item, unidade_do_arquivo
+from ingest_manifest import ManifestoIngestao
+from month_summary import summarize_month
+from name_index import open_name_index
+from pipeline_metrics import metrics
+from payload_codec import DEFAULT_ENCODING, ENCODINGS, HASH_PROPERTY, content_hash, encode_payload
+from table_batches import MAX_BYTES_LOTE, MAX_OPERACOES_LOTE, agrupar_em_lotes, tamanho_entidade
+from unit_rollups import RollupAccumulator, rollup_file, rollup_table_name, save_rollups
+from table_queries import query_period, row_key
+from write_scheduler import AgendadorEscritas, FalhaEscrita
 
 load_dotenv()
 # Carregar variáveis de ambiente do arquivo .env
@@ -21,8 +38,226 @@ if not AZURE_TABLE_CONNECTION_STRING or not AZURE_TABLE_NAME:
 table_service = adt.TableServiceClient.from_connection_string(AZURE_TABLE_CONNECTION_STRING)
 table_client = table_service.get_table_client(AZURE_TABLE_NAME)
 
+# Bytes de entidades lidas e ainda não enviadas na ingestão em lote (limita a memória usada)
+MAX_BYTES_PENDENTES = 64 * 1024 * 1024
+
+# Escritas com limite adaptativo de concorrência e repetição com espera exponencial
+agendador = AgendadorEscritas(inicial=8, maximo=32)
+
+# Índice nome -> matrícula, aberto no primeiro uso (NAME_INDEX_PATH aponta para um índice SQLite local)
+indice_nomes = None
+indexar_nomes = True
+
+def obter_indice_nomes():
+    """Retorna o índice de nomes do processo, abrindo-o na primeira chamada."""
+    global indice_nomes
+    if indice_nomes is None:
+        indice_nomes = open_name_index(AZURE_TABLE_CONNECTION_STRING, AZURE_TABLE_NAME)
+    return indice_nomes
+
+def indexar_nome(matricula, nome, data_admissao):
+    """Agenda a indexação do nome de uma matrícula (gravada em gravar_indice_nomes)."""
+    if indexar_nomes:
+        obter_indice_nomes().add(matricula, nome, data_admissao)
+
+def indexar_entidade(entity):
+    """Agenda a indexação do nome da matrícula de uma entidade confirmada na tabela."""
+    indexar_nome(entity["PartitionKey"], entity["nome"], entity["dataAdmissao"])
+
+def gravar_indice_nomes():
+    """Grava no índice de nomes as matrículas agendadas; falhas não interrompem a ingestão."""
+    if not indexar_nomes or indice_nomes is None:
+        return
+    try:
+        indexadas = indice_nomes.flush()
+    except Exception as e:
+        print(f"Erro ao gravar o índice de nomes: {e}")
+        return
+    if indexadas:
+        print(f"Índice de nomes atualizado com {indexadas} matrículas.")
+
+# Codificação do registro nas entidades: "json" (dados_json, padrão) ou "zlib" (compacta, em partes)
+codificacao_dados = os.getenv("DADOS_CODIFICACAO", DEFAULT_ENCODING)
+
+# Tabela de agregados por unidade gestora, evento e mês, aberta no primeiro uso
+tabela_agregados = None
+gerar_agregados = True
+
+def gravar_agregados(acumulador):
+    """Grava os agregados de uma referência; falhas não interrompem a ingestão."""
+    global tabela_agregados
+    if not gerar_agregados:
+        return
+    try:
+        if tabela_agregados is None:
+            tabela_agregados = table_service.create_table_if_not_exists(rollup_table_name(AZURE_TABLE_NAME))
+        with metrics.timer("table_request", operation="agregados"):
+            gravadas, removidas = save_rollups(tabela_agregados, acumulador)
+    except Exception as e:
+        print(f"Erro ao gravar os agregados de {acumulador.referencia}: {e}")
+        return
+    print(f"Agregados de {acumulador.referencia} atualizados ({gravadas} entidades, {removidas} removidas).")
+
+# Modo upsert: substitui as entidades cujo conteúdo mudou (em vez de só criar as que não existem)
+modo_upsert = False
+
+def acumular_registros(itens, acumulador):
+    """Repassa os itens de registros, acrescentando cada registro aos agregados."""
+    for item in itens:
+        registro = registro_do_item(item)
+        if registro:
+            acumulador.add(registro)
+        yield item
+
+def montar_entidade(registro, referencia, codigo_unidade, dados):
+    """
+    Monta a entidade do Azure Table Storage de um registro.
+    
+    Parâmetros:
+        registro (dict): Registro de um servidor
+        referencia (str): Data de referência no formato "mm/aaaa"
+        codigo_unidade (int): Código da unidade (0 para todas)
+        dados (dict): Dados completos do arquivo (para informacao e ultimaAtualizacao)
+    
+    Retorna:
+        dict: Entidade pronta para ser salva
+    """
+    # Cria a entidade com os campos principais
+    entity = {
+        "PartitionKey": registro["matricula"]["numero"],
+        "RowKey": row_key(referencia),
+        "referencia": referencia,
+        "codigo_unidade": codigo_unidade,
+    }
+    
+    # Adiciona informações básicas
+    if "informacao" in dados:
+        entity["informacao"] = dados["informacao"]
+    if "ultimaAtualizacao" in dados:
+        entity["ultimaAtualizacao"] = dados["ultimaAtualizacao"]
+        
+    # Adiciona dados do registro de forma serializada (dados_json ou, com zlib, compacta e comprimida)
+    with metrics.timer("payload_encode", codec=codificacao_dados):
+        entity.update(encode_payload(registro, codificacao_dados))
+
+    # Resumo do mês em propriedades pequenas, para consultas que não precisam do registro completo
+    entity.update(summarize_month(registro))
+
+    # Hash do conteúdo, para que o modo upsert grave apenas registros alterados; a Azure Function também
+    # o usa como versão do mês em cache, pois uma correção regravada mantém o mesmo ultimaAtualizacao
+    entity[HASH_PROPERTY] = content_hash(registro)
+    return entity
+
+def consultar_hashes_particao(particao, row_keys):
+    """
+    Lê os hashes de conteúdo gravados de entidades de uma partição, com uma única consulta
+    por intervalo que retorna apenas RowKey e hash_conteudo.
+    
+    Retorna:
+        dict: RowKey -> hash (None para entidades gravadas antes do hash) das entidades existentes
+    """
+    with metrics.timer("table_request", operation="query"):
+        entidades = query_period(table_client, particao, min(row_keys), max(row_keys), select=["RowKey", HASH_PROPERTY])
+    return {entity["RowKey"]: entity.get(HASH_PROPERTY) for entity in entidades if entity["RowKey"] in row_keys}
+
+def consultar_hash_entidade(particao, linha):
+    """
+    Lê o hash de conteúdo gravado de uma entidade com uma leitura pontual que retorna
+    apenas RowKey e hash_conteudo.
+    
+    Retorna:
+        tuple: Se a entidade existe e o hash gravado (None para entidades gravadas antes do hash)
+    """
+    try:
+        with metrics.timer("table_request", operation="get"):
+            entity = table_client.get_entity(particao, linha, select=["RowKey", HASH_PROPERTY])
+    except ResourceNotFoundError:
+        return False, None
+    return True, entity.get(HASH_PROPERTY)
+
+def classificar_entidade(entity, hashes=None):
+    """
+    Compara o hash de conteúdo de uma entidade com o da gravada (ingestão registro a
+    registro): primeiro no mapa local de hashes, depois com uma leitura pontual na tabela.
+    
+    Parâmetros:
+        entity (dict): Entidade montada por montar_entidade
+        hashes (ManifestoIngestao): Mapa local de hashes das entidades gravadas (opcional)
+    
+    Retorna:
+        str: "nova", "atualizada" ou "inalterada"
+    """
+    chave = (entity["PartitionKey"], entity["RowKey"])
+    gravados = hashes.hashes_entidades([chave]) if hashes else {}
+    if chave in gravados:
+        existe, hash_gravado = True, gravados[chave]
+    else:
+        existe, hash_gravado = consultar_hash_entidade(*chave)
+    if not existe:
+        return "nova"
+    return "inalterada" if hash_gravado == entity[HASH_PROPERTY] else "atualizada"
+
+def classificar_particao(entidades, gravados):
+    """
+    Compara o hash de conteúdo das entidades de uma partição com o das já gravadas: primeiro
+    nos hashes já conhecidos (lidos do manifesto), depois, para as que faltarem, com uma
+    única consulta projetada na tabela.
+    
+    Parâmetros:
+        entidades (list): Entidades de uma mesma partição, montadas por montar_entidade
+        gravados (dict): Hashes conhecidos por (PartitionKey, RowKey)
+    
+    Retorna:
+        tuple: Situação de cada entidade por (PartitionKey, RowKey) ("nova", "atualizada"
+               ou "inalterada") e número de requisições feitas
+    """
+    particao = entidades[0]["PartitionKey"]
+    gravados = dict(gravados)
+    faltantes = {entity["RowKey"] for entity in entidades if (particao, entity["RowKey"]) not in gravados}
+    if faltantes:
+        for linha, hash_gravado in consultar_hashes_particao(particao, faltantes).items():
+            gravados[(particao, linha)] = hash_gravado
+    
+    situacoes = {}
+    for entity in entidades:
+        chave = (particao, entity["RowKey"])
+        if chave not in gravados:
+            situacoes[chave] = "nova"
+        elif gravados[chave] == entity[HASH_PROPERTY]:
+            situacoes[chave] = "inalterada"
+        else:
+            situacoes[chave] = "atualizada"
+    return situacoes, 1 if faltantes else 0
+
+def criar_entidade(entity, max_tentativas=7, substituir=False):
+    """
+    Cria uma entidade pelo agendador de escritas, que repete com espera exponencial as
+    falhas por throttling, timeout ou erro transitório (erros permanentes não são repetidos).
+    
+    Parâmetros:
+        entity (dict): Entidade a ser criada
+        max_tentativas (int): Número máximo de tentativas
+        substituir (bool): Grava com upsert, substituindo a entidade se ela já existir
+    
+    Retorna:
+        tuple: Situação ("criada", "existente" ou "falha") e número de requisições feitas
+    """
+    if substituir:
+        operacao = partial(table_client.upsert_entity, entity=entity, mode=adt.UpdateMode.REPLACE)
+    else:
+        operacao = partial(table_client.create_entity, entity=entity)
+    try:
+        _, requisicoes = agendador.executar(operacao, "upsert" if substituir else "create", max_tentativas)
+        return "criada", requisicoes
+    except FalhaEscrita as falha:
+        # Verifica se o erro é de entidade que já existe
+        if falha.tipo == "existente":
+            return "existente", falha.tentativas
+        print(f"Falha ao salvar registro após {falha.tentativas} tentativa(s) ({falha.tipo}): {falha.erro}")
+        return "falha", falha.tentativas
+
 # Função para salvar dados no Azure Table Storage
-def salvar_dados_azure(dados, referencia, codigo_unidade):
+def salvar_dados_azure(dados, referencia, codigo_unidade, inicio=0, ao_confirmar=None, hashes=None):
     """
     Salva os dados no Azure Table Storage.
     
@@ -30,109 +265,599 @@ def salvar_dados_azure(dados, referencia, codigo_unidade):
         dados (dict): Dados a serem salvos
         referencia (str): Data de referência no formato "mm/aaaa"
         codigo_unidade (int): Código da unidade (0 para todas)
+        inicio (int): Deslocamento do primeiro registro a processar
+        ao_confirmar (callable): Chamada com o deslocamento após cada registro confirmado
+        hashes (ManifestoIngestao): Mapa local de hashes das entidades gravadas (opcional)
+    
+    Retorna:
+        int: Deslocamento do próximo registro a processar (igual ao total quando concluído)
     """
+    # Verifica se os dados têm a estrutura esperada
+    if "registros" not in dados:
+        print(f"Estrutura de dados inválida para referência {referencia}")
+        return inicio
+    
+    deslocamento, concluido = salvar_registros_azure(
+        dados, dados["registros"], referencia, codigo_unidade, inicio, ao_confirmar, len(dados["registros"]), hashes
+    )
+    if concluido and gerar_agregados:
+        acumulador = RollupAccumulator(referencia, codigo_unidade)
+        for _ in acumular_registros(dados["registros"], acumulador):
+            pass
+        gravar_agregados(acumulador)
+    return deslocamento
+
+def salvar_registros_azure(cabecalho, itens, referencia, codigo_unidade, inicio=0, ao_confirmar=None, registros_total=None, hashes=None):
+    """
+    Salva no Azure Table Storage os itens de registros, consumindo-os um de cada vez.
+    
+    Os registros são processados em ordem, a partir de inicio. Um registro só é
+    considerado confirmado quando foi criado ou já existia; em caso de falha o
+    processamento para, para que uma nova execução retome a partir dele. No modo
+    upsert, registros com o mesmo hash de conteúdo do gravado são ignorados e os
+    demais são gravados (novos) ou substituídos (atualizados). Os hashes dos registros
+    confirmados são gravados no mapa local de uma vez, ao final.
+    
+    Parâmetros:
+        cabecalho (dict): Chaves do objeto raiz (informacao, ultimaAtualizacao)
+        itens (iterable): Itens do array registros (lista ou LeitorRegistros)
+        referencia (str): Data de referência no formato "mm/aaaa"
+        codigo_unidade (int): Código da unidade (0 para todas)
+        inicio (int): Deslocamento do primeiro registro a processar
+        ao_confirmar (callable): Chamada com o deslocamento após cada registro confirmado
+        registros_total (int): Total de registros, se conhecido (apenas para as mensagens)
+        hashes (ManifestoIngestao): Mapa local de hashes das entidades gravadas (opcional)
+    
+    Retorna:
+        tuple: Deslocamento do próximo registro a processar e se todos os itens foram confirmados
+    """
+    deslocamento = inicio
+    total_str = f"/{registros_total}" if registros_total is not None else ""
+    hashes_confirmados = []
     try:
-        # Verifica se os dados têm a estrutura esperada
-        if "registros" not in dados:
-            print(f"Estrutura de dados inválida para referência {referencia}")
-            return
-            
-        # Cria uma entidade para cada registro (em ordem inversa)
-        registros_encontrados = 0
+        # Cria uma entidade para cada registro
+        registros_processados = 0
         registros_existentes = 0
-        registros_total = len(dados["registros"])
+        contagem = defaultdict(int)
         
-        # Inverte a ordem dos registros para processamento
-        for item in reversed(dados["registros"]):
-            if "registro" not in item:
-                continue
-                
-            registro = item["registro"]
-            registros_encontrados += 1
+        for item in islice(itens, inicio, None):
+            registro = registro_do_item(item)
             
-            # Verifica se matrícula existe no registro
-            if "matricula" not in registro or "numero" not in registro["matricula"]:
+            # Verifica se matrícula existe no registro (itens nulos são ignorados)
+            if registro is None:
+                pass
+            elif "numero" not in (registro.get("matricula") or {}):
                 print(f"Registro sem matrícula válida ignorado")
-                continue
+            else:
+                entity = montar_entidade(registro, referencia, codigo_unidade, cabecalho)
                 
-            # Cria a entidade com os campos principais
-            entity = {
-                "PartitionKey": registro["matricula"]["numero"],
-                "RowKey": referencia.replace("/", "_"),
-                "referencia": referencia,
-                "codigo_unidade": codigo_unidade,
-            }
-            
-            # Adiciona informações básicas
-            if "informacao" in dados:
-                entity["informacao"] = dados["informacao"]
-            if "ultimaAtualizacao" in dados:
-                entity["ultimaAtualizacao"] = dados["ultimaAtualizacao"]
-                
-            # Adiciona dados do registro de forma serializada para evitar problemas de estrutura
-            entity["dados_json"] = json.dumps(registro)
-            
-            # Tenta criar a entidade com tratamento específico para entidades existentes
-            max_tentativas = 7
-            tentativa = 0
-            while tentativa < max_tentativas:
-                try:
-                    table_client.create_entity(entity=entity)
-                    break  # Sucesso, sai do loop
-                except Exception as e:
-                    erro_str = str(e)
-                    # Verifica se o erro é de entidade que já existe
-                    if "EntityAlreadyExists" in erro_str:
-                        registros_existentes += 1
-                        print(f"Registro {registros_encontrados}/{registros_total} já existe. Entidade: {entity['PartitionKey']} - {entity['RowKey']}")
-                        break  # Sai do loop, o registro já existe
-                    else:
-                        # Para outros erros, tenta novamente
-                        tentativa += 1
-                        print(f"Erro ao salvar registro (tentativa {tentativa}/{max_tentativas}): {e}")
-                        if tentativa == max_tentativas:
-                            print(f"Falha ao salvar registro após {max_tentativas} tentativas.")
-                        else:
-                            sleep(1)  # Aguarda um pouco antes de tentar novamente
+                if modo_upsert:
+                    situacao = classificar_entidade(entity, hashes)
+                    if situacao != "inalterada" and criar_entidade(entity, substituir=True)[0] == "falha":
+                        situacao = "falha"
+                else:
+                    # Tenta criar a entidade com tratamento específico para entidades existentes
+                    situacao, _ = criar_entidade(entity)
+                if situacao == "falha":
+                    metrics.increment("entities", situacao="falha")
+                    print(f"Processamento de {referencia} na unidade {codigo_unidade} interrompido no registro {deslocamento + 1}{total_str}.")
+                    return deslocamento, False
+                registros_processados += 1
+                contagem[situacao] += 1
+                metrics.increment("entities", situacao=situacao)
+                indexar_entidade(entity)
+                if hashes and situacao != "existente":
+                    hashes_confirmados.append({
+                        "PartitionKey": entity["PartitionKey"],
+                        "RowKey": entity["RowKey"],
+                        HASH_PROPERTY: entity[HASH_PROPERTY],
+                    })
+                if situacao == "existente":
+                    registros_existentes += 1
             
-            # Se todos os registros já existem, podemos parar o processamento
-            if registros_existentes >= 5 and registros_encontrados >= 10:
-                print(f"Múltiplos registros já existem para {referencia} na unidade {codigo_unidade}. Pulando para o próximo arquivo.")
-                return
+            deslocamento += 1
+            if ao_confirmar:
+                ao_confirmar(deslocamento)
             
-        print(f"Dados salvos com sucesso para {referencia} na unidade {codigo_unidade}. Processados: {registros_encontrados}, já existentes: {registros_existentes}")
+        if modo_upsert:
+            print(
+                f"Dados salvos com sucesso para {referencia} na unidade {codigo_unidade}. Processados: {registros_processados}, "
+                f"novos: {contagem['nova']}, atualizados: {contagem['atualizada']}, inalterados: {contagem['inalterada']}"
+            )
+        else:
+            print(f"Dados salvos com sucesso para {referencia} na unidade {codigo_unidade}. Processados: {registros_processados}, já existentes: {registros_existentes}")
+        return deslocamento, True
     except Exception as e:
         print(f"Erro ao salvar dados no Azure: {e}")
+        return deslocamento, False
+    finally:
+        # Uma única transação no manifesto para os hashes de todos os registros confirmados
+        if hashes_confirmados:
+            hashes.registrar_hashes(hashes_confirmados)
+        gravar_indice_nomes()
+
+
+def situacao_gravada(entity, situacoes=None):
+    """Situação de uma entidade gravada com sucesso: "criada", ou "nova"/"atualizada" no modo upsert."""
+    if situacoes is None:
+        return "criada"
+    return situacoes[(entity["PartitionKey"], entity["RowKey"])]
+
+def enviar_lote(lote, situacoes=None):
+    """
+    Envia um lote de entidades da mesma partição em uma única transação.
+    
+    Throttling, timeouts e erros transitórios são repetidos pelo agendador de escritas.
+    Se a transação falhar mesmo assim (por exemplo, porque uma das entidades já existe),
+    nada é gravado e as entidades do lote são criadas individualmente. Com situacoes
+    (modo upsert), as entidades são substituídas em vez de criadas.
+    
+    Retorna:
+        tuple: Contagem por situação (dict), número de requisições feitas e entidades que falharam
+    """
+    contagem = defaultdict(int)
+    falhas = []
+    substituir = situacoes is not None
+    if substituir:
+        operacoes = [("upsert", entity, {"mode": adt.UpdateMode.REPLACE}) for entity in lote]
+    else:
+        operacoes = [("create", entity) for entity in lote]
+    try:
+        _, requisicoes = agendador.executar(partial(table_client.submit_transaction, operacoes), "transaction")
+        for entity in lote:
+            contagem[situacao_gravada(entity, situacoes)] += 1
+        return contagem, requisicoes, falhas
+    except FalhaEscrita as falha:
+        requisicoes = falha.tentativas
+        print(f"Transação de {len(lote)} entidades da partição {lote[0]['PartitionKey']} falhou ({falha.tipo}), salvando individualmente: {falha.erro}")
+    
+    for entity in lote:
+        situacao, feitas = criar_entidade(entity, substituir=substituir)
+        contagem[situacao_gravada(entity, situacoes) if situacao == "criada" else situacao] += 1
+        requisicoes += feitas
+        if situacao == "falha":
+            falhas.append(entity)
+    return contagem, requisicoes, falhas
+
+def salvar_particao(entidades, gravados=None):
+    """
+    Salva entidades de uma mesma partição em transações (as que não formam um lote são
+    criadas individualmente). No modo upsert, as inalteradas são ignoradas antes de montar
+    os lotes e as demais são gravadas com upsert.
+    
+    Parâmetros:
+        entidades (list): Entidades de uma mesma partição
+        gravados (dict): No modo upsert, hashes já conhecidos por (PartitionKey, RowKey)
+    
+    Retorna:
+        tuple: Contagem por situação (dict), número de requisições feitas e entidades que falharam
+    """
+    contagem = defaultdict(int)
+    requisicoes = 0
+    falhas = []
+    situacoes = None
+    a_gravar = entidades
+    if modo_upsert:
+        situacoes, requisicoes = classificar_particao(entidades, gravados or {})
+        a_gravar = [entity for entity in entidades if situacoes[(entity["PartitionKey"], entity["RowKey"])] != "inalterada"]
+        contagem["inalterada"] = len(entidades) - len(a_gravar)
+    lotes, avulsas = agrupar_em_lotes(a_gravar)
+    
+    for lote in lotes:
+        contagem_lote, feitas, falhas_lote = enviar_lote(lote, situacoes)
+        for situacao, quantidade in contagem_lote.items():
+            contagem[situacao] += quantidade
+        requisicoes += feitas
+        falhas += falhas_lote
+    for entity in avulsas:
+        situacao, feitas = criar_entidade(entity, substituir=modo_upsert)
+        contagem[situacao_gravada(entity, situacoes) if situacao == "criada" else situacao] += 1
+        requisicoes += feitas
+        if situacao == "falha":
+            falhas.append(entity)
+    return contagem, requisicoes, falhas
 
+def salvar_entidades_em_lote(entidades, max_escritores=8, hashes=None, ao_gravar=None):
+    """
+    Salva entidades usando transações em lote por PartitionKey, à medida que são produzidas.
+    
+    As entidades são agrupadas por partição; uma partição é enviada assim que completa um
+    lote (MAX_OPERACOES_LOTE entidades ou MAX_BYTES_LOTE bytes) e, quando as entidades
+    pendentes passam de MAX_BYTES_PENDENTES, a partição com mais bytes é enviada mesmo
+    incompleta; as demais são enviadas ao final. As partições são salvas em paralelo, com
+    no máximo o dobro de escritores aguardando ou em andamento, de modo que a memória usada
+    não depende da quantidade de entidades. O número de escritas simultâneas é ajustado pelo
+    agendador: cresce enquanto não há throttling e cai pela metade quando o serviço responde
+    503/ServerBusy.
+    
+    Parâmetros:
+        entidades (iterable): Entidades a serem salvas (por exemplo, um gerador)
+        max_escritores (int): Número de threads de escrita (no mínimo o limite máximo do agendador)
+        hashes (ManifestoIngestao): Mapa local de hashes das entidades gravadas (opcional)
+        ao_gravar (callable): Chamada com cada entidade confirmada na tabela (gravada, já
+            existente ou inalterada); as que falharam são omitidas
+    
+    Retorna:
+        dict: Estatísticas (criadas, existentes, falhas ou, no modo upsert, novas, atualizadas,
+              inalteradas e falhas; requisições, requisições economizadas, segundos,
+              entidades por segundo e limite de escritas simultâneas ao final)
+    """
+    inicio = time.monotonic()
+    estatisticas = defaultdict(int)
+    pendentes = defaultdict(list)
+    bytes_particao = defaultdict(int)
+    bytes_pendentes = 0
+    em_andamento = {}
+    max_threads = max(1, max_escritores, agendador.controle.maximo)
+    
+    def concluir(futuro):
+        contagem, requisicoes, entidades_falha = futuro.result()
+        for situacao, quantidade in contagem.items():
+            estatisticas[situacao] += quantidade
+        estatisticas["requisicoes"] += requisicoes
+        if ao_gravar:
+            falhas = {(entity["PartitionKey"], entity["RowKey"]) for entity in entidades_falha}
+            for entity in em_andamento.pop(futuro):
+                if (entity["PartitionKey"], entity["RowKey"]) not in falhas:
+                    ao_gravar(entity)
+        else:
+            del em_andamento[futuro]
+    
+    # O agendador limita as escritas em andamento; as threads só precisam cobrir o limite máximo
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        def enviar(particao):
+            nonlocal bytes_pendentes
+            grupo = pendentes.pop(particao)
+            bytes_pendentes -= bytes_particao.pop(particao)
+            # Os hashes do manifesto são lidos nesta thread (a conexão SQLite é da thread principal)
+            gravados = hashes.hashes_entidades({(particao, entity["RowKey"]) for entity in grupo}) if modo_upsert and hashes else None
+            em_andamento[executor.submit(salvar_particao, grupo, gravados)] = grupo
+            while len(em_andamento) > 2 * max_threads:
+                concluidos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    concluir(futuro)
+        
+        for entity in entidades:
+            estatisticas["entidades"] += 1
+            particao = entity["PartitionKey"]
+            tamanho = tamanho_entidade(entity)
+            pendentes[particao].append(entity)
+            bytes_particao[particao] += tamanho
+            bytes_pendentes += tamanho
+            if len(pendentes[particao]) >= MAX_OPERACOES_LOTE or bytes_particao[particao] >= MAX_BYTES_LOTE:
+                enviar(particao)
+            while bytes_pendentes > MAX_BYTES_PENDENTES:
+                enviar(max(bytes_particao, key=bytes_particao.get))
+        for particao in list(pendentes):
+            enviar(particao)
+        for futuro in list(em_andamento):
+            concluir(futuro)
+    
+    for situacao in ("criada", "existente", "nova", "atualizada", "inalterada", "falha"):
+        if estatisticas.get(situacao):
+            metrics.increment("entities", estatisticas[situacao], situacao=situacao)
+    
+    segundos = time.monotonic() - inicio
+    total = estatisticas["entidades"]
+    estatisticas["requisicoes_economizadas"] = max(0, total - estatisticas["requisicoes"])
+    estatisticas["segundos"] = segundos
+    estatisticas["entidades_por_segundo"] = total / segundos if segundos > 0 else 0.0
+    estatisticas["limite_escritas"] = agendador.controle.limite
+    return dict(estatisticas)
 
-# Função para ler arquivo JSON da pasta .json e salvar no Azure Table Storage (exemplo de nome de arquivo: pessoal_itajai_01_2019_unidade_1.json)
-def ler_e_salvar_azure(arquivo_json, codigo_unidade):
+def salvar_arquivos_azure_lote(arquivos_json, max_escritores=8, manifesto=None):
     """
-    Lê um arquivo JSON e salva os dados no Azure Table Storage.
+    Lê vários arquivos de dados e salva todas as suas entidades em lote, enviando os lotes
+    de cada partição à medida que os registros são lidos (ver salvar_entidades_em_lote).
+    
+    Entidades de meses diferentes da mesma matrícula compartilham a PartitionKey,
+    por isso quanto mais meses no mesmo grupo de arquivos, maiores os lotes.
+    
+    Parâmetros:
+        arquivos_json (list): Caminhos dos arquivos de dados (.json ou .json.gz)
+        max_escritores (int): Número máximo de requisições simultâneas
+        manifesto (ManifestoIngestao): Manifesto de ingestão; arquivos concluídos são
+            ignorados e o grupo só é marcado como concluído se não houver falhas
+    
+    Retorna:
+        dict: Estatísticas do grupo (ver salvar_entidades_em_lote)
+    """
+    concluidos = []
+    acumuladores = []
+    hashes_gravados = []
+    
+    def entidades_dos_arquivos():
+        # Os registros são lidos de forma incremental e as entidades, enviadas à medida que são montadas
+        for arquivo_json in arquivos_json:
+            if manifesto:
+                hash_conteudo = manifesto.hash_arquivo(arquivo_json)
+                if manifesto.situacao(arquivo_json, hash_conteudo)[1]:
+                    print(f"Arquivo {arquivo_json} já foi ingerido. Ignorando.")
+                    continue
+            referencia = referencia_do_arquivo(arquivo_json)
+            codigo_unidade = unidade_do_arquivo(arquivo_json)
+            try:
+                acumulador = RollupAccumulator(referencia, codigo_unidade)
+                with LeitorRegistros(arquivo_json) as leitor:
+                    itens = 0
+                    entidades_arquivo = 0
+                    for item in acumular_registros(leitor, acumulador):
+                        itens += 1
+                        registro = registro_do_item(item)
+                        if "numero" in ((registro or {}).get("matricula") or {}):
+                            entity = montar_entidade(registro, referencia, codigo_unidade, leitor.cabecalho)
+                            entidades_arquivo += 1
+                            hashes_gravados.append({
+                                "PartitionKey": entity["PartitionKey"],
+                                "RowKey": entity["RowKey"],
+                                HASH_PROPERTY: entity[HASH_PROPERTY],
+                            })
+                            yield entity
+            except Exception as e:
+                print(f"Erro ao ler o arquivo {arquivo_json}: {e}")
+                continue
+            print(f"Arquivo {arquivo_json}: {entidades_arquivo} entidades")
+            acumuladores.append(acumulador)
+            if manifesto:
+                concluidos.append((arquivo_json, hash_conteudo, itens))
+    
+    # Só as matrículas confirmadas na tabela entram no índice de nomes
+    estatisticas = salvar_entidades_em_lote(entidades_dos_arquivos(), max_escritores, manifesto, ao_gravar=indexar_entidade)
+    gravar_indice_nomes()
+    if not estatisticas.get("falha"):
+        for acumulador in acumuladores:
+            gravar_agregados(acumulador)
+        # Entidades "existentes" podem ter outro conteúdo na tabela: só o modo upsert garante os hashes
+        if manifesto and (modo_upsert or not estatisticas.get("existente")):
+            manifesto.registrar_hashes(hashes_gravados)
+    if manifesto and not estatisticas.get("falha"):
+        for arquivo_json, hash_conteudo, total in concluidos:
+            manifesto.concluir(arquivo_json, hash_conteudo, total)
+    if modo_upsert:
+        situacoes = (
+            f"novas {estatisticas.get('nova', 0)}, atualizadas {estatisticas.get('atualizada', 0)}, "
+            f"inalteradas {estatisticas.get('inalterada', 0)}"
+        )
+    else:
+        situacoes = f"criadas {estatisticas.get('criada', 0)}, já existentes {estatisticas.get('existente', 0)}"
+    print(
+        f"{len(arquivos_json)} arquivos, {estatisticas['entidades']} entidades em {estatisticas['segundos']:.1f}s "
+        f"({estatisticas['entidades_por_segundo']:.1f} entidades/s): {situacoes}, falhas {estatisticas.get('falha', 0)}, "
+        f"{estatisticas['requisicoes']} requisições ({estatisticas['requisicoes_economizadas']} economizadas), "
+        f"{agendador.resumo()}"
+    )
+    return estatisticas
+
+
+def ingerir_arquivo(arquivo_json, codigo_unidade, manifesto=None):
+    """
+    Lê um arquivo de dados e salva seus registros no Azure Table Storage, sem tratar exceções.
+    
+    Com um manifesto, arquivos já concluídos (mesmo hash de conteúdo) são ignorados
+    sem nenhuma requisição e arquivos interrompidos são retomados a partir do último
+    registro confirmado.
+    
+    Parâmetros:
+        arquivo_json (str): Caminho do arquivo JSON (ou .json.gz)
+        codigo_unidade (int): Código da unidade (0 para todas)
+        manifesto (ManifestoIngestao): Manifesto de ingestão (opcional)
+    
+    Retorna:
+        dict: arquivo, ignorado, registros confirmados nesta execução e se o arquivo foi concluído
+    """
+    resultado = {"arquivo": arquivo_json, "ignorado": False, "registros": 0, "concluido": False}
+    inicio = 0
+    if manifesto:
+        hash_conteudo = manifesto.hash_arquivo(arquivo_json)
+        inicio, concluido = manifesto.situacao(arquivo_json, hash_conteudo)
+        if concluido:
+            print(f"Arquivo {arquivo_json} já foi ingerido. Ignorando.")
+            metrics.increment("ingest_files", situacao="ignorado")
+            resultado.update(ignorado=True, concluido=True)
+            return resultado
+        if inicio:
+            print(f"Retomando {arquivo_json} a partir do registro {inicio + 1}.")
+    
+    referencia = referencia_do_arquivo(arquivo_json)
+    
+    ao_confirmar = None
+    if manifesto:
+        def ao_confirmar(deslocamento):
+            manifesto.registrar_progresso(arquivo_json, hash_conteudo, deslocamento, deslocamento)
+    
+    # Os registros são lidos e salvos um de cada vez, com memória limitada; os agregados
+    # são acumulados na mesma leitura (uma execução retomada relê o arquivo para calculá-los)
+    acumulador = RollupAccumulator(referencia, codigo_unidade)
+    with LeitorRegistros(arquivo_json) as leitor:
+        itens = acumular_registros(leitor, acumulador) if inicio == 0 else leitor
+        deslocamento, concluido = salvar_registros_azure(
+            leitor.cabecalho, itens, referencia, codigo_unidade, inicio, ao_confirmar, hashes=manifesto
+        )
+    if concluido and gerar_agregados:
+        gravar_agregados(acumulador if inicio == 0 else rollup_file(arquivo_json))
+    if manifesto and concluido:
+        manifesto.concluir(arquivo_json, hash_conteudo, deslocamento)
+    metrics.increment("ingest_files", situacao="concluido" if concluido else "interrompido")
+    metrics.increment("ingest_records", deslocamento - inicio)
+    resultado.update(registros=deslocamento - inicio, concluido=concluido)
+    return resultado
+
+# Função para ler arquivo JSON da pasta .json e salvar no Azure Table Storage (exemplo de nome de arquivo: pessoal_itajai_01_2019_unidade_1.json ou .json.gz)
+def ler_e_salvar_azure(arquivo_json, codigo_unidade, manifesto=None):
+    """
+    Lê um arquivo JSON (ou JSON compactado .json.gz) e salva os dados no Azure Table Storage.
     
     Parâmetros:
         arquivo_json (str): Caminho do arquivo JSON
         codigo_unidade (int): Código da unidade (0 para todas)
+        manifesto (ManifestoIngestao): Manifesto de ingestão (opcional)
+    
+    Retorna:
+        bool: True se o arquivo foi processado, False se foi ignorado ou falhou ao ser lido
     """
     try:
-        with open(arquivo_json, 'r', encoding='utf-8') as file:
-            dados = json.load(file)
-            ref_split = os.path.basename(arquivo_json).split('_')
-            referencia = ref_split[2] + '/' + ref_split[3]
-            salvar_dados_azure(dados, referencia, codigo_unidade)
+        return not ingerir_arquivo(arquivo_json, codigo_unidade, manifesto)["ignorado"]
     except Exception as e:
         print(f"Erro ao ler o arquivo {arquivo_json}: {e}")
+        return False
+
+# Manifesto do processo de trabalho na ingestão paralela
+_manifesto_processo = None
+
+def _inicializar_processo(caminho_manifesto, indexar=True, agregar=True, codificacao=DEFAULT_ENCODING, upsert=False, limites_escrita=(8, 32)):
+    """Cria um TableClient, um manifesto, um índice de nomes e um agendador de escritas próprios para cada processo de trabalho."""
+    global table_service, table_client, _manifesto_processo, indice_nomes, indexar_nomes, tabela_agregados, gerar_agregados, codificacao_dados, modo_upsert, agendador
+    codificacao_dados = codificacao
+    modo_upsert = upsert
+    agendador = AgendadorEscritas(*limites_escrita)
+    indice_nomes = None
+    indexar_nomes = indexar
+    tabela_agregados = None
+    gerar_agregados = agregar
+    table_service = adt.TableServiceClient.from_connection_string(AZURE_TABLE_CONNECTION_STRING)
+    table_client = table_service.get_table_client(AZURE_TABLE_NAME)
+    _manifesto_processo = ManifestoIngestao(caminho_manifesto) if caminho_manifesto else None
+
+def _ingerir_arquivo_processo(arquivo_json):
+    """Ingere um arquivo em um processo de trabalho, devolvendo o erro em vez de lançá-lo."""
+    inicio = time.monotonic()
+    try:
+        resultado = ingerir_arquivo(arquivo_json, unidade_do_arquivo(arquivo_json), _manifesto_processo)
+        resultado["erro"] = None if resultado["concluido"] else "processamento interrompido"
+    except Exception as e:
+        resultado = {"arquivo": arquivo_json, "ignorado": False, "registros": 0, "concluido": False, "erro": str(e)}
+    resultado["segundos"] = time.monotonic() - inicio
+    # As métricas do arquivo voltam ao processo principal, que as soma às suas
+    resultado["metricas"] = metrics.snapshot()
+    metrics.reset()
+    return resultado
+
+def ingerir_paralelo(arquivos_json, processos=None, caminho_manifesto=None):
+    """
+    Ingere vários arquivos em paralelo, distribuindo-os entre processos de trabalho.
+    
+    Cada processo tem seu próprio TableClient; a falha de um arquivo não interrompe os demais.
+    
+    Parâmetros:
+        arquivos_json (list): Caminhos dos arquivos de dados
+        processos (int): Número de processos (padrão: número de CPUs)
+        caminho_manifesto (str): Arquivo do manifesto de ingestão compartilhado (opcional)
+    
+    Retorna:
+        dict: Totais de arquivos, registros, ignorados, falhas e registros por segundo
+    """
+    processos = processos or os.cpu_count() or 1
+    inicio = time.monotonic()
+    totais = {"arquivos": 0, "registros": 0, "ignorados": 0, "falhas": []}
+    
+    with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo, initargs=(caminho_manifesto, indexar_nomes, gerar_agregados, codificacao_dados, modo_upsert, (int(agendador.controle.limite), agendador.controle.maximo))) as executor:
+        futuros = [executor.submit(_ingerir_arquivo_processo, arquivo_json) for arquivo_json in arquivos_json]
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            metrics.merge(resultado.pop("metricas"))
+            totais["arquivos"] += 1
+            totais["registros"] += resultado["registros"]
+            totais["ignorados"] += resultado["ignorado"]
+            if resultado["erro"]:
+                totais["falhas"].append((resultado["arquivo"], resultado["erro"]))
+            decorrido = time.monotonic() - inicio
+            situacao = "ignorado" if resultado["ignorado"] else (f"falha: {resultado['erro']}" if resultado["erro"] else "ok")
+            print(
+                f"[{totais['arquivos']}/{len(arquivos_json)}] {resultado['arquivo']}: {resultado['registros']} registros "
+                f"em {resultado['segundos']:.1f}s ({situacao}) | total {totais['registros']} registros, "
+                f"{totais['registros'] / decorrido:.1f} registros/s"
+            )
+    
+    totais["segundos"] = time.monotonic() - inicio
+    totais["registros_por_segundo"] = totais["registros"] / totais["segundos"] if totais["segundos"] > 0 else 0.0
+    print(
+        f"Ingestão paralela concluída em {totais['segundos']:.1f}s com {processos} processos: "
+        f"{totais['arquivos']} arquivos, {totais['registros']} registros ({totais['registros_por_segundo']:.1f} registros/s), "
+        f"{totais['ignorados']} ignorados, {len(totais['falhas'])} falhas"
+    )
+    for arquivo_json, erro in totais["falhas"]:
+        print(f"  Falha em {arquivo_json}: {erro}")
+    return totais
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Salva os arquivos JSON extraídos no Azure Table Storage"
+    )
+    parser.add_argument("--pasta_json", help="Pasta com os arquivos JSON", default=".json")
+    parser.add_argument(
+        "--lote",
+        help="Quantidade de arquivos agrupados por envio em lote (0 para salvar uma entidade por vez)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--escritores", help="Escritas simultâneas iniciais (ajustadas conforme o throttling do serviço)", type=int, default=8
+    )
+    parser.add_argument(
+        "--escritores_max", help="Limite máximo de escritas simultâneas no modo em lote", type=int, default=32
+    )
+    parser.add_argument(
+        "--processos",
+        help="Número de processos para ingerir arquivos em paralelo (0 ou 1 para sequencial)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--manifesto",
+        help="Arquivo do manifesto de ingestão (padrão: .manifesto_ingestao.sqlite dentro da pasta dos JSON)",
+    )
+    parser.add_argument(
+        "--sem_indice_nomes",
+        help="Não atualiza o índice de busca por nome",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--codificacao",
+        help="Codificação do registro nas entidades: json (dados_json sem compressão, padrão) ou zlib (compacta)",
+        choices=ENCODINGS,
+        default=codificacao_dados,
+    )
+    parser.add_argument(
+        "--sem_agregados",
+        help="Não atualiza os agregados por unidade gestora, evento e mês",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--upsert",
+        help="Substitui os registros cujo conteúdo mudou (meses republicados), ignorando os inalterados",
+        action="store_true",
+    )
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    metrics.configure("ingestao")
     # Lê todos os arquivos da pasta .json e salva no Azure Table Storage
-    pasta_json = ".json"
-    arquivos_json = [f for f in os.listdir(pasta_json) if f.endswith('.json')]
-
-    for arquivo in arquivos_json:
-        arquivo_json = os.path.join(pasta_json, arquivo)
-        # Extrai o código da unidade do nome do arquivo (exemplo: unidade_1)
-        codigo_unidade = int(arquivo.split('_unidade_')[1].split('.')[0]) if '_unidade_' in arquivo else 0
-        ler_e_salvar_azure(arquivo_json, codigo_unidade)
-        print(f"Arquivo {arquivo_json} processado e salvo no Azure Table Storage.")
-        # Adicione um pequeno atraso para evitar sobrecarga na API do Azure
-        sleep(0.5)
+    pasta_json = args.pasta_json
+    arquivos_json = [f for f in sorted(os.listdir(pasta_json)) if f.endswith(EXTENSOES_DADOS)]
+    caminho_manifesto = args.manifesto or os.path.join(pasta_json, ".manifesto_ingestao.sqlite")
+    manifesto = ManifestoIngestao(caminho_manifesto)
+    indexar_nomes = not args.sem_indice_nomes
+    gerar_agregados = not args.sem_agregados
+    codificacao_dados = args.codificacao
+    modo_upsert = args.upsert
+    agendador = AgendadorEscritas(inicial=args.escritores, maximo=max(args.escritores, args.escritores_max))
+
+    if args.processos > 1:
+        ingerir_paralelo([os.path.join(pasta_json, arquivo) for arquivo in arquivos_json], args.processos, caminho_manifesto)
+    elif args.lote > 0:
+        # Agrupa os arquivos da mesma unidade para que as matrículas se repitam entre meses
+        arquivos_json.sort(key=lambda arquivo: (unidade_do_arquivo(arquivo), arquivo))
+        for i in range(0, len(arquivos_json), args.lote):
+            grupo = [os.path.join(pasta_json, arquivo) for arquivo in arquivos_json[i:i + args.lote]]
+            salvar_arquivos_azure_lote(grupo, args.escritores, manifesto)
+    else:
+        for arquivo in arquivos_json:
+            arquivo_json = os.path.join(pasta_json, arquivo)
+            # Extrai o código da unidade do nome do arquivo (exemplo: unidade_1)
+            codigo_unidade = unidade_do_arquivo(arquivo)
+            if ler_e_salvar_azure(arquivo_json, codigo_unidade, manifesto):
+                print(f"Arquivo {arquivo_json} processado e salvo no Azure Table Storage.")
+                # Adicione um pequeno atraso para evitar sobrecarga na API do Azure
+                time.sleep(0.5)
+    metrics.report()
@@ -1,8 +1,18 @@
 import curl_cffi.requests as requests
+from curl_cffi import CurlHttpVersion
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import os
 import json
+import gzip
+
+from pipeline_metrics import metrics
+
+# Endereço base do portal (pode ser sobrescrito para apontar para um servidor local de testes)
+URL_BASE_PORTAL = os.getenv("PORTAL_URL_BASE", "https://portaltransparencia.itajai.sc.gov.br:443")
+CAMINHO_API_PESSOAL = "/epublica-portal/rest/itajai/api/v1/pessoal"
 
 def formatar_data(mes, ano):
     """Formata o mês e ano para o formato mm/aaaa requerido pela API."""
@@ -26,68 +36,291 @@ def criar_intervalo_datas(data_inicio, data_fim):
     
     return datas
 
-def obter_dados_pessoal(referencia, codigo_unidade=0):
+class LimitadorTaxa:
+    """
+    Limita a quantidade de requisições por segundo, inclusive entre várias threads.
+    
+    Parâmetros:
+        requisicoes_por_segundo (float): Orçamento de requisições por segundo (0 ou menos para não limitar)
+    """
+    def __init__(self, requisicoes_por_segundo):
+        self.intervalo = 1.0 / requisicoes_por_segundo if requisicoes_por_segundo and requisicoes_por_segundo > 0 else 0.0
+        self._proximo_horario = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        """Bloqueia até que a próxima requisição possa ser feita dentro do orçamento."""
+        if not self.intervalo:
+            return
+        with self._lock:
+            agora = time.monotonic()
+            espera = self._proximo_horario - agora
+            self._proximo_horario = max(self._proximo_horario, agora) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+class ClientePortal:
+    """
+    Cliente reutilizável da API do portal da transparência.
+    
+    Mantém uma sessão com conexões persistentes (keep-alive, HTTP/2 quando disponível),
+    negocia compressão via Accept-Encoding e contabiliza os bytes trafegados na rede
+    versus os bytes decodificados de cada requisição. Pode ser compartilhado entre threads.
+    
+    Parâmetros:
+        url_base (str): Endereço base do portal (padrão: URL_BASE_PORTAL)
+        timeout_conexao (float): Tempo máximo, em segundos, para estabelecer a conexão
+        timeout_leitura (float): Tempo máximo, em segundos, para receber a resposta
+        accept_encoding (str): Codificações de compressão aceitas
+        verificar_ssl (bool): Verifica o certificado SSL do portal
+    """
+    def __init__(self, url_base=None, timeout_conexao=10, timeout_leitura=120,
+                 accept_encoding="gzip, deflate, br", verificar_ssl=False):
+        self.url_base = url_base or URL_BASE_PORTAL
+        self.accept_encoding = accept_encoding
+        self.sessao = requests.Session(
+            verify=verificar_ssl,
+            timeout=(timeout_conexao, timeout_leitura),
+            http_version=CurlHttpVersion.V2TLS,
+        )
+        self.estatisticas = {"requisicoes": 0, "bytes_rede": 0, "bytes_decodificados": 0}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        """Encerra a sessão e suas conexões."""
+        self.sessao.close()
+
+    def obter(self, caminho, params=None):
+        """
+        Faz uma requisição GET na sessão compartilhada.
+        
+        Parâmetros:
+            caminho (str): Caminho da API a partir de url_base
+            params (dict): Parâmetros da query string
+        
+        Retorna:
+            Response: Resposta HTTP (lança exceção para erros HTTP)
+        """
+        try:
+            with metrics.timer("http_request", mode="json"):
+                response = self.sessao.get(self.url_base + caminho, params=params, accept_encoding=self.accept_encoding)
+                response.raise_for_status()
+        except Exception:
+            metrics.increment("http_errors", mode="json")
+            raise
+        
+        bytes_rede = response.download_size
+        bytes_decodificados = len(response.content)
+        with self._lock:
+            self.estatisticas["requisicoes"] += 1
+            self.estatisticas["bytes_rede"] += bytes_rede
+            self.estatisticas["bytes_decodificados"] += bytes_decodificados
+        metrics.increment("http_bytes", bytes_rede, kind="rede")
+        metrics.increment("http_bytes", bytes_decodificados, kind="decodificados")
+        codificacao = response.headers.get("Content-Encoding", "identity")
+        print(f"{caminho} {params or ''}: {bytes_rede} bytes na rede, {bytes_decodificados} bytes decodificados ({codificacao})")
+        return response
+
+    def baixar_para_arquivo(self, caminho, params, arquivo_destino, tamanho_bloco=1 << 16):
+        """
+        Faz uma requisição GET e grava o corpo da resposta em um arquivo à medida que chega,
+        sem decodificar o JSON.
+        
+        Parâmetros:
+            caminho (str): Caminho da API a partir de url_base
+            params (dict): Parâmetros da query string
+            arquivo_destino (file): Arquivo binário aberto para escrita
+            tamanho_bloco (int): Tamanho dos blocos lidos da resposta
+        
+        Retorna:
+            int: Quantidade de bytes decodificados gravados
+        """
+        inicio = time.perf_counter()
+        try:
+            response = self.sessao.get(self.url_base + caminho, params=params, accept_encoding=self.accept_encoding, stream=True)
+            try:
+                response.raise_for_status()
+                bytes_decodificados = 0
+                for bloco in response.iter_content(tamanho_bloco):
+                    arquivo_destino.write(bloco)
+                    bytes_decodificados += len(bloco)
+            finally:
+                response.close()
+        except Exception:
+            metrics.increment("http_errors", mode="stream")
+            raise
+        finally:
+            # Inclui o tempo de receber e gravar o corpo da resposta
+            metrics.observe("http_request", time.perf_counter() - inicio, mode="stream")
+        
+        # Em modo streaming o tamanho na rede vem do Content-Length (quando informado)
+        bytes_rede = response.download_size or int(response.headers.get("Content-Length") or bytes_decodificados)
+        with self._lock:
+            self.estatisticas["requisicoes"] += 1
+            self.estatisticas["bytes_rede"] += bytes_rede
+            self.estatisticas["bytes_decodificados"] += bytes_decodificados
+        metrics.increment("http_bytes", bytes_rede, kind="rede")
+        metrics.increment("http_bytes", bytes_decodificados, kind="decodificados")
+        codificacao = response.headers.get("Content-Encoding", "identity")
+        print(f"{caminho} {params or ''}: {bytes_rede} bytes na rede, {bytes_decodificados} bytes decodificados ({codificacao})")
+        return bytes_decodificados
+
+    def obter_dados_pessoal(self, referencia, codigo_unidade=0):
+        """
+        Obtém dados da API de pessoal da prefeitura de Itajaí.
+        
+        Parâmetros:
+            referencia (str): Data de referência no formato "mm/aaaa"
+            codigo_unidade (int): Código da unidade (0 para todas)
+        
+        Retorna:
+            dict: Dados obtidos da API
+        """
+        params = {
+            "referencia": referencia,
+            "codigo_unidade": codigo_unidade
+        }
+        return self.obter(CAMINHO_API_PESSOAL, params).json()
+
+    def resumo_transferencia(self):
+        """Retorna um texto com o total de bytes trafegados versus decodificados."""
+        with self._lock:
+            e = dict(self.estatisticas)
+        economia = 100 * (1 - e["bytes_rede"] / e["bytes_decodificados"]) if e["bytes_decodificados"] else 0.0
+        return (f"{e['requisicoes']} requisições: {e['bytes_rede']} bytes na rede, "
+                f"{e['bytes_decodificados']} bytes decodificados (economia de {economia:.1f}%)")
+
+# Clientes compartilhados por endereço base, para reaproveitar conexões entre chamadas
+_clientes_portal = {}
+_clientes_portal_lock = threading.Lock()
+
+def obter_cliente_portal(url_base=None):
+    """Retorna o ClientePortal compartilhado para o endereço base informado, criando-o se necessário."""
+    url_base = url_base or URL_BASE_PORTAL
+    with _clientes_portal_lock:
+        if url_base not in _clientes_portal:
+            _clientes_portal[url_base] = ClientePortal(url_base)
+        return _clientes_portal[url_base]
+
+def obter_dados_pessoal(referencia, codigo_unidade=0, url_base=None, cliente=None):
     """
     Obtém dados da API de pessoal da prefeitura de Itajaí.
     
     Parâmetros:
         referencia (str): Data de referência no formato "mm/aaaa"
         codigo_unidade (int): Código da unidade (0 para todas)
+        url_base (str): Endereço base do portal (padrão: URL_BASE_PORTAL)
+        cliente (ClientePortal): Cliente a ser usado (padrão: cliente compartilhado de url_base)
     
     Retorna:
         dict: Dados obtidos da API ou None em caso de erro
     """
-    url = "https://portaltransparencia.itajai.sc.gov.br:443/epublica-portal/rest/itajai/api/v1/pessoal"
-    
-    params = {
-        "referencia": referencia,
-        "codigo_unidade": codigo_unidade
-    }
+    cliente = cliente or obter_cliente_portal(url_base)
     
     try:
-        # Desabilita a verificação SSL para resolver o problema de certificado
-        response = requests.get(url, params=params, verify=False)
-        response.raise_for_status()  # Lança exceção para erros HTTP
-        return response.json()
+        return cliente.obter_dados_pessoal(referencia, codigo_unidade)
     except Exception as e:
         print(f"Erro ao obter dados para {referencia}: {e}")
         return None
 
-def obter_todos_registros(referencia, codigo_unidade=0):
+def obter_todos_registros(referencia, codigo_unidade=0, url_base=None, cliente=None):
     """
     Obtém todos os registros para uma data de referência específica.
     
     Parâmetros:
         referencia (str): Data de referência no formato "mm/aaaa"
         codigo_unidade (int): Código da unidade (0 para todas)
+        url_base (str): Endereço base do portal (padrão: URL_BASE_PORTAL)
+        cliente (ClientePortal): Cliente a ser usado (padrão: cliente compartilhado de url_base)
     
     Retorna:
         dict: Dados completos obtidos da API
     """
     print(f"Obtendo registros de {referencia} para unidade {codigo_unidade}")
-    return obter_dados_pessoal(referencia, codigo_unidade)
+    return obter_dados_pessoal(referencia, codigo_unidade, url_base, cliente)
+
+def caminho_arquivo_dados(referencia, codigo_unidade, pasta_saida=".json", extensao=".json"):
+    """Monta o caminho do arquivo de dados brutos de uma referência (ex.: pessoal_itajai_01_2019_unidade_1.json)."""
+    # Sanitizar referência para uso como nome de arquivo
+    ref_arquivo = referencia.replace("/", "_")
+    unidade_str = f"_unidade_{codigo_unidade}" if codigo_unidade > 0 else ""
+    return os.path.join(pasta_saida, f"pessoal_itajai_{ref_arquivo}{unidade_str}{extensao}")
 
 def salvar_dados_json(dados, referencia, codigo_unidade, pasta_saida=".json"):
-    """Salva os dados brutos em um arquivo JSON."""
+    """Salva os dados brutos em um arquivo JSON e retorna o caminho do arquivo."""
     if not dados:
         print(f"Sem dados para salvar para {referencia}")
+        metrics.increment("scrape_files", situacao="falha")
         return
     
-    # Criar pasta de saída se não existir
-    if not os.path.exists(pasta_saida):
-        os.makedirs(pasta_saida)
+    # Criar pasta de saída se não existir (exist_ok: várias threads podem criá-la ao mesmo tempo)
+    os.makedirs(pasta_saida, exist_ok=True)
     
-    # Sanitizar referência para uso como nome de arquivo
-    ref_arquivo = referencia.replace("/", "_")
-    unidade_str = f"_unidade_{codigo_unidade}" if codigo_unidade > 0 else ""
-    caminho_arquivo = os.path.join(pasta_saida, f"pessoal_itajai_{ref_arquivo}{unidade_str}.json")
+    caminho_arquivo = caminho_arquivo_dados(referencia, codigo_unidade, pasta_saida)
     
     with open(caminho_arquivo, 'w', encoding='utf-8') as f:
         json.dump(dados, f, ensure_ascii=False, indent=2)
     
     print(f"Dados JSON salvos em {caminho_arquivo}")
+    metrics.increment("scrape_files", situacao="salvo")
+    metrics.increment("scrape_records", len(dados.get("registros", [])))
+    return caminho_arquivo
 
-def extrair_dados_intervalo(data_inicio, data_fim, codigo_unidade=0, pasta_json=".json"):
+def salvar_dados_compactados(referencia, codigo_unidade, pasta_saida=".json", url_base=None, cliente=None):
+    """
+    Baixa os dados de uma referência gravando a resposta da API diretamente em um
+    arquivo JSON compactado com gzip (.json.gz), sem montar o objeto Python completo.
+    
+    O arquivo é gravado em um temporário e renomeado ao final, para que uma
+    extração interrompida nunca deixe um arquivo parcial com o nome definitivo.
+    
+    Parâmetros:
+        referencia (str): Data de referência no formato "mm/aaaa"
+        codigo_unidade (int): Código da unidade (0 para todas)
+        pasta_saida (str): Pasta onde o arquivo será salvo
+        url_base (str): Endereço base do portal (padrão: URL_BASE_PORTAL)
+        cliente (ClientePortal): Cliente a ser usado (padrão: cliente compartilhado de url_base)
+    
+    Retorna:
+        str: Caminho do arquivo salvo ou None em caso de erro
+    """
+    cliente = cliente or obter_cliente_portal(url_base)
+    
+    # Criar pasta de saída se não existir
+    os.makedirs(pasta_saida, exist_ok=True)
+    
+    caminho_arquivo = caminho_arquivo_dados(referencia, codigo_unidade, pasta_saida, ".json.gz")
+    caminho_temporario = caminho_arquivo + ".parcial"
+    params = {
+        "referencia": referencia,
+        "codigo_unidade": codigo_unidade
+    }
+    
+    print(f"Obtendo registros de {referencia} para unidade {codigo_unidade}")
+    try:
+        with gzip.open(caminho_temporario, 'wb', compresslevel=6) as f:
+            bytes_gravados = cliente.baixar_para_arquivo(CAMINHO_API_PESSOAL, params, f)
+        if not bytes_gravados:
+            raise ValueError("resposta vazia")
+        os.replace(caminho_temporario, caminho_arquivo)
+    except Exception as e:
+        print(f"Erro ao obter dados para {referencia}: {e}")
+        if os.path.exists(caminho_temporario):
+            os.remove(caminho_temporario)
+        metrics.increment("scrape_files", situacao="falha")
+        return None
+    
+    print(f"Dados JSON compactados salvos em {caminho_arquivo} ({os.path.getsize(caminho_arquivo)} bytes)")
+    metrics.increment("scrape_files", situacao="salvo")
+    return caminho_arquivo
+
+def extrair_dados_intervalo(data_inicio, data_fim, codigo_unidade=0, pasta_json=".json", requisicoes_por_segundo=1.0, url_base=None, compactado=False):
     """
     Extrai dados para um intervalo de datas e salva em arquivos JSON.
     
@@ -96,37 +329,116 @@ def extrair_dados_intervalo(data_inicio, data_fim, codigo_unidade=0, pasta_json=
         data_fim (str): Data final no formato "mm/yyyy"
         codigo_unidade (int): Código da unidade (0 para todas)
         pasta_json (str): Pasta onde os arquivos JSON serão salvos
+        requisicoes_por_segundo (float): Orçamento de requisições por segundo
+        url_base (str): Endereço base do portal (padrão: URL_BASE_PORTAL)
+        compactado (bool): Grava a resposta diretamente em .json.gz (ver salvar_dados_compactados)
     """
     datas = criar_intervalo_datas(data_inicio, data_fim)
+    limitador = LimitadorTaxa(requisicoes_por_segundo)
     
     for data in datas:
         # Converter para o formato esperado pela API (mm/aaaa)
         referencia = data
         print(f"\nProcessando dados para {referencia}, unidade {codigo_unidade}")
         
+        # Respeita o orçamento de requisições entre meses
+        limitador.aguardar()
+        
+        if compactado:
+            salvar_dados_compactados(referencia, codigo_unidade, pasta_json, url_base)
+            continue
+        
         # Obter dados para a referência
-        dados = obter_todos_registros(referencia, codigo_unidade)
+        dados = obter_todos_registros(referencia, codigo_unidade, url_base)
         
         # Salvar dados em JSON
         salvar_dados_json(dados, referencia, codigo_unidade, pasta_json)
-        
-        # Pausa entre solicitações de diferentes meses
-        time.sleep(1)
+    
+    print(obter_cliente_portal(url_base).resumo_transferencia())
+
+def _extrair_referencia_unidade(referencia, codigo_unidade, pasta_json, limitador, url_base, compactado):
+    """Obtém e salva os dados de um par (referência, unidade), retornando o caminho salvo ou None."""
+    limitador.aguardar()
+    if compactado:
+        return salvar_dados_compactados(referencia, codigo_unidade, pasta_json, url_base)
+    dados = obter_todos_registros(referencia, codigo_unidade, url_base)
+    return salvar_dados_json(dados, referencia, codigo_unidade, pasta_json)
+
+def extrair_dados_concorrente(data_inicio, data_fim, codigos_unidade=(0,), pasta_json=".json",
+                              max_simultaneas=4, requisicoes_por_segundo=2.0, url_base=None, compactado=False):
+    """
+    Extrai dados de vários pares (referência, unidade) com requisições simultâneas.
+    
+    Cada resultado é salvo assim que sua requisição termina. O número de requisições
+    em andamento nunca passa de max_simultaneas e o ritmo de novas requisições
+    respeita requisicoes_por_segundo.
+    
+    Parâmetros:
+        data_inicio (str): Data inicial no formato "mm/yyyy"
+        data_fim (str): Data final no formato "mm/yyyy"
+        codigos_unidade (iterable): Códigos das unidades (0 para todas)
+        pasta_json (str): Pasta onde os arquivos JSON serão salvos
+        max_simultaneas (int): Número máximo de requisições em andamento
+        requisicoes_por_segundo (float): Orçamento de requisições por segundo
+        url_base (str): Endereço base do portal (padrão: URL_BASE_PORTAL)
+        compactado (bool): Grava a resposta diretamente em .json.gz (ver salvar_dados_compactados)
+    
+    Retorna:
+        dict: Resumo com os arquivos salvos e os pares que falharam
+    """
+    tarefas = [
+        (referencia, codigo_unidade)
+        for referencia in criar_intervalo_datas(data_inicio, data_fim)
+        for codigo_unidade in codigos_unidade
+    ]
+    limitador = LimitadorTaxa(requisicoes_por_segundo)
+    resumo = {"salvos": [], "falhas": []}
+    inicio = time.monotonic()
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_simultaneas)) as executor:
+        futuros = {
+            executor.submit(_extrair_referencia_unidade, referencia, codigo_unidade, pasta_json, limitador, url_base, compactado): (referencia, codigo_unidade)
+            for referencia, codigo_unidade in tarefas
+        }
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            referencia, codigo_unidade = futuros[futuro]
+            try:
+                caminho_arquivo = futuro.result()
+            except Exception as e:
+                print(f"Erro ao processar {referencia}, unidade {codigo_unidade}: {e}")
+                caminho_arquivo = None
+            if caminho_arquivo:
+                resumo["salvos"].append(caminho_arquivo)
+            else:
+                resumo["falhas"].append((referencia, codigo_unidade))
+            print(f"[{concluidos}/{len(tarefas)}] {referencia}, unidade {codigo_unidade} concluído")
+    
+    print(f"Extração concluída em {time.monotonic() - inicio:.1f}s: {len(resumo['salvos'])} arquivos salvos, {len(resumo['falhas'])} falhas")
+    print(obter_cliente_portal(url_base).resumo_transferencia())
+    return resumo
 
 if __name__ == "__main__":
+    metrics.configure("extracao")
     # Defina o intervalo de datas que deseja extrair
     data_inicio = input("Data inicial (mm/yyyy): ")
     data_fim = input("Data final (mm/yyyy): ")
-    codigo_unidade = int(input("Código da unidade (0 para todas): "))
+    codigos_unidade = [int(c) for c in input("Códigos das unidades separados por vírgula (0 para todas): ").split(",")]
+    max_simultaneas = int(input("Requisições simultâneas (1 para sequencial): ") or 1)
+    requisicoes_por_segundo = float(input("Requisições por segundo: ") or 1)
+    compactado = input("Salvar compactado em .json.gz? (s/N): ").strip().lower() == "s"
     
     # Pasta onde os arquivos serão salvos
     pasta_base = os.path.dirname(os.path.abspath(__file__))
     pasta_json = os.path.join(pasta_base, ".json2")
     
-    print(f"Iniciando extração de dados de {data_inicio} até {data_fim} para unidade {codigo_unidade}")
+    print(f"Iniciando extração de dados de {data_inicio} até {data_fim} para unidades {codigos_unidade}")
     print(f"Os dados JSON brutos serão salvos em {pasta_json}")
     
-    extrair_dados_intervalo(data_inicio, data_fim, codigo_unidade, pasta_json)
+    if max_simultaneas > 1 or len(codigos_unidade) > 1:
+        extrair_dados_concorrente(data_inicio, data_fim, codigos_unidade, pasta_json, max_simultaneas, requisicoes_por_segundo, compactado=compactado)
+    else:
+        extrair_dados_intervalo(data_inicio, data_fim, codigos_unidade[0], pasta_json, requisicoes_por_segundo, compactado=compactado)
     
     print("\nExtração de dados concluída!")
+    metrics.report()
 
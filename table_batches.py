@@ -0,0 +1,55 @@
+from collections import defaultdict
+
+from payload_codec import payload_size
+
+# Limites de uma transação (entity group transaction) do Azure Table Storage
+MAX_OPERACOES_LOTE = 100
+MAX_BYTES_LOTE = 3 * 1024 * 1024  # margem abaixo do limite de 4 MiB por transação
+
+
+def tamanho_entidade(entity):
+    """Tamanho aproximado, em bytes, de uma entidade em uma transação (registro, resumo e demais propriedades)."""
+    return payload_size(entity) + len(entity.get("resumo_eventos", "")) + 1024
+
+
+def agrupar_em_lotes(entidades, max_entidades=MAX_OPERACOES_LOTE):
+    """
+    Agrupa entidades que compartilham a PartitionKey em lotes de transação.
+
+    Parâmetros:
+        entidades (iterable): Entidades a serem salvas
+        max_entidades (int): Máximo de entidades por lote (metade do limite de operações quando
+                             cada entidade gera duas operações, como na migração de RowKeys)
+
+    Retorna:
+        tuple: Lista de lotes (cada um com 2 a max_entidades entidades da mesma partição e
+               até MAX_BYTES_LOTE bytes) e lista de entidades avulsas
+    """
+    por_particao = defaultdict(list)
+    for entity in entidades:
+        por_particao[entity["PartitionKey"]].append(entity)
+
+    lotes = []
+    avulsas = []
+    for grupo in por_particao.values():
+        lote = []
+        bytes_lote = 0
+        row_keys = set()
+        for entity in grupo:
+            # Uma transação não pode conter a mesma entidade duas vezes
+            if entity["RowKey"] in row_keys:
+                avulsas.append(entity)
+                continue
+            row_keys.add(entity["RowKey"])
+            bytes_entidade = tamanho_entidade(entity)
+            if lote and (len(lote) == max_entidades or bytes_lote + bytes_entidade > MAX_BYTES_LOTE):
+                lotes.append(lote)
+                lote, bytes_lote = [], 0
+            lote.append(entity)
+            bytes_lote += bytes_entidade
+        lotes.append(lote)
+
+    # Lotes de uma única entidade não economizam requisições
+    avulsas += [lote[0] for lote in lotes if len(lote) == 1]
+    lotes = [lote for lote in lotes if len(lote) > 1]
+    return lotes, avulsas
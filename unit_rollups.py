@@ -0,0 +1,305 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from data_files import LeitorRegistros, listar_arquivos_dados, referencia_do_arquivo, registro_do_item, unidade_do_arquivo
+from table_queries import row_key
+
+# Limite de operações por transação do Azure Table Storage
+MAX_BATCH_OPERATIONS = 100
+
+# Prefixos das RowKeys: agregados por evento (E_) e por unidade (U_)
+EVENT_PREFIX = "E_"
+UNIT_PREFIX = "U_"
+
+EVENT_COLUMNS = [
+    "referencia", "codigo_unidade", "unidade", "denominacao", "tipoEvento",
+    "quantidade", "servidores", "valor_total", "valor_minimo", "valor_maximo",
+]
+UNIT_COLUMNS = [
+    "referencia", "codigo_unidade", "unidade", "servidores", "eventos", "total_proventos", "total_descontos",
+]
+
+
+def _unit_key(codigo_unidade):
+    # Caracteres fora de [0-9A-Za-z-] não são seguros em RowKeys
+    return re.sub(r"[^0-9A-Za-z-]", "-", str(codigo_unidade))
+
+
+def event_row_key(codigo_unidade, denominacao):
+    """RowKey do agregado de um evento em uma unidade (a denominação pode conter "/", por isso vai em hash)."""
+    digest = hashlib.sha1(denominacao.encode("utf-8")).hexdigest()[:16]
+    return f"{EVENT_PREFIX}{_unit_key(codigo_unidade)}_{digest}"
+
+
+def unit_row_key(codigo_unidade):
+    """RowKey do agregado de uma unidade (servidores e totais)."""
+    return f"{UNIT_PREFIX}{_unit_key(codigo_unidade)}"
+
+
+class RollupAccumulator:
+    """
+    Acumula, para uma referência, os agregados por (unidade gestora, evento) — quantidade,
+    servidores distintos, soma, mínimo e máximo de valorEvento — e por unidade — servidores,
+    eventos, total de proventos e de descontos.
+
+    Parâmetros:
+        referencia (str): Referência no formato "mm/aaaa"
+        codigo_unidade (int): Unidade do arquivo, usada quando o registro não traz unidadeGestora
+    """
+
+    def __init__(self, referencia, codigo_unidade=0):
+        self.referencia = referencia
+        self.codigo_unidade = codigo_unidade
+        self.events = {}
+        self.units = {}
+
+    def add(self, registro):
+        """Acrescenta um registro (servidor em uma referência) aos agregados."""
+        unidade_gestora = registro.get("unidadeGestora") or {}
+        codigo = str(unidade_gestora.get("codigo", self.codigo_unidade))
+        matricula = str((registro.get("matricula") or {}).get("numero", ""))
+        unit = self.units.setdefault(codigo, {
+            "unidade": unidade_gestora.get("denominacao", ""),
+            "servidores": set(),
+            "eventos": 0,
+            "total_proventos": 0.0,
+            "total_descontos": 0.0,
+        })
+        unit["servidores"].add(matricula)
+        for folha in registro.get("listFolha", []):
+            for evento in folha["listEventos"]:
+                valor = evento["valorEvento"]
+                tipo = evento["tipoEventoDenominacao"]
+                unit["eventos"] += 1
+                if tipo == "Provento":
+                    unit["total_proventos"] += valor
+                else:
+                    unit["total_descontos"] += valor
+                current = self.events.get((codigo, evento["denominacao"]))
+                if current is None:
+                    self.events[(codigo, evento["denominacao"])] = {
+                        "tipoEvento": tipo,
+                        "quantidade": 1,
+                        "servidores": {matricula},
+                        "valor_total": valor,
+                        "valor_minimo": valor,
+                        "valor_maximo": valor,
+                    }
+                    continue
+                current["quantidade"] += 1
+                current["servidores"].add(matricula)
+                current["valor_total"] += valor
+                current["valor_minimo"] = min(current["valor_minimo"], valor)
+                current["valor_maximo"] = max(current["valor_maximo"], valor)
+
+    def entities(self):
+        """Entidades do Azure Table Storage dos agregados (PartitionKey = referência "aaaa_mm")."""
+        partition_key = row_key(self.referencia)
+        for codigo, unit in self.units.items():
+            yield {
+                "PartitionKey": partition_key,
+                "RowKey": unit_row_key(codigo),
+                "referencia": self.referencia,
+                "codigo_unidade": codigo,
+                "unidade": unit["unidade"],
+                "servidores": len(unit["servidores"]),
+                "eventos": unit["eventos"],
+                "total_proventos": float(unit["total_proventos"]),
+                "total_descontos": float(unit["total_descontos"]),
+            }
+        for (codigo, denominacao), event in self.events.items():
+            yield {
+                "PartitionKey": partition_key,
+                "RowKey": event_row_key(codigo, denominacao),
+                "referencia": self.referencia,
+                "codigo_unidade": codigo,
+                "unidade": self.units[codigo]["unidade"],
+                "denominacao": denominacao,
+                "tipoEvento": event["tipoEvento"],
+                "quantidade": event["quantidade"],
+                "servidores": len(event["servidores"]),
+                "valor_total": float(event["valor_total"]),
+                "valor_minimo": float(event["valor_minimo"]),
+                "valor_maximo": float(event["valor_maximo"]),
+            }
+
+
+def rollup_file(arquivo_json):
+    """Calcula os agregados de um arquivo de dados brutos (.json ou .json.gz), lendo-o de forma incremental."""
+    accumulator = RollupAccumulator(referencia_do_arquivo(arquivo_json), unidade_do_arquivo(arquivo_json))
+    with LeitorRegistros(arquivo_json) as leitor:
+        for item in leitor:
+            registro = registro_do_item(item)
+            if registro:
+                accumulator.add(registro)
+    return accumulator
+
+
+def stale_rollups(table_client, accumulator, row_keys):
+    """
+    Agregados já gravados para as unidades do arquivo do acumulador que não existem mais nele
+    (evento ou unidade que sumiu de uma referência republicada). Um arquivo de todas as unidades
+    (código 0) cobre a partição inteira; o de uma unidade, só ela e as unidades dos seus registros.
+    """
+    units = {str(codigo) for codigo in accumulator.units} | {str(accumulator.codigo_unidade)}
+    whole_partition = str(accumulator.codigo_unidade) == "0"
+    entities = table_client.query_entities(
+        "PartitionKey eq @pk", parameters={"pk": row_key(accumulator.referencia)}, select=["RowKey", "codigo_unidade"]
+    )
+    return [
+        entity["RowKey"]
+        for entity in entities
+        if entity["RowKey"] not in row_keys and (whole_partition or str(entity.get("codigo_unidade")) in units)
+    ]
+
+
+def save_rollups(table_client, accumulator):
+    """
+    Grava (upsert) os agregados de uma referência e remove os que o arquivo não traz mais, em
+    transações de até 100 operações. Todas compartilham a PartitionKey da referência.
+
+    Retorna:
+        tuple: Quantidade de entidades gravadas e de entidades removidas
+    """
+    entities = list(accumulator.entities())
+    stale = stale_rollups(table_client, accumulator, {entity["RowKey"] for entity in entities})
+    partition_key = row_key(accumulator.referencia)
+    operations = [("upsert", entity) for entity in entities] + [
+        ("delete", {"PartitionKey": partition_key, "RowKey": rk}) for rk in stale
+    ]
+    for start in range(0, len(operations), MAX_BATCH_OPERATIONS):
+        table_client.submit_transaction(operations[start:start + MAX_BATCH_OPERATIONS])
+    return len(entities), len(stale)
+
+
+def rollup_table_name(table_name):
+    """Nome da tabela de agregados (AZURE_ROLLUP_TABLE ou o nome da tabela principal + "Agregados")."""
+    return os.getenv("AZURE_ROLLUP_TABLE") or f"{table_name}Agregados"
+
+
+def month_keys(referencia_inicio, referencia_fim):
+    """PartitionKeys ("aaaa_mm") de todos os meses entre duas referências "mm/aaaa" (inclusive)."""
+    inicio = datetime.strptime(referencia_inicio, "%m/%Y")
+    fim = datetime.strptime(referencia_fim, "%m/%Y")
+    keys = []
+    ano, mes = inicio.year, inicio.month
+    while (ano, mes) <= (fim.year, fim.month):
+        keys.append(f"{ano}_{mes:02d}")
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return keys
+
+
+def query_rollups(table_client, referencia_inicio, referencia_fim, kind="eventos", codigo_unidade=None, denominacao=None):
+    """
+    Lê os agregados de um período com uma consulta por mês (uma única partição cada),
+    sem tocar nas entidades das matrículas.
+
+    Parâmetros:
+        table_client (TableClient): Cliente da tabela de agregados
+        referencia_inicio (str): Referência inicial no formato "mm/aaaa"
+        referencia_fim (str): Referência final no formato "mm/aaaa"
+        kind (str): "eventos" (por unidade e evento) ou "unidades" (servidores e totais por unidade)
+        codigo_unidade (str): Filtra uma unidade gestora (opcional)
+        denominacao (str): Filtra um evento (opcional, apenas para "eventos")
+
+    Retorna:
+        list: Agregados em ordem cronológica, como dicts com EVENT_COLUMNS ou UNIT_COLUMNS
+    """
+    if kind == "unidades":
+        prefix = unit_row_key(codigo_unidade) if codigo_unidade is not None else UNIT_PREFIX
+        columns = UNIT_COLUMNS
+    else:
+        prefix = f"{EVENT_PREFIX}{_unit_key(codigo_unidade)}_" if codigo_unidade is not None else EVENT_PREFIX
+        columns = EVENT_COLUMNS
+    if denominacao is not None and kind != "unidades" and codigo_unidade is not None:
+        # Evento e unidade conhecidos: leitura pontual da entidade
+        query = "PartitionKey eq @pk and RowKey eq @rk"
+        parameters = {"rk": event_row_key(codigo_unidade, denominacao)}
+    else:
+        # Prefixo da RowKey como intervalo: o caractere seguinte ao último do prefixo fecha o intervalo
+        query = "PartitionKey eq @pk and RowKey ge @inicio and RowKey lt @fim"
+        parameters = {"inicio": prefix, "fim": prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+    results = []
+    for partition_key in month_keys(referencia_inicio, referencia_fim):
+        parameters["pk"] = partition_key
+        for entity in table_client.query_entities(query, parameters=dict(parameters), select=columns):
+            if denominacao is not None and entity.get("denominacao") != denominacao:
+                continue
+            if codigo_unidade is not None and entity.get("codigo_unidade") != str(codigo_unidade):
+                continue
+            results.append({column: entity.get(column) for column in columns})
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Consulta (ou reconstrói) os agregados por unidade gestora, evento e mês"
+    )
+    parser.add_argument(
+        "--connection_string",
+        help="Connection string do Azure Storage",
+        default=os.getenv("AZURE_TABLE_CONNECTION_STRING"),
+    )
+    parser.add_argument(
+        "--table_name",
+        help="Tabela principal (a tabela de agregados é derivada dela)",
+        default=os.getenv("AZURE_TABLE_NAME", "RegistrosTabela"),
+    )
+    parser.add_argument("--inicio", help="Referência inicial (MM/AAAA)")
+    parser.add_argument("--fim", help="Referência final (MM/AAAA)")
+    parser.add_argument("--tipo", choices=["eventos", "unidades"], default="eventos", help="Agregados por evento ou por unidade")
+    parser.add_argument("--unidade", help="Código da unidade gestora")
+    parser.add_argument("--evento", help="Denominação do evento")
+    parser.add_argument("--output", help="Arquivo de saída (.csv ou .json; padrão: CSV na saída padrão)")
+    parser.add_argument(
+        "--reconstruir",
+        help="Recalcula e grava os agregados a partir dos arquivos de uma pasta de JSON",
+        metavar="PASTA_JSON",
+    )
+    return parser.parse_args()
+
+
+def write_rows(rows, columns, output):
+    if output and output.endswith(".json"):
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        return
+    f = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+    try:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if output:
+            f.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = parse_args()
+    if not args.connection_string:
+        raise SystemExit("Defina AZURE_TABLE_CONNECTION_STRING ou use --connection_string.")
+
+    from azure.data.tables import TableServiceClient
+
+    table_service = TableServiceClient.from_connection_string(args.connection_string)
+    rollup_table = table_service.create_table_if_not_exists(rollup_table_name(args.table_name))
+
+    if args.reconstruir:
+        for arquivo_json in listar_arquivos_dados(args.reconstruir):
+            gravadas, removidas = save_rollups(rollup_table, rollup_file(arquivo_json))
+            print(f"Agregados de {arquivo_json}: {gravadas} entidades gravadas, {removidas} removidas.")
+    else:
+        if not args.inicio or not args.fim:
+            raise SystemExit("Informe --inicio e --fim (MM/AAAA).")
+        rows = query_rollups(rollup_table, args.inicio, args.fim, args.tipo, args.unidade, args.evento)
+        write_rows(rows, UNIT_COLUMNS if args.tipo == "unidades" else EVENT_COLUMNS, args.output)
@@ -0,0 +1,186 @@
+import random
+import threading
+import time
+
+from pipeline_metrics import metrics
+
+# Códigos de erro do Azure Table Storage que indicam limitação de taxa ou operação expirada
+CODIGOS_THROTTLING = {"ServerBusy", "TooManyRequests"}
+CODIGOS_TIMEOUT = {"OperationTimedOut"}
+
+
+def classificar_erro(erro):
+    """
+    Classifica um erro de escrita no Azure Table Storage.
+
+    Retorna:
+        str: "existente" (EntityAlreadyExists), "throttling" (429/503, ServerBusy),
+             "timeout" (408/504, OperationTimedOut ou timeout de rede), "permanente"
+             (demais 4xx, que não adianta repetir) ou "transitorio" (5xx, falhas de
+             conexão e erros desconhecidos)
+    """
+    codigo = getattr(erro, "error_code", None)
+    codigo = getattr(codigo, "value", codigo)
+    status = getattr(erro, "status_code", None)
+    texto = str(erro)
+    if codigo == "EntityAlreadyExists" or "EntityAlreadyExists" in texto:
+        return "existente"
+    if status in (429, 503) or codigo in CODIGOS_THROTTLING or "ServerBusy" in texto:
+        return "throttling"
+    if (
+        status in (408, 504)
+        or codigo in CODIGOS_TIMEOUT
+        or isinstance(erro, TimeoutError)
+        or "Timeout" in type(erro).__name__
+    ):
+        return "timeout"
+    if status is not None and 400 <= status < 500:
+        return "permanente"
+    return "transitorio"
+
+
+def espera_sugerida(erro):
+    """Segundos do cabeçalho Retry-After da resposta do erro, se houver."""
+    resposta = getattr(erro, "response", None)
+    cabecalhos = getattr(resposta, "headers", None) or {}
+    try:
+        return float(cabecalhos.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class FalhaEscrita(Exception):
+    """
+    Escrita que não foi concluída: erro permanente, entidade existente ou tentativas esgotadas.
+
+    Atributos:
+        erro (Exception): Último erro recebido
+        tipo (str): Classificação do erro (ver classificar_erro)
+        tentativas (int): Número de requisições feitas
+    """
+
+    def __init__(self, erro, tipo, tentativas):
+        super().__init__(str(erro))
+        self.erro = erro
+        self.tipo = tipo
+        self.tentativas = tentativas
+
+
+class ControleConcorrencia:
+    """
+    Limite adaptativo de requisições simultâneas (AIMD): cada sucesso aumenta o limite
+    em 1/limite (cerca de +1 a cada rodada de requisições) e cada throttling o multiplica
+    por fator_reducao. Só os erros de requisições iniciadas depois da última redução
+    reduzem o limite de novo, para que uma rajada de 503 conte como um único sinal.
+
+    Parâmetros:
+        inicial (int): Limite inicial de requisições simultâneas
+        minimo (int): Limite mínimo
+        maximo (int): Limite máximo
+        fator_reducao (float): Fator aplicado ao limite a cada throttling
+    """
+
+    def __init__(self, inicial=8, minimo=1, maximo=32, fator_reducao=0.5):
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.fator_reducao = fator_reducao
+        self.limite = float(min(max(inicial, self.minimo), self.maximo))
+        self.reducoes = 0
+        self._em_andamento = 0
+        self._epoca = 0
+        self._condicao = threading.Condition()
+
+    def adquirir(self):
+        """Bloqueia até haver vaga dentro do limite. Retorna a época, a ser passada para liberar()."""
+        with self._condicao:
+            while self._em_andamento >= int(self.limite):
+                self._condicao.wait()
+            self._em_andamento += 1
+            return self._epoca
+
+    def liberar(self, epoca, resultado):
+        """Libera a vaga e ajusta o limite conforme o resultado ("sucesso", "throttling" ou outro)."""
+        with self._condicao:
+            self._em_andamento -= 1
+            if resultado == "sucesso":
+                self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            elif resultado == "throttling" and epoca == self._epoca:
+                self.limite = max(self.minimo, self.limite * self.fator_reducao)
+                self._epoca += 1
+                self.reducoes += 1
+            self._condicao.notify_all()
+
+
+class AgendadorEscritas:
+    """
+    Executa escritas no Azure Table Storage dentro do limite adaptativo de concorrência,
+    repetindo as que falham por throttling, timeout ou erro transitório com espera
+    exponencial e jitter (respeitando o Retry-After, quando informado). Entidades
+    existentes e erros permanentes não são repetidos. Seguro para uso entre threads.
+
+    Parâmetros:
+        inicial (int): Limite inicial de escritas simultâneas
+        maximo (int): Limite máximo de escritas simultâneas
+        max_tentativas (int): Número máximo de tentativas por escrita
+        espera_base (float): Espera, em segundos, antes da primeira repetição
+        espera_maxima (float): Espera máxima entre tentativas, em segundos
+    """
+
+    def __init__(self, inicial=8, maximo=32, max_tentativas=7, espera_base=0.5, espera_maxima=30.0):
+        self.controle = ControleConcorrencia(inicial, maximo=maximo)
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._random = random.Random()
+
+    def calcular_espera(self, tentativa, erro=None):
+        """Espera antes da repetição de número tentativa (0, 1, ...): exponencial com jitter."""
+        teto = min(self.espera_maxima, self.espera_base * 2 ** tentativa)
+        # Metade fixa e metade aleatória: espalha as repetições sem voltar imediatamente
+        espera = teto / 2 + self._random.uniform(0, teto / 2)
+        sugerida = espera_sugerida(erro) if erro is not None else None
+        return max(espera, min(sugerida, self.espera_maxima)) if sugerida else espera
+
+    def executar(self, operacao, nome="escrita", max_tentativas=None):
+        """
+        Executa operacao(), repetindo-a conforme a classificação do erro.
+
+        Parâmetros:
+            operacao (callable): Função sem argumentos que faz a requisição
+            nome (str): Nome da operação (rótulo das métricas)
+            max_tentativas (int): Número máximo de tentativas (padrão: o do agendador)
+
+        Retorna:
+            tuple: Resultado da operação e número de requisições feitas
+
+        Lança:
+            FalhaEscrita: Quando a escrita não pôde ser concluída
+        """
+        max_tentativas = max_tentativas or self.max_tentativas
+        tentativa = 0
+        while True:
+            epoca = self.controle.adquirir()
+            try:
+                with metrics.timer("table_request", operation=nome):
+                    resultado = operacao()
+            except Exception as erro:
+                tipo = classificar_erro(erro)
+                self.controle.liberar(epoca, tipo)
+                if tipo == "existente":
+                    raise FalhaEscrita(erro, tipo, tentativa + 1)
+                metrics.increment("table_errors", operation=nome, tipo=tipo)
+                tentativa += 1
+                if tipo == "permanente" or tentativa >= max_tentativas:
+                    raise FalhaEscrita(erro, tipo, tentativa)
+                metrics.increment("table_retries", operation=nome, tipo=tipo)
+                time.sleep(self.calcular_espera(tentativa - 1, erro))
+                continue
+            self.controle.liberar(epoca, "sucesso")
+            return resultado, tentativa + 1
+
+    def resumo(self):
+        """Texto com o limite atual de concorrência e o número de reduções por throttling."""
+        return (
+            f"limite de escritas simultâneas {self.controle.limite:.1f} "
+            f"(máximo {self.controle.maximo}, {self.controle.reducoes} reduções por throttling)"
+        )